@@ -3,7 +3,7 @@ API 模块的入口文件，负责创建和配置 FastAPI 应用。
 
 主要功能：
 1. 创建 FastAPI 应用实例
-2. 配置中间件
+2. 配置中间件（CORS、响应压缩、按需性能分析、HTTP 指标）
 3. 注册路由
 4. 配置全局异常处理
 5. 配置基础路由
@@ -11,14 +11,20 @@ API 模块的入口文件，负责创建和配置 FastAPI 应用。
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, Response
 from fastapi.openapi.docs import get_swagger_ui_html
 from api.core.schemas import ResponseModel
 from api.core.exceptions import APIException
+from api.core.responses import FastJSONResponse
+from api.core.compression import CompressionMiddleware, CompressionStats
+from api.core.metrics import HTTPMetrics, MetricsMiddleware
+from libs.metrics import metrics_registry
 import traceback
+import os
 
 # 导出路由
 from api.api_router import api_router
+from api.api_router.profiling.profiler import ProfilingMiddleware, request_profiler
 
 def create_app() -> FastAPI:
     """
@@ -27,7 +33,8 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="AgileX API",
         description="AgileX 后端 API 服务",
-        version="1.0.0"
+        version="1.0.0",
+        default_response_class=FastJSONResponse  # 默认使用高性能 JSON 响应
     )
     
     # 配置 CORS 中间件
@@ -39,19 +46,35 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # 配置响应压缩中间件（gzip / brotli），小于阈值的响应和图片等已压缩的内容不压缩
+    compression_stats = CompressionStats()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+        stats=compression_stats,
+    )
+    
+    # 按需性能分析：通过 /api/profiling 接口开启后，对指定路由的请求做分析
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+    
+    # HTTP 指标：最后添加即最外层，耗时和响应大小包含其他中间件的处理
+    app.add_middleware(MetricsMiddleware, metrics=HTTPMetrics(metrics_registry), excluded_paths=("/metrics",))
+    
     # 注册路由模块
     app.include_router(api_router, prefix="/api")
     
     # 全局异常处理
     @app.exception_handler(APIException)
     async def api_exception_handler(request: Request, exc: APIException):
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=exc.status_code,
             content=ResponseModel(
                 code=exc.status_code,
                 message=str(exc.detail),
                 data=None
-            ).dict()
+            )
         )
     
     @app.exception_handler(Exception)
@@ -59,13 +82,13 @@ def create_app() -> FastAPI:
         error_detail = traceback.format_exc()
         print(f"Global error: {error_detail}")
         
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=500,
             content=ResponseModel(
                 code=500,
                 message="Internal server error",
                 data=None
-            ).dict()
+            )
         )
     
     # 基础路由配置
@@ -73,6 +96,16 @@ def create_app() -> FastAPI:
     async def root() -> RedirectResponse:
         return RedirectResponse(url="/docs")
     
+    @app.get("/compression-stats", include_in_schema=False)
+    async def get_compression_stats() -> FastJSONResponse:
+        """当前进程的响应压缩统计"""
+        return FastJSONResponse(content=compression_stats.to_dict())
+    
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics() -> Response:
+        """Prometheus 文本格式的指标，多 worker 部署时为所有 worker 的汇总"""
+        return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    
     @app.get("/docs", include_in_schema=False)
     async def custom_docs() -> HTMLResponse:
         return get_swagger_ui_html(
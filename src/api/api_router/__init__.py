@@ -16,12 +16,14 @@ api_router = APIRouter()
 # 导入路由模块
 from api.api_router.tianyi_tasks.api import router as tianyi_tasks_router
 from api.api_router.port_manager.api import router as port_manager_router
+from api.api_router.profiling.api import router as profiling_router
 from api.api_router.example.api import router as example_router
 from api.api_router.example2.api import router as example2_router
 
 # 注册路由
 api_router.include_router(tianyi_tasks_router)
 api_router.include_router(port_manager_router)
+api_router.include_router(profiling_router)
 api_router.include_router(example_router)
 api_router.include_router(example2_router)
 
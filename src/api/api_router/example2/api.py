@@ -2,7 +2,6 @@ from fastapi import APIRouter, HTTPException
 """
 This module provides the API endpoints for support work_orders.
 """
-import json
 import socket
 from typing import Optional
 
@@ -10,6 +9,8 @@ from fastapi import Body, Depends, FastAPI, Query, Response, Path
 from typing import List
 from typing import TypeVar, List, Optional
 
+from api.core import FastJSONResponse
+
 def find_free_port(start_port: int = 8000, max_port: int = 9000) -> Optional[int]:
     """查找指定范围内的空闲端口"""
     for port in range(start_port, max_port + 1):
@@ -44,7 +45,7 @@ class ExampleAPI(APIRouter):
 
         @self.get("/{id}", summary="查找")
         async def get_record_by_id(id: int = Path(..., description="WorkOrder ID")) -> Response:
-            return Response(content=json.dumps(""), media_type="application/json")
+            return FastJSONResponse(content="")
 
         @self.get("/free-port", summary="获取空闲端口")
         async def get_free_port(
@@ -54,9 +55,6 @@ class ExampleAPI(APIRouter):
             port = find_free_port(start_port, max_port)
             if port is None:
                 raise HTTPException(status_code=404, detail="未找到可用端口")
-            return Response(
-                content=json.dumps({"port": port}),
-                media_type="application/json"
-            )
+            return FastJSONResponse(content={"port": port})
 
 router = ExampleAPI()
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+端口分配位图
+
+用位图记录 0-65535 每个端口的分配状态（每个端口 1 位，共 8 KB），
+并维护以 64 个端口为一块的"已满块"索引（1 KB）：
+- 查找空闲端口时直接跳过已满的块，块内按字节、按位定位第一个空闲端口
+- 采用 next-fit 策略，从上次分配位置之后继续查找，顺序分配时均摊 O(1)
+- 支持查找连续的空闲端口段
+- 支持导出任意端口范围的位图，用于批量查询端口状态
+- 位图可以放在外部缓冲区（如内存映射文件）中，供多个进程共享
+"""
+from typing import List, Optional, Tuple
+
+
+class PortBitmap:
+    """
+    端口分配位图
+
+    该类本身不加锁，由调用方在锁内使用。
+    """
+
+    PORT_COUNT: int = 65536  # 端口总数
+    BLOCK_PORTS: int = 64    # 每块端口数
+    BLOCK_BYTES: int = BLOCK_PORTS // 8
+
+    def __init__(self, bits: Optional[memoryview] = None, full_blocks: Optional[memoryview] = None) -> None:
+        """
+        初始化位图
+
+        Args:
+            bits: 存放端口位图的可写缓冲区（8 KB），如果为None则使用进程内存
+            full_blocks: 存放已满块索引的可写缓冲区（1 KB），如果为None则使用进程内存
+        """
+        # 端口位图，1 表示已分配
+        self._bits = bits if bits is not None else bytearray(self.PORT_COUNT // 8)
+        # 块索引，1 表示块内端口全部已分配
+        self._full_blocks = full_blocks if full_blocks is not None else bytearray(self.PORT_COUNT // self.BLOCK_PORTS)
+        self._cursor = 0  # next-fit 游标，下一次查找的起点（每个进程各自维护）
+
+    def __len__(self) -> int:
+        return int.from_bytes(self._bits, "little").bit_count()
+
+    def __contains__(self, port: int) -> bool:
+        return bool(self._bits[port >> 3] & (1 << (port & 7)))
+
+    def add(self, port: int) -> None:
+        """标记端口为已分配"""
+        index, bit = port >> 3, 1 << (port & 7)
+        if self._bits[index] & bit:
+            return
+        self._bits[index] |= bit
+        block = port // self.BLOCK_PORTS
+        start = block * self.BLOCK_BYTES
+        if self._bits[start:start + self.BLOCK_BYTES] == b"\xff" * self.BLOCK_BYTES:
+            self._full_blocks[block] = 1
+
+    def discard(self, port: int) -> None:
+        """释放端口"""
+        index, bit = port >> 3, 1 << (port & 7)
+        if not self._bits[index] & bit:
+            return
+        self._bits[index] &= ~bit
+        self._full_blocks[port // self.BLOCK_PORTS] = 0
+
+    def _find(self, low: int, high: int) -> Optional[int]:
+        """返回 [low, high] 内第一个空闲端口，没有时返回 None"""
+        port = low
+        while port <= high:
+            block = port // self.BLOCK_PORTS
+            if self._full_blocks[block]:
+                # 跳过连续的已满块
+                skip = bytes(self._full_blocks[block:high // self.BLOCK_PORTS + 1]).find(0)
+                if skip < 0:
+                    return None
+                block += skip
+                port = block * self.BLOCK_PORTS
+            end_index = min((block + 1) * self.BLOCK_BYTES, (high >> 3) + 1)
+            index = port >> 3
+            # 起点之前的位视为已分配
+            value = self._bits[index] | ((1 << (port & 7)) - 1)
+            while True:
+                if value != 0xFF:
+                    # 取最低的 0 位
+                    free = index * 8 + (~value & (value + 1)).bit_length() - 1
+                    return free if free <= high else None
+                index += 1
+                if index >= end_index:
+                    break
+                value = self._bits[index]
+            port = index * 8
+        return None
+
+    def next_free(self, low: int, high: int) -> Optional[int]:
+        """
+        按 next-fit 策略查找 [low, high] 内的空闲端口
+
+        从游标位置开始查找，到达 high 后回到 low 继续，找到后游标移到该端口之后。
+
+        Args:
+            low: 起始端口号
+            high: 最大端口号（包含）
+
+        Returns:
+            Optional[int]: 空闲端口号，范围内全部已分配时返回None
+        """
+        start = self._cursor if low <= self._cursor <= high else low
+        port = self._find(start, high)
+        if port is None and start > low:
+            port = self._find(low, start - 1)
+        if port is not None:
+            self._cursor = port + 1
+        return port
+
+    def range_bits(self, low: int, high: int) -> bytearray:
+        """
+        导出 [low, high] 范围的位图
+
+        Args:
+            low: 起始端口号
+            high: 最大端口号（包含）
+
+        Returns:
+            bytearray: 第 i 位（字节内低位在前）对应端口 low + i，1 表示已分配
+        """
+        length = high - low + 1
+        value = int.from_bytes(self._bits[low >> 3:(high >> 3) + 1], "little") >> (low & 7)
+        value &= (1 << length) - 1
+        return bytearray(value.to_bytes((length + 7) // 8, "little"))
+
+    def rewind(self, port: int) -> None:
+        """把 next-fit 游标移回 port，下一次从该端口开始查找"""
+        self._cursor = min(self._cursor, port)
+
+    def _find_used(self, low: int, high: int) -> Optional[int]:
+        """返回 [low, high] 内第一个已分配端口，没有时返回 None"""
+        index, end_index = low >> 3, high >> 3
+        # 起点之前的位视为空闲
+        value = self._bits[index] & ~((1 << (low & 7)) - 1) & 0xFF
+        while True:
+            if value:
+                # 取最低的 1 位
+                used = index * 8 + (value & -value).bit_length() - 1
+                return used if used <= high else None
+            index += 1
+            if index > end_index:
+                return None
+            value = self._bits[index]
+
+    def _find_run(self, low: int, high: int, length: int) -> Optional[int]:
+        """返回 [low, high] 内第一段长度为 length 的连续空闲端口的起点"""
+        start = low
+        while True:
+            port = self._find(start, high)
+            if port is None or port + length - 1 > high:
+                return None
+            used = self._find_used(port, port + length - 1)
+            if used is None:
+                return port
+            # 段内有已分配端口，从它之后继续查找
+            start = used + 1
+
+    def next_free_run(self, low: int, high: int, length: int) -> Optional[int]:
+        """
+        按 next-fit 策略查找 [low, high] 内长度为 length 的连续空闲端口段
+
+        Args:
+            low: 起始端口号
+            high: 最大端口号（包含）
+            length: 端口段长度
+
+        Returns:
+            Optional[int]: 端口段的起点，没有足够长的空闲段时返回None
+        """
+        start = self._cursor if low <= self._cursor <= high else low
+        port = self._find_run(start, high, length)
+        if port is None and start > low:
+            port = self._find_run(low, high, length)
+        if port is not None:
+            self._cursor = port + length
+        return port
+
+
+def free_runs(bits: bytes, base: int, length: int) -> List[Tuple[int, int]]:
+    """
+    把范围位图转换为空闲端口段列表
+
+    Args:
+        bits: range_bits 格式的位图，1 表示不可用
+        base: 位图第 0 位对应的端口号
+        length: 位图覆盖的端口数
+
+    Returns:
+        List[Tuple[int, int]]: 空闲端口段 (起始端口, 结束端口)，均包含在内
+    """
+    runs: List[Tuple[int, int]] = []
+    run_start: Optional[int] = None
+    for index, value in enumerate(bits):
+        offset = index * 8
+        if value == 0 and run_start is not None:
+            continue
+        if value == 0xFF and run_start is None:
+            continue
+        for bit in range(min(8, length - offset)):
+            is_free = not value & (1 << bit)
+            if is_free and run_start is None:
+                run_start = offset + bit
+            elif not is_free and run_start is not None:
+                runs.append((base + run_start, base + offset + bit - 1))
+                run_start = None
+    if run_start is not None:
+        runs.append((base + run_start, base + length - 1))
+    return runs
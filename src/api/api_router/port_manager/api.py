@@ -1,99 +1,297 @@
-from fastapi import APIRouter, HTTPException, Query, Response, Path
+from fastapi import APIRouter, HTTPException, Query, Request, Response, Path
+from fastapi.responses import StreamingResponse
 """
 端口管理模块
 
 提供系统端口管理相关的功能，如：
 - 获取空闲端口
 - 检查端口状态
+- 按端口池（租户）分配端口并限制配额
+- 推送端口可用性变化事件，等待端口释放
 
-该模块实现了线程安全的端口管理，支持自动清理未使用的端口，
+该模块实现了线程安全、多进程安全的端口管理，支持自动清理未使用的端口，
 并提供灵活的端口范围配置。
 """
-import json
+import asyncio
+import base64
 import socket
-import threading
 import time
-from typing import Optional, Dict, Tuple
-from dataclasses import dataclass
+from typing import Any, Dict, Optional, List, Tuple
 from datetime import datetime
 import os
-import subprocess
 
-@dataclass(frozen=True)
-class PortInfo:
-    """
-    端口信息类，记录端口分配时间和使用状态
-    
-    Attributes:
-        port: 端口号
-        allocated_time: 分配时间戳
-        is_used: 是否已被使用
-    """
-    port: int
-    allocated_time: float
-    is_used: bool = False
+from api.core.responses import FastJSONResponse, dumps
+from api.api_router.port_manager.allocator import PortBitmap, free_runs
+from api.api_router.port_manager.events import PortEvent, PortEventHub
+from api.api_router.port_manager.pools import PoolCounters, PortPool, PortQuotaExceededError, load_pools, validate_pools
+from api.api_router.port_manager.socket_table import SocketTable
+from api.api_router.port_manager.state import PortInfo, PortState
 
 class PortManagerAPI(APIRouter):
     """
     端口管理API类
     
     提供端口管理相关的API接口，包括：
-    1. 获取空闲端口
-    2. 检查端口状态
+    1. 获取空闲端口（带租期的租约）
+    2. 续租和释放端口租约
+    3. 检查端口状态
     
     特点：
     - 线程安全：使用锁机制确保多线程环境下的安全
+    - 多进程共享：分配状态保存在内存映射文件中，同一台机器上的多个 worker 共享且重启后保留
     - 端口追踪：维护已使用端口集合，避免重复分配
+    - 快速分配：端口位图 + next-fit 游标，查找候选端口均摊 O(1)
+    - 并发探测：异步接口并发探测候选端口，锁只在预留和登记时持有
     - 灵活配置：支持默认范围和自定义范围
-    - 自动清理：定期清理未使用的超时端口
+    - 端口池：按租户划分互不重叠的端口池，各自有配额、默认租期和分配游标
+    - 事件推送：端口变为可用时推送事件，客户端无需轮询
+    - 自动清理：按到期时间最小堆回收过期租约，每个过期租约 O(log n)
     """
     
     # 默认端口范围配置
     DEFAULT_START_PORT: int = 10000  # 默认起始端口
     DEFAULT_MAX_PORT: int = 65000   # 默认最大端口
-    CLEANUP_INTERVAL: int = 60      # 清理间隔（秒）
+    CLEANUP_INTERVAL: int = 60      # 被外部占用端口的重新探测间隔（秒）
+    DEFAULT_LEASE_TTL: float = 300  # 默认租期（秒）
+    MAX_LEASE_TTL: float = 86400    # 最长租期（秒）
+    PROBE_TIMEOUT: float = 0.1      # 探测连接超时（秒）
+    PROBE_CONCURRENCY: int = 32     # 单次请求最多同时探测的端口数
+    MAX_ALLOCATE_COUNT: int = 1024  # 批量分配的最大端口数
+    RESERVATION_TTL: float = 30     # 候选端口预留时长（秒），进程在探测中退出时到期回收
+    DEFAULT_POOL: str = "default"   # 未指定端口池时使用的端口池
+    EVENT_SNAPSHOT_INTERVAL: float = 1.0  # 有订阅者时端口可用性快照的间隔（秒）
+    EVENT_HEARTBEAT_INTERVAL: float = 15  # 事件流心跳间隔（秒）
+    MAX_WAIT_SECONDS: float = 300   # 等待端口的最长时间（秒）
     
-    def __init__(self) -> None:
+    def __init__(self, state_path: Optional[str] = None, pools: Optional[List[PortPool]] = None) -> None:
         """
         初始化端口管理API
         
-        设置路由前缀和标签，并初始化路由
+        设置路由前缀和标签，打开共享分配状态，并初始化路由
+        
+        Args:
+            state_path: 分配状态文件路径，如果为None则使用环境变量 PORT_MANAGER_STATE_PATH
+                或默认路径 data/port_manager.state
+            pools: 端口池配置，如果为None则读取环境变量 PORT_MANAGER_POOLS；
+                未配置端口池时使用覆盖默认端口范围的 default 端口池
         """
         super().__init__(
             prefix="/port-manager",  # API路由前缀
             tags=["port_manager"],   # API文档标签
         )
-        # 线程安全相关
-        self._lock: threading.Lock = threading.Lock()   # 线程锁，用于同步
-        self._used_ports: Dict[int, PortInfo] = {}     # 已使用端口信息字典
-        self._last_cleanup: float = 0                  # 上次清理时间
+        path = state_path or os.getenv("PORT_MANAGER_STATE_PATH") or "data/port_manager.state"
+        # 共享分配状态：端口位图、端口记录和到期时间堆
+        self._state: PortState = PortState(path)
+        # 线程锁 + 文件锁，用于跨线程、跨进程同步
+        self._lock = self._state.lock
+        self._port_bitmap = self._state.bitmap         # 已记录端口位图
+        self._socket_table: SocketTable = SocketTable() # 系统套接字表（短时缓存）
+        
+        # 端口池配置
+        if pools is None:
+            config = os.getenv("PORT_MANAGER_POOLS")
+            pools = load_pools(config) if config else []
+        validate_pools(pools)
+        # 未配置端口池时，default 端口池即默认端口范围，且允许请求指定池外的端口范围（与旧接口兼容）
+        self._implicit_pool: bool = not pools
+        if self._implicit_pool:
+            pools = [PortPool(self.DEFAULT_POOL, self.DEFAULT_START_PORT, self.DEFAULT_MAX_PORT)]
+        self._pools: Dict[str, PortPool] = {pool.name: pool for pool in pools}
+        # 每个端口池在共享位图上有独立的 next-fit 游标
+        self._pool_bitmaps: Dict[str, PortBitmap] = {pool.name: self._state.new_bitmap() for pool in pools}
+        self._pool_counters: Dict[str, PoolCounters] = {pool.name: PoolCounters() for pool in pools}
+        # 端口可用性事件，由共享状态和套接字表快照驱动
+        self._events: PortEventHub = PortEventHub(self._unavailable_mask, self.EVENT_SNAPSHOT_INTERVAL)
         self.setup_routes()  # 设置路由
     
     def _cleanup_ports(self) -> None:
         """
-        清理超时的未使用端口
+        回收到期的端口
         
-        检查并移除分配超过清理间隔但未使用的端口。
+        从到期时间最小堆中弹出所有已到期的条目（续租和释放已原地更新堆）。
         清理操作在锁的保护下进行，确保线程安全。
         """
         current_time = time.time()
-        # 如果距离上次清理时间未超过清理间隔，则不进行清理
-        if current_time - self._last_cleanup < self.CLEANUP_INTERVAL:
-            return
+        with self._lock:
+            reclaimed = self._state.pop_expired(current_time)
+        if reclaimed:
+            self._events.notify()
+    
+    def _record_port(
+        self,
+        port: int,
+        is_used: bool,
+        ttl: float,
+        now: float,
+        allocated_time: Optional[float] = None,
+    ) -> PortInfo:
+        """
+        记录端口及其到期时间（调用方需持有锁）
+        
+        Args:
+            port: 端口号
+            is_used: 是否为本服务分配的租约
+            ttl: 租期（秒）
+            now: 当前时间戳
+            allocated_time: 分配时间戳（续租时保留原值），如果为None则使用当前时间
+            
+        Returns:
+            PortInfo: 端口信息
+        """
+        info = PortInfo(
+            port=port,
+            allocated_time=allocated_time if allocated_time is not None else now,
+            is_used=is_used,
+            expires_at=now + ttl,
+        )
+        status = PortState.LEASED if is_used else PortState.BUSY
+        self._state.record(port, status, info.allocated_time, info.expires_at)
+        return info
+    
+    def _reserve_port(self, port: int, now: float) -> None:
+        """预留候选端口（调用方需持有锁）"""
+        self._state.record(port, PortState.RESERVED, now, now + self.RESERVATION_TTL)
+    
+    def _validate_ttl(self, ttl: Optional[float], pool: Optional[PortPool] = None) -> float:
+        """
+        验证租期
+        
+        Args:
+            ttl: 租期（秒），如果为None则使用端口池或全局的默认租期
+            pool: 端口池
             
+        Raises:
+            ValueError: 当租期无效时抛出
+        """
+        if ttl is None:
+            if pool is not None and pool.default_ttl is not None:
+                return pool.default_ttl
+            return self.DEFAULT_LEASE_TTL
+        if not 0 < ttl <= self.MAX_LEASE_TTL:
+            raise ValueError(f"租期必须在 0-{self.MAX_LEASE_TTL} 秒之间")
+        return ttl
+    
+    def renew_lease(self, port: int, ttl: Optional[float] = None) -> PortInfo:
+        """
+        续租端口
+        
+        Args:
+            port: 端口号
+            ttl: 新的租期（秒），从当前时间起算，如果为None则使用默认值
+            
+        Returns:
+            PortInfo: 续租后的端口信息
+            
+        Raises:
+            KeyError: 端口没有有效租约时抛出
+            ValueError: 当租期无效时抛出
+        """
+        ttl = self._validate_ttl(ttl, self._pool_of(port))
+        self._cleanup_ports()
         with self._lock:
-            # 更新清理时间
-            self._last_cleanup = current_time
+            info = self._state.get(port)
+            if info is None or not info.is_used:
+                raise KeyError(port)
+            # 续租不改变分配时间
+            return self._record_port(port, True, ttl, time.time(), info.allocated_time)
+    
+    def get_lease(self, port: int) -> Optional[PortInfo]:
+        """
+        查询端口的有效租约
+        
+        Args:
+            port: 端口号
             
-            # 找出需要清理的端口（未使用且超时）
-            ports_to_remove = [
-                port for port, info in self._used_ports.items()
-                if not info.is_used and current_time - info.allocated_time >= self.CLEANUP_INTERVAL
-            ]
+        Returns:
+            Optional[PortInfo]: 端口信息，端口没有有效租约时返回None
+        """
+        self._cleanup_ports()
+        with self._lock:
+            info = self._state.get(port)
+            return info if info is not None and info.is_used else None
+    
+    def release_lease(self, port: int) -> bool:
+        """
+        释放端口租约
+        
+        Args:
+            port: 端口号
             
-            # 移除超时的未使用端口
-            for port in ports_to_remove:
-                del self._used_ports[port]
+        Returns:
+            bool: 是否释放了有效租约
+        """
+        self._cleanup_ports()
+        with self._lock:
+            info = self._state.get(port)
+            if info is None or not info.is_used:
+                return False
+            self._state.remove(port)
+        self._events.notify()
+        return True
+    
+    def _get_pool(self, name: Optional[str]) -> PortPool:
+        """
+        按名称查找端口池
+        
+        Raises:
+            ValueError: 端口池不存在时抛出
+        """
+        pool = self._pools.get(name or self.DEFAULT_POOL)
+        if pool is None:
+            raise ValueError(f"端口池 {name or self.DEFAULT_POOL} 不存在")
+        return pool
+    
+    def _pool_of(self, port: int) -> Optional[PortPool]:
+        """返回端口所属的端口池"""
+        for pool in self._pools.values():
+            if pool.contains(port):
+                return pool
+        return None
+    
+    def _check_quota(self, pool: PortPool, count: int) -> None:
+        """
+        检查端口池是否还能再分配 count 个端口（调用方需持有锁）
+        
+        Raises:
+            PortQuotaExceededError: 配额不足时抛出
+        """
+        if pool.quota is None:
+            return
+        leased = self._state.count(PortState.LEASED, pool.start_port, pool.max_port)
+        if leased + count > pool.quota:
+            self._pool_counters[pool.name].quota_rejections += 1
+            raise PortQuotaExceededError(f"端口池 {pool.name} 配额不足（已用 {leased}/{pool.quota}）")
+    
+    def pool_stats(self) -> List[Dict[str, Any]]:
+        """
+        查询所有端口池的使用情况
+        
+        Returns:
+            List[Dict[str, Any]]: 每个端口池的配置、占用情况（所有进程共享）和分配计数（当前进程）
+        """
+        self._cleanup_ports()
+        stats = []
+        with self._lock:
+            for pool in self._pools.values():
+                leased = self._state.count(PortState.LEASED, pool.start_port, pool.max_port)
+                busy = self._state.count(PortState.BUSY, pool.start_port, pool.max_port)
+                reserved = self._state.count(PortState.RESERVED, pool.start_port, pool.max_port)
+                stats.append({
+                    "name": pool.name,
+                    "start_port": pool.start_port,
+                    "max_port": pool.max_port,
+                    "quota": pool.quota,
+                    "default_ttl": pool.default_ttl if pool.default_ttl is not None else self.DEFAULT_LEASE_TTL,
+                    "capacity": pool.capacity,
+                    "leased": leased,
+                    "busy": busy,
+                    "reserved": reserved,
+                    "free": pool.capacity - leased - busy - reserved,
+                    # 有配额时为配额使用率，否则为端口池使用率
+                    "utilization": leased / (pool.quota or pool.capacity),
+                    **self._pool_counters[pool.name].to_dict(),
+                })
+        return stats
     
     def _validate_port_range(self, start_port: int, max_port: int) -> None:
         """
@@ -123,71 +321,464 @@ class PortManagerAPI(APIRouter):
         """
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.settimeout(0.1)
+                s.settimeout(self.PROBE_TIMEOUT)
                 try:
                     # 尝试连接到端口
                     s.connect(('127.0.0.1', port))
                     return False  # 如果能连接上，说明端口被占用
                 except (socket.timeout, ConnectionRefusedError):
                     # 连接失败说明端口可能可用
-                    try:
-                        # 尝试绑定到所有接口
-                        s.bind(('0.0.0.0', port))
-                        s.close()
-                        return True
-                    except OSError:
-                        # 如果绑定失败，尝试使用 netstat 检查
-                        try:
-                            result = subprocess.run(['netstat', '-tuln'], capture_output=True, text=True)
-                            return str(port) not in result.stdout
-                        except Exception:
-                            return False
+                    pass
+            return self._check_bind(port)
         except Exception:
             return False
     
-    def find_free_port(self, start_port: Optional[int] = None, max_port: Optional[int] = None) -> Optional[int]:
+    async def _probe_port_async(self, port: int) -> bool:
         """
-        查找指定范围内的空闲端口
+        异步探测端口，连接检查不阻塞事件循环
         
         Args:
-            start_port: 起始端口号，如果为None则使用默认值
-            max_port: 最大端口号，如果为None则使用默认值
+            port: 要探测的端口号
             
         Returns:
-            Optional[int]: 找到的空闲端口号，如果未找到则返回None
+            bool: 端口是否可用
+        """
+        try:
+            try:
+                # 尝试连接到端口
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection('127.0.0.1', port), timeout=self.PROBE_TIMEOUT
+                )
+            except (asyncio.TimeoutError, ConnectionRefusedError):
+                # 连接失败说明端口可能可用
+                pass
+            else:
+                writer.close()
+                return False  # 如果能连接上，说明端口被占用
+            # 绑定检查失败时会读取套接字表，放到线程中执行
+            return await asyncio.to_thread(self._check_bind, port)
+        except Exception:
+            return False
+    
+    def _check_bind(self, port: int) -> bool:
+        """
+        尝试绑定到所有接口检查端口是否可用
+        
+        Args:
+            port: 要绑定的端口号
+            
+        Returns:
+            bool: 端口是否可用
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind(('0.0.0.0', port))
+                return True
+            except OSError:
+                # 绑定失败（如权限或地址族问题）时以系统套接字表为准
+                return not self._socket_table.is_listening(port)
+    
+    def _reserve_candidates(self, pool: PortPool, start: int, max_port: int, count: int) -> List[int]:
+        """
+        从位图中预留最多 count 个候选端口
+        
+        预留的端口在探测结束前不会被其他请求选中。套接字表中已被监听的端口
+        直接记录为被外部占用，不作为候选。
+        
+        Args:
+            pool: 端口池
+            start: 起始端口号
+            max_port: 最大端口号
+            count: 预留数量
+            
+        Returns:
+            List[int]: 预留的候选端口，范围内没有未记录的端口时为空
+        """
+        # 一次读取套接字表即可筛掉整个范围内已被监听的端口
+        listening = self._socket_table.listening_ports()
+        with self._lock:
+            candidates: List[int] = []
+            now = time.time()
+            while len(candidates) < count:
+                port = self._pool_bitmaps[pool.name].next_free(start, max_port)
+                if port is None:
+                    break
+                if port in listening:
+                    self._record_port(port, False, self.CLEANUP_INTERVAL, now)
+                    continue
+                self._reserve_port(port, now)
+                candidates.append(port)
+            return candidates
+    
+    def _reserve_run(self, pool: PortPool, start: int, max_port: int, count: int) -> List[int]:
+        """
+        从位图中预留一段长度为 count 的连续候选端口
+        
+        段内有端口出现在套接字表中时，把这些端口记录为被外部占用并继续查找下一段。
+        
+        Args:
+            pool: 端口池
+            start: 起始端口号
+            max_port: 最大端口号
+            count: 端口段长度
+            
+        Returns:
+            List[int]: 预留的连续候选端口，没有足够长的空闲段时为空
+        """
+        listening = self._socket_table.listening_ports()
+        bitmap = self._pool_bitmaps[pool.name]
+        with self._lock:
+            now = time.time()
+            while True:
+                run = bitmap.next_free_run(start, max_port, count)
+                if run is None:
+                    return []
+                ports = list(range(run, run + count))
+                busy = [port for port in ports if port in listening]
+                for port in busy:
+                    self._record_port(port, False, self.CLEANUP_INTERVAL, now)
+                if busy:
+                    # 从最后一个被占用端口之后继续查找，段内其余空闲端口仍可参与下一段
+                    bitmap.rewind(busy[-1] + 1)
+                    continue
+                for port in ports:
+                    self._reserve_port(port, now)
+                return ports
+    
+    def _release_candidates(
+        self,
+        candidates: List[int],
+        pool: Optional[PortPool] = None,
+        rewind_to: Optional[int] = None,
+    ) -> None:
+        """
+        释放未完成探测的预留端口
+        
+        Args:
+            candidates: 预留的端口
+            pool: 端口池，rewind_to 不为None时必须提供
+            rewind_to: 释放后把端口池的查找游标移回该端口，如果为None则不移动
+        """
+        with self._lock:
+            for port in candidates:
+                if self._state.status(port) == PortState.RESERVED:
+                    self._state.remove(port)
+            if pool is not None and rewind_to is not None:
+                self._pool_bitmaps[pool.name].rewind(rewind_to)
+    
+    def _settle_candidates(self, results: List[Tuple[int, bool]], ttl: float, pool: PortPool) -> Optional[int]:
+        """
+        根据探测结果分配端口
+        
+        第一个空闲的候选端口标记为已使用；被其他进程占用的端口标记为未使用，
+        在清理间隔内不再重复探测；其余空闲候选端口释放预留，并把端口池的查找游标移回这些端口。
+        
+        Args:
+            results: (端口号, 是否空闲) 列表，按候选顺序排列
+            ttl: 分配端口的租期（秒）
+            pool: 端口池
+            
+        Returns:
+            Optional[int]: 分配的端口号，全部被占用时返回None
             
         Raises:
-            ValueError: 当端口范围无效时抛出
+            PortQuotaExceededError: 探测期间其他请求用完了端口池配额时抛出
+        """
+        with self._lock:
+            now = time.time()
+            free = []
+            for port, is_free in results:
+                if is_free:
+                    free.append(port)
+                else:
+                    self._record_port(port, False, self.CLEANUP_INTERVAL, now)
+            if not free:
+                return None
+            bitmap = self._pool_bitmaps[pool.name]
+            try:
+                self._check_quota(pool, 1)
+            except PortQuotaExceededError:
+                for port in free:
+                    self._state.remove(port)
+                bitmap.rewind(min(free))
+                raise
+            if len(free) > 1:
+                # 释放多余的空闲候选端口，游标移回第一个释放的端口，下一次分配从这里开始
+                for port in free[1:]:
+                    self._state.remove(port)
+                bitmap.rewind(min(free[1:]))
+            self._record_port(free[0], True, ttl, now)
+            self._pool_counters[pool.name].allocations += 1
+            return free[0]
+    
+    def _record_probes(self, results: List[Tuple[int, bool]]) -> List[int]:
         """
-        # 使用默认值或自定义值
-        start = start_port if start_port is not None else self.DEFAULT_START_PORT
-        max_p = max_port if max_port is not None else self.DEFAULT_MAX_PORT
+        记录探测结果中被外部占用的端口
         
-        # 验证端口范围
+        Args:
+            results: (端口号, 是否空闲) 列表
+            
+        Returns:
+            List[int]: 空闲端口（仍处于预留状态）
+        """
+        with self._lock:
+            now = time.time()
+            for port, is_free in results:
+                if not is_free:
+                    self._record_port(port, False, self.CLEANUP_INTERVAL, now)
+        return [port for port, is_free in results if is_free]
+    
+    async def _probe_ports_async(self, ports: List[int]) -> List[bool]:
+        """并发探测一组端口，最多 PROBE_CONCURRENCY 个同时进行"""
+        semaphore = asyncio.Semaphore(self.PROBE_CONCURRENCY)
+        
+        async def probe(port: int) -> bool:
+            async with semaphore:
+                return await self._probe_port_async(port)
+        
+        return list(await asyncio.gather(*(probe(port) for port in ports)))
+    
+    def _resolve_range(
+        self,
+        start_port: Optional[int],
+        max_port: Optional[int],
+        pool: Optional[str] = None,
+    ) -> Tuple[PortPool, int, int]:
+        """
+        确定端口池，并使用端口池范围补全、验证端口范围
+        
+        Raises:
+            ValueError: 当端口池不存在、端口范围无效或超出端口池范围时抛出
+        """
+        port_pool = self._get_pool(pool)
+        start = start_port if start_port is not None else port_pool.start_port
+        max_p = max_port if max_port is not None else port_pool.max_port
         self._validate_port_range(start, max_p)
+        if not self._implicit_pool and not (port_pool.contains(start) and port_pool.contains(max_p)):
+            raise ValueError(f"端口范围超出端口池 {port_pool.name} 的范围 {port_pool.start_port}-{port_pool.max_port}")
+        return port_pool, start, max_p
+    
+    def _begin_allocation(
+        self,
+        start_port: Optional[int],
+        max_port: Optional[int],
+        ttl: Optional[float],
+        pool: Optional[str],
+        count: int,
+    ) -> Tuple[PortPool, int, int, float]:
+        """
+        分配前的参数验证、过期清理和配额检查
+        
+        Returns:
+            Tuple[PortPool, int, int, float]: (端口池, 起始端口, 最大端口, 租期)
+            
+        Raises:
+            ValueError: 当参数无效时抛出
+            PortQuotaExceededError: 当端口池配额不足时抛出
+        """
+        port_pool, start, max_p = self._resolve_range(start_port, max_port, pool)
+        ttl = self._validate_ttl(ttl, port_pool)
         
         # 清理超时的未使用端口
         self._cleanup_ports()
         
-        # 使用线程锁确保线程安全
+        # 配额不足时不做任何探测
         with self._lock:
-            # 遍历指定范围内的所有端口
-            for port in range(start, max_p + 1):
-                # 检查端口是否已被记录使用
-                if port in self._used_ports:
-                    continue
-                    
-                # 尝试绑定端口
-                if self._try_bind_port(port):
-                    # 将端口添加到已使用集合，记录分配时间
-                    self._used_ports[port] = PortInfo(
-                        port=port,
-                        allocated_time=time.time(),
-                        is_used=True
+            self._check_quota(port_pool, count)
+        return port_pool, start, max_p, ttl
+    
+    def _count_exhausted(self, pool: PortPool) -> None:
+        """记录一次因端口池没有空闲端口而失败的请求"""
+        with self._lock:
+            self._pool_counters[pool.name].exhausted += 1
+    
+    def find_free_port(
+        self,
+        start_port: Optional[int] = None,
+        max_port: Optional[int] = None,
+        ttl: Optional[float] = None,
+        pool: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        查找指定范围内的空闲端口（同步版本，逐个探测）
+        
+        Args:
+            start_port: 起始端口号，如果为None则使用端口池的起始端口
+            max_port: 最大端口号，如果为None则使用端口池的最大端口
+            ttl: 租期（秒），到期未续租的端口会被回收，如果为None则使用端口池的默认租期
+            pool: 端口池名称，如果为None则使用 default 端口池
+            
+        Returns:
+            Optional[int]: 找到的空闲端口号，如果未找到则返回None
+            
+        Raises:
+            ValueError: 当端口池、端口范围或租期无效时抛出
+            PortQuotaExceededError: 当端口池配额不足时抛出
+        """
+        port_pool, start, max_p, ttl = self._begin_allocation(start_port, max_port, ttl, pool, 1)
+        
+        while True:
+            # 只在预留和登记时持有锁，探测期间不持锁
+            candidates = self._reserve_candidates(port_pool, start, max_p, 1)
+            if not candidates:
+                self._count_exhausted(port_pool)
+                return None
+            try:
+                results = [(port, self._try_bind_port(port)) for port in candidates]
+            except BaseException:
+                self._release_candidates(candidates)
+                raise
+            port = self._settle_candidates(results, ttl, port_pool)
+            if port is not None:
+                return port
+    
+    async def find_free_port_async(
+        self,
+        start_port: Optional[int] = None,
+        max_port: Optional[int] = None,
+        ttl: Optional[float] = None,
+        pool: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        查找指定范围内的空闲端口（异步版本，并发探测）
+        
+        第一批只探测一个候选端口，之后每批翻倍，最多 PROBE_CONCURRENCY 个端口同时探测。
+        
+        Args:
+            start_port: 起始端口号，如果为None则使用端口池的起始端口
+            max_port: 最大端口号，如果为None则使用端口池的最大端口
+            ttl: 租期（秒），到期未续租的端口会被回收，如果为None则使用端口池的默认租期
+            pool: 端口池名称，如果为None则使用 default 端口池
+            
+        Returns:
+            Optional[int]: 找到的空闲端口号，如果未找到则返回None
+            
+        Raises:
+            ValueError: 当端口池、端口范围或租期无效时抛出
+            PortQuotaExceededError: 当端口池配额不足时抛出
+        """
+        # 持有文件锁的状态操作都放到线程中执行，不阻塞事件循环
+        port_pool, start, max_p, lease_ttl = await asyncio.to_thread(
+            self._begin_allocation, start_port, max_port, ttl, pool, 1
+        )
+        
+        batch = 1
+        while True:
+            candidates = await asyncio.to_thread(self._reserve_candidates, port_pool, start, max_p, batch)
+            if not candidates:
+                await asyncio.to_thread(self._count_exhausted, port_pool)
+                return None
+            try:
+                probes = await asyncio.gather(*(self._probe_port_async(port) for port in candidates))
+            except BaseException:
+                # 请求被取消时直接释放预留（不再等待），避免端口泄漏
+                self._release_candidates(candidates)
+                raise
+            port = await asyncio.to_thread(
+                self._settle_candidates, list(zip(candidates, probes)), lease_ttl, port_pool
+            )
+            if port is not None:
+                return port
+            batch = min(batch * 2, self.PROBE_CONCURRENCY)
+    
+    async def allocate_ports_async(
+        self,
+        count: int,
+        start_port: Optional[int] = None,
+        max_port: Optional[int] = None,
+        ttl: Optional[float] = None,
+        contiguous: bool = False,
+        pool: Optional[str] = None,
+    ) -> Optional[List[int]]:
+        """
+        批量分配端口
+        
+        全部分配成功或全部不分配：端口先在位图中预留，探测通过的端口继续保留，
+        凑足 count 个后一次性登记为租约；凑不足时释放所有预留。
+        
+        Args:
+            count: 端口数量
+            start_port: 起始端口号，如果为None则使用端口池的起始端口
+            max_port: 最大端口号，如果为None则使用端口池的最大端口
+            ttl: 租期（秒），如果为None则使用端口池的默认租期
+            contiguous: 是否要求分配一段连续的端口
+            pool: 端口池名称，如果为None则使用 default 端口池
+            
+        Returns:
+            Optional[List[int]]: 分配的端口号（升序），端口不足时返回None
+            
+        Raises:
+            ValueError: 当数量、端口池、端口范围或租期无效时抛出
+            PortQuotaExceededError: 当端口池配额不足时抛出
+        """
+        if not 1 <= count <= self.MAX_ALLOCATE_COUNT:
+            raise ValueError(f"端口数量必须在 1-{self.MAX_ALLOCATE_COUNT} 之间")
+        # 持有文件锁的状态操作都放到线程中执行，不阻塞事件循环
+        port_pool, start, max_p, lease_ttl = await asyncio.to_thread(
+            self._begin_allocation, start_port, max_port, ttl, pool, count
+        )
+        
+        held: List[int] = []        # 已确认空闲、仍处于预留状态的端口
+        candidates: List[int] = []  # 正在探测的端口
+        try:
+            while len(held) < count:
+                if contiguous:
+                    candidates = await asyncio.to_thread(self._reserve_run, port_pool, start, max_p, count)
+                else:
+                    candidates = await asyncio.to_thread(
+                        self._reserve_candidates, port_pool, start, max_p, count - len(held)
                     )
-                    return port
-        return None
+                if not candidates:
+                    break
+                probes = await self._probe_ports_async(candidates)
+                free = await asyncio.to_thread(self._record_probes, list(zip(candidates, probes)))
+                reserved, candidates = candidates, []
+                if contiguous and len(free) < count:
+                    # 段内有端口被占用，放弃这一段，从最后一个被占用端口之后重新查找
+                    last_busy = max(set(reserved) - set(free))
+                    await asyncio.to_thread(self._release_candidates, free, port_pool, last_busy + 1)
+                    continue
+                held.extend(free)
+        except BaseException:
+            # 请求被取消时直接释放预留（不再等待），避免端口泄漏
+            self._release_candidates(held + candidates)
+            raise
+        
+        if len(held) < count:
+            if held:
+                await asyncio.to_thread(self._release_candidates, held, port_pool, min(held))
+            await asyncio.to_thread(self._count_exhausted, port_pool)
+            return None
+        
+        await asyncio.to_thread(self._lease_held, held, lease_ttl, port_pool)
+        return sorted(held)
+    
+    def _lease_held(self, held: List[int], ttl: float, pool: PortPool) -> None:
+        """
+        把预留的端口一次性登记为租约
+        
+        Args:
+            held: 已确认空闲、仍处于预留状态的端口
+            ttl: 租期（秒）
+            pool: 端口池
+            
+        Raises:
+            PortQuotaExceededError: 探测期间其他请求用完了端口池配额时抛出（预留会被释放）
+        """
+        with self._lock:
+            try:
+                # 探测期间其他请求可能用掉了配额
+                self._check_quota(pool, len(held))
+            except PortQuotaExceededError:
+                for port in held:
+                    self._state.remove(port)
+                self._pool_bitmaps[pool.name].rewind(min(held))
+                raise
+            now = time.time()
+            for port in held:
+                self._record_port(port, True, ttl, now)
+            self._pool_counters[pool.name].allocations += len(held)
     
     def is_port_available(self, port: int) -> bool:
         """
@@ -199,15 +790,135 @@ class PortManagerAPI(APIRouter):
         Returns:
             bool: 端口是否可用
         """
+        if self._is_port_recorded(port):
+            return False
+        return self._try_bind_port(port)
+    
+    async def is_port_available_async(self, port: int) -> bool:
+        """
+        检查指定端口是否可用（异步版本）
+        
+        Args:
+            port: 要检查的端口号
+            
+        Returns:
+            bool: 端口是否可用
+        """
+        if await asyncio.to_thread(self._is_port_recorded, port):
+            return False
+        return await self._probe_port_async(port)
+    
+    def port_status(
+        self,
+        start_port: Optional[int] = None,
+        max_port: Optional[int] = None,
+        pool: Optional[str] = None,
+    ) -> Tuple[int, int, bytearray]:
+        """
+        查询整个端口范围的可用状态
+        
+        由分配位图和一次套接字表快照计算，不对端口做连接或绑定探测。
+        
+        Args:
+            start_port: 起始端口号，如果为None则使用端口池的起始端口
+            max_port: 最大端口号，如果为None则使用端口池的最大端口
+            pool: 端口池名称，如果为None则使用 default 端口池
+            
+        Returns:
+            Tuple[int, int, bytearray]: (起始端口, 最大端口, 位图)，位图第 i 位（字节内低位在前）
+            对应端口 start + i，1 表示不可用（已分配、被外部占用或正在监听）
+            
+        Raises:
+            ValueError: 当端口池或端口范围无效时抛出
+        """
+        _, start, max_p = self._resolve_range(start_port, max_port, pool)
+        return start, max_p, self._unavailable_bits(start, max_p)
+    
+    def _unavailable_bits(self, start: int, max_port: int) -> bytearray:
+        """由分配位图和套接字表计算 [start, max_port] 的不可用端口位图"""
         # 清理超时的未使用端口
         self._cleanup_ports()
         
-        # 使用线程锁确保线程安全
+        listening = self._socket_table.listening_ports()
         with self._lock:
-            # 检查端口是否已被记录使用
-            if port in self._used_ports:
-                return False
-            return self._try_bind_port(port)
+            bits = self._port_bitmap.range_bits(start, max_port)
+        for port in listening:
+            if start <= port <= max_port:
+                offset = port - start
+                bits[offset >> 3] |= 1 << (offset & 7)
+        return bits
+    
+    def _unavailable_mask(self) -> int:
+        """整个端口空间的不可用端口位掩码，供事件快照使用"""
+        return int.from_bytes(self._unavailable_bits(0, PortState.PORT_COUNT - 1), "little")
+    
+    async def wait_for_free_port_async(
+        self,
+        timeout: float,
+        start_port: Optional[int] = None,
+        max_port: Optional[int] = None,
+        ttl: Optional[float] = None,
+        pool: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        分配空闲端口，没有空闲端口时等待端口释放后重试
+        
+        先订阅可用性事件再尝试分配，分配失败（没有空闲端口或配额不足）后等待范围内出现可用端口的事件，
+        不做轮询探测。
+        
+        Args:
+            timeout: 最长等待时间（秒）
+            start_port: 起始端口号，如果为None则使用端口池的起始端口
+            max_port: 最大端口号，如果为None则使用端口池的最大端口
+            ttl: 租期（秒），如果为None则使用端口池的默认租期
+            pool: 端口池名称，如果为None则使用 default 端口池
+            
+        Returns:
+            Optional[int]: 分配的端口号，超时仍未分配到时返回None
+            
+        Raises:
+            ValueError: 当端口池、端口范围、租期或等待时间无效时抛出
+            PortQuotaExceededError: 当等待超时时端口池配额仍然不足时抛出
+        """
+        if not 0 <= timeout <= self.MAX_WAIT_SECONDS:
+            raise ValueError(f"等待时间必须在 0-{self.MAX_WAIT_SECONDS} 秒之间")
+        _, start, max_p = self._resolve_range(start_port, max_port, pool)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        queue = await self._events.subscribe()
+        try:
+            while True:
+                quota_error: Optional[PortQuotaExceededError] = None
+                try:
+                    port = await self.find_free_port_async(start_port, max_port, ttl, pool)
+                except PortQuotaExceededError as e:
+                    # 配额不足时等待端口池内的租约释放
+                    quota_error, port = e, None
+                if port is not None:
+                    return port
+                # 等待范围内有端口变为可用
+                while True:
+                    remaining = deadline - loop.time()
+                    try:
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        event: PortEvent = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        if quota_error is not None:
+                            raise quota_error
+                        return None
+                    if event.type == "available" and event.clip(start, max_p) is not None:
+                        break
+        finally:
+            self._events.unsubscribe(queue)
+    
+    def _is_port_recorded(self, port: int) -> bool:
+        """端口是否已在分配位图中（租约、正在探测的预留或被外部占用），这些端口不可用，不需要探测"""
+        # 清理超时的未使用端口
+        self._cleanup_ports()
+        
+        with self._lock:
+            return port in self._port_bitmap
     
     def setup_routes(self) -> None:
         """
@@ -215,12 +926,28 @@ class PortManagerAPI(APIRouter):
         
         配置所有API端点，包括：
         1. 获取空闲端口
-        2. 检查端口状态
+        2. 批量分配端口
+        3. 续租和释放端口
+        4. 检查端口状态
+        5. 批量查询端口范围状态
+        6. 查询端口池使用情况
+        7. 端口可用性事件流
         """
+        def lease_content(info: PortInfo) -> Dict[str, Any]:
+            """租约信息的JSON内容"""
+            return {
+                "port": info.port,
+                "allocated_at": datetime.fromtimestamp(info.allocated_time).isoformat(),
+                "expires_at": datetime.fromtimestamp(info.expires_at).isoformat()
+            }
+        
         @self.get("/free-port", summary="获取空闲端口")
         async def get_free_port(
             start_port: Optional[int] = Query(None, description="起始端口号（可选）"),
-            max_port: Optional[int] = Query(None, description="最大端口号（可选）")
+            max_port: Optional[int] = Query(None, description="最大端口号（可选）"),
+            ttl: Optional[float] = Query(None, description="租期（秒，可选），到期未续租的端口会被回收"),
+            pool: Optional[str] = Query(None, description="端口池名称（可选），默认为 default 端口池"),
+            wait: float = Query(0, description="没有空闲端口时等待端口释放的最长时间（秒），默认不等待")
         ) -> Response:
             """
             获取空闲端口的API端点
@@ -228,28 +955,126 @@ class PortManagerAPI(APIRouter):
             Args:
                 start_port: 可选的起始端口号
                 max_port: 可选的最大端口号
+                ttl: 可选的租期
+                pool: 可选的端口池名称
+                wait: 没有空闲端口时的最长等待时间
                 
             Returns:
                 Response: 包含端口号的JSON响应
                 
             Raises:
-                HTTPException: 当未找到可用端口或参数无效时抛出
+                HTTPException: 当未找到可用端口、端口池配额不足或参数无效时抛出
             """
             try:
                 # 查找空闲端口
-                port = self.find_free_port(start_port, max_port)
-                if port is None:
+                if wait > 0:
+                    port = await self.wait_for_free_port_async(wait, start_port, max_port, ttl, pool)
+                else:
+                    port = await self.find_free_port_async(start_port, max_port, ttl, pool)
+                info = await asyncio.to_thread(self.get_lease, port) if port is not None else None
+                if info is None:
                     raise HTTPException(status_code=404, detail="未找到可用端口")
-                # 返回端口号
-                return Response(
-                    content=json.dumps({
-                        "port": port,
-                        "allocated_at": datetime.fromtimestamp(time.time()).isoformat()
-                    }),
-                    media_type="application/json"
-                )
+                # 返回端口号和租约信息
+                return FastJSONResponse(content=lease_content(info))
+            except PortQuotaExceededError as e:
+                raise HTTPException(status_code=429, detail=str(e))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        @self.post("/allocate", summary="批量分配端口")
+        async def allocate_ports(
+            count: int = Query(..., description="端口数量"),
+            contiguous: bool = Query(False, description="是否分配一段连续的端口"),
+            start_port: Optional[int] = Query(None, description="起始端口号（可选）"),
+            max_port: Optional[int] = Query(None, description="最大端口号（可选）"),
+            ttl: Optional[float] = Query(None, description="租期（秒，可选），到期未续租的端口会被回收"),
+            pool: Optional[str] = Query(None, description="端口池名称（可选），默认为 default 端口池")
+        ) -> Response:
+            """
+            批量分配端口的API端点，全部分配成功或全部不分配
+            
+            Args:
+                count: 端口数量
+                contiguous: 是否分配一段连续的端口
+                start_port: 可选的起始端口号
+                max_port: 可选的最大端口号
+                ttl: 可选的租期
+                pool: 可选的端口池名称
+                
+            Returns:
+                Response: 包含端口号列表和租约信息的JSON响应
+                
+            Raises:
+                HTTPException: 当可用端口不足、端口池配额不足或参数无效时抛出
+            """
+            try:
+                ports = await self.allocate_ports_async(count, start_port, max_port, ttl, contiguous, pool)
+            except PortQuotaExceededError as e:
+                raise HTTPException(status_code=429, detail=str(e))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if ports is None:
+                raise HTTPException(status_code=404, detail="可用端口不足")
+            info = await asyncio.to_thread(self.get_lease, ports[0])
+            if info is None:
+                raise HTTPException(status_code=404, detail="可用端口不足")
+            return FastJSONResponse(
+                content={
+                    "ports": ports,
+                    "allocated_at": datetime.fromtimestamp(info.allocated_time).isoformat(),
+                    "expires_at": datetime.fromtimestamp(info.expires_at).isoformat()
+                }
+            )
+        
+        @self.post("/leases/{port}/renew", summary="续租端口")
+        async def renew_lease(
+            port: int = Path(..., description="要续租的端口号"),
+            ttl: Optional[float] = Query(None, description="新的租期（秒，可选），从当前时间起算")
+        ) -> Response:
+            """
+            续租端口的API端点
+            
+            Args:
+                port: 要续租的端口号
+                ttl: 可选的租期
+                
+            Returns:
+                Response: 包含租约信息的JSON响应
+                
+            Raises:
+                HTTPException: 当端口没有有效租约或租期无效时抛出
+            """
+            try:
+                # 状态操作持有文件锁，放到线程中执行，不阻塞事件循环
+                info = await asyncio.to_thread(self.renew_lease, port, ttl)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="端口没有有效租约")
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
+            return FastJSONResponse(content=lease_content(info))
+        
+        @self.delete("/leases/{port}", summary="释放端口")
+        async def release_lease(port: int = Path(..., description="要释放的端口号")) -> Response:
+            """
+            释放端口的API端点
+            
+            Args:
+                port: 要释放的端口号
+                
+            Returns:
+                Response: 包含释放结果的JSON响应
+                
+            Raises:
+                HTTPException: 当端口没有有效租约时抛出
+            """
+            if not await asyncio.to_thread(self.release_lease, port):
+                raise HTTPException(status_code=404, detail="端口没有有效租约")
+            return FastJSONResponse(
+                content={
+                    "port": port,
+                    "released_at": datetime.fromtimestamp(time.time()).isoformat()
+                }
+            )
         
         @self.get("/check-port/{port}", summary="检查端口状态")
         async def check_port(port: int = Path(..., description="要检查的端口号")) -> Response:
@@ -263,16 +1088,123 @@ class PortManagerAPI(APIRouter):
                 Response: 包含端口状态的JSON响应
             """
             # 检查端口是否可用
-            is_available = self.is_port_available(port)
+            is_available = await self.is_port_available_async(port)
             # 返回检查结果
-            return Response(
-                content=json.dumps({
+            return FastJSONResponse(
+                content={
                     "port": port,
                     "available": is_available,
                     "checked_at": datetime.fromtimestamp(time.time()).isoformat()
-                }),
-                media_type="application/json"
+                }
             )
 
+        @self.get("/status", summary="批量查询端口范围状态")
+        async def get_port_status(
+            start: Optional[int] = Query(None, description="起始端口号（可选）"),
+            end: Optional[int] = Query(None, description="最大端口号（可选）"),
+            format: str = Query("bitmap", description="返回格式：bitmap（base64 位图）或 runs（空闲端口段）"),
+            pool: Optional[str] = Query(None, description="端口池名称（可选），默认为 default 端口池")
+        ) -> Response:
+            """
+            批量查询端口范围状态的API端点
+            
+            Args:
+                start: 可选的起始端口号
+                end: 可选的最大端口号
+                format: 返回格式
+                pool: 可选的端口池名称，未指定 start/end 时查询整个端口池
+                
+            Returns:
+                Response: 包含端口范围状态的JSON响应。bitmap 格式中第 i 位（字节内低位在前）
+                对应端口 start + i，1 表示不可用；runs 格式为空闲端口段 [起始端口, 结束端口] 列表
+                
+            Raises:
+                HTTPException: 当参数无效时抛出
+            """
+            if format not in ("bitmap", "runs"):
+                raise HTTPException(status_code=400, detail="format 必须是 bitmap 或 runs")
+            try:
+                start_port, max_port, bits = await asyncio.to_thread(self.port_status, start, end, pool)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            count = max_port - start_port + 1
+            unavailable = int.from_bytes(bits, "little").bit_count()
+            content = {
+                "start": start_port,
+                "end": max_port,
+                "available_count": count - unavailable,
+                "unavailable_count": unavailable,
+                "checked_at": datetime.fromtimestamp(time.time()).isoformat()
+            }
+            if format == "bitmap":
+                content["bitmap"] = base64.b64encode(bytes(bits)).decode("ascii")
+            else:
+                content["free_runs"] = free_runs(bytes(bits), start_port, count)
+            return FastJSONResponse(content=content)
+
+        @self.get("/pools", summary="查询端口池使用情况")
+        async def get_pools() -> Response:
+            """
+            查询端口池使用情况的API端点
+            
+            Returns:
+                Response: 每个端口池的配置、占用数、使用率和分配计数的JSON响应
+            """
+            return FastJSONResponse(
+                content={
+                    "pools": await asyncio.to_thread(self.pool_stats),
+                    "checked_at": datetime.fromtimestamp(time.time()).isoformat()
+                }
+            )
+
+        @self.get("/events", summary="端口可用性事件流")
+        async def port_events(
+            request: Request,
+            start: Optional[int] = Query(None, description="起始端口号（可选）"),
+            end: Optional[int] = Query(None, description="最大端口号（可选）"),
+            pool: Optional[str] = Query(None, description="端口池名称（可选），未指定 start/end 时订阅整个端口池")
+        ) -> StreamingResponse:
+            """
+            端口可用性事件流的API端点（Server-Sent Events）
+            
+            端口变为可用时推送 available 事件，变为不可用时推送 unavailable 事件，
+            事件数据为 JSON：{"type", "runs": [[起始端口, 结束端口], ...], "timestamp"}。
+            
+            Args:
+                request: 请求对象，用于检测客户端断开
+                start: 可选的起始端口号
+                end: 可选的最大端口号
+                pool: 可选的端口池名称
+                
+            Returns:
+                StreamingResponse: text/event-stream 响应
+                
+            Raises:
+                HTTPException: 当参数无效时抛出
+            """
+            try:
+                _, start_port, max_port = self._resolve_range(start, end, pool)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            async def stream():
+                queue = await self._events.subscribe()
+                try:
+                    while not await request.is_disconnected():
+                        try:
+                            event = await asyncio.wait_for(queue.get(), self.EVENT_HEARTBEAT_INTERVAL)
+                        except asyncio.TimeoutError:
+                            # 心跳，避免连接被代理断开
+                            yield ": keepalive\n\n"
+                            continue
+                        clipped = event.clip(start_port, max_port)
+                        if clipped is not None:
+                            yield f"event: {clipped.type}\ndata: {dumps(clipped.to_dict()).decode()}\n\n"
+                finally:
+                    self._events.unsubscribe(queue)
+            
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
 # 创建端口管理API实例
 router = PortManagerAPI() 
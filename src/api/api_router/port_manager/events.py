@@ -0,0 +1,161 @@
+"""
+端口可用性事件
+
+PortEventHub 定期（以及本进程释放、回收端口后立即）对整个端口空间的可用性做一次快照，
+与上一次快照比较，把变为可用 / 不可用的端口段推送给所有订阅者。
+快照来自共享分配状态和系统套接字表，其他 worker 释放的端口、其他进程关闭的监听端口
+同样能被发现，订阅者不需要各自轮询探测端口。
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# 连续的 1（端口段）
+_ONES = re.compile("1+")
+
+
+def mask_runs(mask: int) -> List[Tuple[int, int]]:
+    """
+    把端口位掩码转换为端口段列表
+
+    Args:
+        mask: 第 i 位为 1 表示端口 i 在集合中
+
+    Returns:
+        List[Tuple[int, int]]: 端口段 (起始端口, 结束端口)，均包含在内
+    """
+    if not mask:
+        return []
+    # 转为二进制字符串后由正则引擎（C 实现）逐段匹配连续的 1，
+    # 耗时与位数和端口段数成正比，不会对大整数逐段做移位和掩码运算
+    low = (mask & -mask).bit_length() - 1
+    bits = format(mask >> low, "b")[::-1]  # 第 i 个字符对应端口 low + i
+    return [(low + match.start(), low + match.end() - 1) for match in _ONES.finditer(bits)]
+
+
+@dataclass
+class PortEvent:
+    """
+    端口可用性变化事件
+
+    Attributes:
+        type: available（变为可用）或 unavailable（变为不可用）
+        runs: 发生变化的端口段 (起始端口, 结束端口)
+        timestamp: 事件时间戳
+    """
+    type: str
+    runs: List[Tuple[int, int]]
+    timestamp: float = field(default_factory=time.time)
+
+    def clip(self, start: int, end: int) -> Optional["PortEvent"]:
+        """只保留 [start, end] 内的端口段，没有交集时返回 None"""
+        runs = [(max(s, start), min(e, end)) for s, e in self.runs if s <= end and e >= start]
+        if not runs:
+            return None
+        return PortEvent(type=self.type, runs=runs, timestamp=self.timestamp)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "runs": self.runs, "timestamp": self.timestamp}
+
+
+class PortEventHub:
+    """
+    端口可用性事件分发
+
+    只在有订阅者时运行快照任务，所有订阅者共享同一份快照。
+
+    Attributes:
+        interval: 定期快照间隔（秒）
+        queue_size: 每个订阅者的事件队列长度，队列满时丢弃最早的事件
+    """
+
+    def __init__(self, snapshot: Callable[[], int], interval: float = 1.0, queue_size: int = 100) -> None:
+        """
+        初始化事件分发
+
+        Args:
+            snapshot: 返回不可用端口位掩码（第 i 位为 1 表示端口 i 不可用）的函数
+            interval: 定期快照间隔（秒）
+            queue_size: 每个订阅者的事件队列长度
+        """
+        self._snapshot = snapshot
+        self.interval = interval
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._previous: Optional[int] = None
+
+    async def subscribe(self) -> asyncio.Queue:
+        """
+        订阅事件，必要时启动快照任务
+
+        返回前等待基准快照完成，订阅之后的变化都不会遗漏。
+
+        Returns:
+            asyncio.Queue: 事件队列
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._ready = asyncio.Event()
+            self._previous = None
+            self._task = self._loop.create_task(self._run())
+        assert self._ready is not None
+        await self._ready.wait()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """取消订阅，最后一个订阅者离开后快照任务自动退出"""
+        self._subscribers.discard(queue)
+        self.notify()
+
+    def notify(self) -> None:
+        """端口状态发生变化，立即做一次快照（线程安全）"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    async def _run(self) -> None:
+        """快照任务"""
+        assert self._wakeup is not None and self._ready is not None
+        try:
+            # 基准快照，读取共享状态文件可能阻塞，放到线程中执行
+            self._previous = await asyncio.to_thread(self._snapshot)
+        finally:
+            self._ready.set()
+        while self._subscribers:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._subscribers:
+                await self._publish()
+
+    async def _publish(self) -> None:
+        """比较快照并推送变化"""
+        current = await asyncio.to_thread(self._snapshot)
+        previous, self._previous = self._previous, current
+        if previous is None:
+            return
+        for event_type, mask in (("available", previous & ~current), ("unavailable", current & ~previous)):
+            if not mask:
+                continue
+            event = PortEvent(type=event_type, runs=mask_runs(mask))
+            for queue in list(self._subscribers):
+                if queue.full():
+                    # 慢订阅者丢弃最早的事件
+                    queue.get_nowait()
+                queue.put_nowait(event)
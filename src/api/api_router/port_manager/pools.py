@@ -0,0 +1,120 @@
+"""
+端口池
+
+把端口空间划分为互不重叠的命名端口池，每个端口池有自己的端口范围、配额和默认租期，
+不同租户（如 CI、开发环境）从各自的端口池分配，互不挤占。
+
+端口池在启动时通过环境变量 PORT_MANAGER_POOLS 配置（JSON），例如：
+    {"ci": {"start_port": 20000, "max_port": 29999, "quota": 2000, "default_ttl": 600},
+     "dev": {"start_port": 30000, "max_port": 34999}}
+"""
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+
+class PortQuotaExceededError(Exception):
+    """端口池配额已用完"""
+
+
+@dataclass(frozen=True)
+class PortPool:
+    """
+    端口池配置
+
+    Attributes:
+        name: 端口池名称
+        start_port: 起始端口号
+        max_port: 最大端口号（包含）
+        quota: 同时持有的租约上限，None 表示不限
+        default_ttl: 默认租期（秒），None 表示使用全局默认值
+    """
+    name: str
+    start_port: int
+    max_port: int
+    quota: Optional[int] = None
+    default_ttl: Optional[float] = None
+
+    @property
+    def capacity(self) -> int:
+        """端口池中的端口数"""
+        return self.max_port - self.start_port + 1
+
+    def contains(self, port: int) -> bool:
+        """端口是否属于该端口池"""
+        return self.start_port <= port <= self.max_port
+
+
+@dataclass
+class PoolCounters:
+    """
+    端口池的分配计数（当前进程内）
+
+    Attributes:
+        allocations: 成功分配的端口数
+        exhausted: 因端口池没有空闲端口而失败的请求数
+        quota_rejections: 因配额用完而拒绝的请求数
+    """
+    allocations: int = 0
+    exhausted: int = 0
+    quota_rejections: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "allocations": self.allocations,
+            "exhausted": self.exhausted,
+            "quota_rejections": self.quota_rejections,
+        }
+
+
+def validate_pools(pools: List[PortPool]) -> None:
+    """
+    验证端口池配置
+
+    Raises:
+        ValueError: 端口池名称重复、范围无效或相互重叠时抛出
+    """
+    names = set()
+    for pool in pools:
+        if pool.name in names:
+            raise ValueError(f"端口池 {pool.name} 重复")
+        names.add(pool.name)
+        if not 0 <= pool.start_port <= pool.max_port <= 65535:
+            raise ValueError(f"端口池 {pool.name} 的端口范围无效")
+        if pool.quota is not None and pool.quota < 1:
+            raise ValueError(f"端口池 {pool.name} 的配额必须大于 0")
+    ordered = sorted(pools, key=lambda pool: pool.start_port)
+    for previous, current in zip(ordered, ordered[1:]):
+        if current.start_port <= previous.max_port:
+            raise ValueError(f"端口池 {previous.name} 与 {current.name} 的端口范围重叠")
+
+
+def load_pools(config: str) -> List[PortPool]:
+    """
+    解析 JSON 格式的端口池配置
+
+    Args:
+        config: {名称: {start_port, max_port, quota, default_ttl}} 格式的 JSON 字符串
+
+    Returns:
+        List[PortPool]: 端口池列表
+
+    Raises:
+        ValueError: 配置格式无效时抛出
+    """
+    data: Dict[str, Dict[str, Any]] = json.loads(config)
+    try:
+        pools = [
+            PortPool(
+                name=name,
+                start_port=int(item["start_port"]),
+                max_port=int(item["max_port"]),
+                quota=int(item["quota"]) if item.get("quota") is not None else None,
+                default_ttl=float(item["default_ttl"]) if item.get("default_ttl") is not None else None,
+            )
+            for name, item in data.items()
+        ]
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"端口池配置格式无效: {str(e)}")
+    validate_pools(pools)
+    return pools
@@ -0,0 +1,99 @@
+"""
+系统套接字表
+
+读取 /proc/net/{tcp,tcp6,udp,udp6} 得到本机正在监听（TCP LISTEN）或已绑定（UDP）的端口集合，
+结果缓存一小段时间，供多次端口探测共享：一次文件读取即可筛选整个端口范围，不需要启动子进程。
+没有 /proc 的系统（macOS、Windows）退回解析一次 netstat 的输出。
+"""
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import FrozenSet, Optional, Set
+
+
+class SocketTable:
+    """
+    带缓存的本机套接字表
+
+    Attributes:
+        ttl: 缓存有效期（秒）
+    """
+
+    PROC_FILES = ("/proc/net/tcp", "/proc/net/tcp6", "/proc/net/udp", "/proc/net/udp6")
+    TCP_LISTEN_STATE = "0A"  # /proc/net/tcp 中 LISTEN 状态的编码
+
+    # netstat 输出中本地地址列的端口，如 0.0.0.0:8080、*.8080、[::]:8080
+    _NETSTAT_PORT = re.compile(r"[:.](\d+)$")
+
+    def __init__(self, ttl: float = 1.0) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ports: FrozenSet[int] = frozenset()
+        self._loaded_at: Optional[float] = None
+
+    def listening_ports(self) -> FrozenSet[int]:
+        """返回被占用的端口集合，缓存过期时重新读取"""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.ttl:
+                self._ports = frozenset(self._read())
+                self._loaded_at = now
+            return self._ports
+
+    def is_listening(self, port: int) -> bool:
+        """端口是否被占用"""
+        return port in self.listening_ports()
+
+    def invalidate(self) -> None:
+        """使缓存失效，下次查询时重新读取"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _read(self) -> Set[int]:
+        """读取套接字表"""
+        if os.path.exists(self.PROC_FILES[0]):
+            return self._read_proc()
+        return self._read_netstat()
+
+    def _read_proc(self) -> Set[int]:
+        """解析 /proc/net 下的套接字表"""
+        ports: Set[int] = set()
+        for path in self.PROC_FILES:
+            is_tcp = "tcp" in os.path.basename(path)
+            try:
+                with open(path, "r") as f:
+                    next(f, None)  # 跳过表头
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) < 4:
+                            continue
+                        # TCP 只统计 LISTEN 状态；UDP 没有连接状态，已绑定即占用
+                        if is_tcp and fields[3] != self.TCP_LISTEN_STATE:
+                            continue
+                        ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+            except (OSError, ValueError, IndexError):
+                continue
+        return ports
+
+    def _read_netstat(self) -> Set[int]:
+        """解析 netstat 输出的本地地址列"""
+        ports: Set[int] = set()
+        try:
+            result = subprocess.run(["netstat", "-an"], capture_output=True, text=True)
+        except Exception:
+            return ports
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if len(fields) < 4 or not fields[0].lower().startswith(("tcp", "udp")):
+                continue
+            # TCP 只统计监听状态
+            if fields[0].lower().startswith("tcp") and "LISTEN" not in line.upper():
+                continue
+            # Linux/macOS（协议名小写）的本地地址在第 4 列，Windows（协议名大写）在第 2 列
+            local = fields[1] if fields[0].isupper() else fields[3]
+            match = self._NETSTAT_PORT.search(local)
+            if match:
+                ports.add(int(match.group(1)))
+        return ports
@@ -0,0 +1,338 @@
+"""
+端口分配的共享状态
+
+把端口位图、每个端口的记录（状态、分配时间、到期时间）和到期时间最小堆放在同一个内存映射文件中，
+同一台机器上的多个 worker / 进程打开同一个文件即共享分配状态：
+- 线程锁 + fcntl.flock 文件锁保证跨线程、跨进程互斥，单次分配只需几微秒
+- 状态直接保存在文件中，进程重启后租约仍然有效
+- 没有 fcntl 的系统（Windows）只使用线程锁，此时仅支持单进程
+"""
+import functools
+import mmap
+import os
+import struct
+import threading
+import weakref
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Any, List, Optional
+
+fcntl: Optional[ModuleType]
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl
+    fcntl = None
+
+from api.api_router.port_manager.allocator import PortBitmap
+
+
+@dataclass(frozen=True)
+class PortInfo:
+    """
+    端口信息类，记录端口分配时间和使用状态
+
+    Attributes:
+        port: 端口号
+        allocated_time: 分配时间戳
+        is_used: 是否已被使用（False 表示被其他进程占用，到期后重新探测）
+        expires_at: 租约到期时间戳，到期后端口被回收
+    """
+    port: int
+    allocated_time: float
+    is_used: bool = False
+    expires_at: float = float("inf")
+
+
+class StateLock:
+    """
+    线程锁 + 文件锁
+
+    flock 作用于打开的文件描述，同一进程内的线程共享同一把文件锁，因此先获取线程锁。
+    """
+
+    def __init__(self, fd: int) -> None:
+        self._fd = fd
+        self._thread_lock = threading.Lock()
+
+    def reset(self, fd: int) -> None:
+        """fork 后在子进程中换用新的文件描述符，并重建线程锁"""
+        self._fd = fd
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self) -> "StateLock":
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+
+def _reopen_after_fork(ref: "weakref.ref[PortState]") -> None:
+    state = ref()
+    if state is not None:
+        state._after_fork()
+
+
+class PortState:
+    """
+    基于内存映射文件的端口分配状态
+
+    除 lock 本身外，所有方法都要求调用方持有 lock。
+
+    文件布局（按 8 字节对齐）：
+        头部 | 端口位图 | 已满块索引 | 端口状态 | 分配时间 | 到期时间 | 堆：到期时间 | 堆：端口号 | 端口在堆中的位置
+
+    每个已记录的端口在堆中恰好有一个条目，续租和释放时按位置原地调整，
+    堆中没有过时条目，也就不需要在锁内重建。
+    """
+
+    MAGIC: bytes = b"PORTSTAT"
+    VERSION: int = 2
+
+    # 端口记录状态
+    FREE: int = 0      # 未记录
+    LEASED: int = 1    # 已分配的租约
+    BUSY: int = 2      # 被其他进程占用，到期后重新探测
+    RESERVED: int = 3  # 正在探测的候选端口，进程异常退出时到期回收
+
+    PORT_COUNT: int = PortBitmap.PORT_COUNT
+    HEAP_CAPACITY: int = PORT_COUNT  # 每个端口最多一个条目
+
+    # 头部：魔数、版本、记录数、堆大小
+    _HEADER = struct.Struct("<8sIII")
+
+    def __init__(self, path: str) -> None:
+        """
+        打开（或创建）状态文件
+
+        Args:
+            path: 状态文件路径
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+
+        # 计算各区域的偏移
+        layout = [
+            ("header", 64),
+            ("bits", self.PORT_COUNT // 8),
+            ("full_blocks", self.PORT_COUNT // PortBitmap.BLOCK_PORTS),
+            ("status", self.PORT_COUNT),
+            ("allocated_at", self.PORT_COUNT * 8),
+            ("expires_at", self.PORT_COUNT * 8),
+            ("heap_time", self.HEAP_CAPACITY * 8),
+            ("heap_port", self.HEAP_CAPACITY * 4),
+            ("heap_index", self.PORT_COUNT * 4),
+        ]
+        offsets = {}
+        size = 0
+        for name, length in layout:
+            offsets[name] = (size, size + length)
+            size += (length + 7) // 8 * 8
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.lock = StateLock(self._fd)
+        with self.lock:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            header = os.read(self._fd, self._HEADER.size)
+            if os.fstat(self._fd).st_size != size or header[:12] != self._HEADER.pack(self.MAGIC, self.VERSION, 0, 0)[:12]:
+                # 新文件或格式不兼容时重新初始化
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, self._HEADER.pack(self.MAGIC, self.VERSION, 0, 0))
+        self._mmap = mmap.mmap(self._fd, size)
+
+        view = memoryview(self._mmap)
+        region = lambda name: view[offsets[name][0]:offsets[name][1]]
+        self._header = region("header")
+        self._status = region("status")
+        self._allocated_at = region("allocated_at").cast("d")
+        self._expires_at = region("expires_at").cast("d")
+        self._heap_time = region("heap_time").cast("d")
+        self._heap_port = region("heap_port").cast("I")
+        self._heap_index = region("heap_index").cast("I")
+        self._bits = region("bits")
+        self._full_blocks = region("full_blocks")
+        self.bitmap = PortBitmap(self._bits, self._full_blocks)
+        self._views: "List[memoryview[Any]]" = [view, self._header, self._bits, self._full_blocks, self._status,
+                                                 self._allocated_at, self._expires_at, self._heap_time,
+                                                 self._heap_port, self._heap_index]
+        os.register_at_fork(after_in_child=functools.partial(_reopen_after_fork, weakref.ref(self)))
+
+    def _after_fork(self) -> None:
+        """
+        fork 后在子进程中重新打开状态文件
+
+        flock 作用于打开的文件描述，父子进程共享继承的描述时互不排斥，
+        因此子进程需要自己的文件描述；内存映射（MAP_SHARED）本身可以继续使用。
+        """
+        if self._mmap.closed:
+            return
+        inherited, self._fd = self._fd, os.open(self.path, os.O_RDWR)
+        os.close(inherited)
+        self.lock.reset(self._fd)
+
+    def close(self) -> None:
+        """关闭状态文件"""
+        self.bitmap = PortBitmap()
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+        os.close(self._fd)
+
+    # ------------------------------------------------------------------
+    # 头部字段
+    # ------------------------------------------------------------------
+    def _get_counts(self) -> List[int]:
+        _, _, records, heap_size = self._HEADER.unpack_from(self._header)
+        return [records, heap_size]
+
+    def _set_counts(self, records: int, heap_size: int) -> None:
+        struct.pack_into("<II", self._header, 12, records, heap_size)
+
+    def __len__(self) -> int:
+        """已记录的端口数"""
+        return self._get_counts()[0]
+
+    # ------------------------------------------------------------------
+    # 端口记录
+    # ------------------------------------------------------------------
+    def status(self, port: int) -> int:
+        """端口记录状态"""
+        return self._status[port]
+
+    def new_bitmap(self) -> PortBitmap:
+        """创建共享同一份位图、但有独立 next-fit 游标的 PortBitmap"""
+        return PortBitmap(self._bits, self._full_blocks)
+
+    def count(self, status: int, start: int, end: int) -> int:
+        """统计 [start, end] 内处于 status 状态的端口数"""
+        return bytes(self._status[start:end + 1]).count(status)
+
+    def get(self, port: int) -> Optional[PortInfo]:
+        """返回租约或被外部占用端口的信息，其他状态返回 None"""
+        status = self._status[port]
+        if status not in (self.LEASED, self.BUSY):
+            return None
+        return PortInfo(
+            port=port,
+            allocated_time=self._allocated_at[port],
+            is_used=status == self.LEASED,
+            expires_at=self._expires_at[port],
+        )
+
+    def record(self, port: int, status: int, allocated_time: float, expires_at: float) -> None:
+        """
+        记录端口，并把到期时间加入堆（已记录的端口原地调整堆中的条目）
+
+        Args:
+            port: 端口号
+            status: 记录状态（LEASED / BUSY / RESERVED）
+            allocated_time: 分配时间戳
+            expires_at: 到期时间戳
+        """
+        is_new = self._status[port] == self.FREE
+        if is_new:
+            records, heap_size = self._get_counts()
+            self._set_counts(records + 1, heap_size)
+            self.bitmap.add(port)
+        self._status[port] = status
+        self._allocated_at[port] = allocated_time
+        self._expires_at[port] = expires_at
+        if is_new:
+            self._heap_push(expires_at, port)
+        else:
+            self._heap_update(self._heap_index[port], expires_at, port)
+
+    def remove(self, port: int) -> None:
+        """删除端口记录及其在堆中的条目"""
+        if self._status[port] == self.FREE:
+            return
+        records, heap_size = self._get_counts()
+        self._status[port] = self.FREE
+        self.bitmap.discard(port)
+        self._set_counts(records - 1, heap_size)
+        self._heap_remove(self._heap_index[port])
+
+    def pop_expired(self, now: float) -> int:
+        """
+        回收所有到期的端口
+
+        Args:
+            now: 当前时间戳
+
+        Returns:
+            int: 回收的端口数
+        """
+        removed = 0
+        while True:
+            heap_size = self._get_counts()[1]
+            if heap_size == 0 or self._heap_time[0] > now:
+                return removed
+            self.remove(self._heap_port[0])
+            removed += 1
+
+    # ------------------------------------------------------------------
+    # 到期时间最小堆（数组实现，另记录每个端口在堆中的位置）
+    # ------------------------------------------------------------------
+    def _heap_push(self, expires_at: float, port: int) -> None:
+        records, size = self._get_counts()
+        self._set_counts(records, size + 1)
+        self._sift_up(size, expires_at, port)
+
+    def _heap_remove(self, index: int) -> None:
+        """删除 index 处的条目，用最后一个条目填补"""
+        records, size = self._get_counts()
+        size -= 1
+        self._set_counts(records, size)
+        if index < size:
+            self._heap_update(index, self._heap_time[size], self._heap_port[size])
+
+    def _heap_update(self, index: int, expires_at: float, port: int) -> None:
+        """把 index 处的条目换成 (expires_at, port)，并上浮或下沉到合适位置"""
+        if index > 0 and self._heap_time[(index - 1) >> 1] > expires_at:
+            self._sift_up(index, expires_at, port)
+        else:
+            self._sift_down(index, self._get_counts()[1], expires_at, port)
+
+    def _sift_up(self, index: int, expires_at: float, port: int) -> None:
+        """把 (expires_at, port) 从 index 上浮到合适位置"""
+        times, ports, positions = self._heap_time, self._heap_port, self._heap_index
+        while index > 0:
+            parent = (index - 1) >> 1
+            if times[parent] <= expires_at:
+                break
+            times[index], ports[index] = times[parent], ports[parent]
+            positions[ports[index]] = index
+            index = parent
+        times[index], ports[index] = expires_at, port
+        positions[port] = index
+
+    def _sift_down(self, index: int, size: int, expires_at: float, port: int) -> None:
+        """把 (expires_at, port) 从 index 下沉到合适位置"""
+        times, ports, positions = self._heap_time, self._heap_port, self._heap_index
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and times[child + 1] < times[child]:
+                child += 1
+            if times[child] >= expires_at:
+                break
+            times[index], ports[index] = times[child], ports[child]
+            positions[ports[index]] = index
+            index = child
+        times[index], ports[index] = expires_at, port
+        positions[port] = index
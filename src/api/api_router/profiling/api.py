@@ -0,0 +1,172 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, Path
+"""
+性能分析API模块
+
+提供仅限管理员使用的性能分析接口：
+1. 对指定路由接下来的 N 个请求做 cProfile 或采样分析，结果可下载为 pstats 或折叠栈文件
+2. 用 tracemalloc 对比当前进程的内存分配与基准快照
+
+需要设置环境变量 PROFILING_ADMIN_TOKEN 才会启用，请求头 X-Admin-Token 必须与其一致。
+"""
+import asyncio
+import hmac
+import os
+from typing import Optional
+
+from api.core.responses import FastJSONResponse
+from api.api_router.profiling.profiler import CaptureSession, memory_tracer, request_profiler
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None, description="管理员令牌")) -> None:
+    """
+    校验管理员令牌
+
+    Raises:
+        HTTPException: 未配置 PROFILING_ADMIN_TOKEN 时返回 404，令牌不一致时返回 403
+    """
+    token = os.getenv("PROFILING_ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="性能分析接口未启用")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(status_code=403, detail="管理员令牌无效")
+
+
+class ProfilingAPI(APIRouter):
+    """
+    性能分析API路由类
+    """
+
+    def __init__(self) -> None:
+        """
+        初始化性能分析API路由
+        """
+        super().__init__(
+            prefix="/profiling",  # API路由前缀
+            tags=["profiling"],   # API文档标签
+            dependencies=[Depends(require_admin)],  # 所有接口都需要管理员令牌
+        )
+        self.setup_routes()  # 设置路由
+
+    def setup_routes(self) -> None:
+        """
+        设置API路由
+
+        配置所有API端点，包括：
+        1. 开始、查询、结束请求分析
+        2. 下载 pstats / 折叠栈格式的分析结果
+        3. 开始、对比、停止内存分配跟踪
+        """
+        def get_capture(capture_id: str) -> CaptureSession:
+            try:
+                return request_profiler.get(capture_id)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="分析不存在")
+
+        @self.post("/captures", summary="开始分析请求")
+        async def start_capture(
+            path: str = Query(..., description="要分析的请求路径或路由模板，如 /api/tianyitasks/uploadexcel、/api/port-manager/leases/{port}"),
+            mode: str = Query("cprofile", description="分析方式：cprofile 或 sampling"),
+            requests: int = Query(1, description="要分析的请求数"),
+            interval: float = Query(0.005, description="采样间隔（秒，仅 sampling）")
+        ) -> Response:
+            """
+            对 path 接下来的 requests 个请求做性能分析
+
+            Returns:
+                Response: 分析信息的JSON响应
+
+            Raises:
+                HTTPException: 当参数无效或已有进行中的分析时抛出
+            """
+            try:
+                session = request_profiler.start(path, mode, requests, interval)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return FastJSONResponse(content=session.to_dict())
+
+        @self.get("/captures", summary="查询最近的分析")
+        async def list_captures() -> Response:
+            return FastJSONResponse(content={"captures": [session.to_dict() for session in request_profiler.sessions()]})
+
+        @self.get("/captures/{capture_id}", summary="查询分析状态")
+        async def get_capture_status(capture_id: str = Path(..., description="分析ID")) -> Response:
+            return FastJSONResponse(content=get_capture(capture_id).to_dict())
+
+        @self.delete("/captures/{capture_id}", summary="结束分析")
+        async def stop_capture(capture_id: str = Path(..., description="分析ID")) -> Response:
+            get_capture(capture_id)
+            return FastJSONResponse(content=request_profiler.stop(capture_id).to_dict())
+
+        @self.get("/captures/{capture_id}/pstats", summary="下载 pstats 分析结果")
+        async def download_pstats(capture_id: str = Path(..., description="分析ID")) -> Response:
+            """
+            下载 cProfile 分析结果，可用 python -m pstats 或 snakeviz 打开
+
+            Raises:
+                HTTPException: 当分析不存在、未结束或不是 cprofile 模式时抛出
+            """
+            session = get_capture(capture_id)
+            try:
+                content = request_profiler.pstats_bytes(session)
+            except ValueError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            return Response(
+                content=content,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="capture-{session.id}.pstats"'}
+            )
+
+        @self.get("/captures/{capture_id}/collapsed", summary="下载折叠栈采样结果")
+        async def download_collapsed(capture_id: str = Path(..., description="分析ID")) -> Response:
+            """
+            下载采样分析结果（折叠栈格式），可用 flamegraph.pl 或 speedscope 生成火焰图
+
+            Raises:
+                HTTPException: 当分析不存在或不是 sampling 模式时抛出
+            """
+            session = get_capture(capture_id)
+            try:
+                content = request_profiler.collapsed(session)
+            except ValueError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            return Response(
+                content=content,
+                media_type="text/plain",
+                headers={"Content-Disposition": f'attachment; filename="capture-{session.id}.collapsed"'}
+            )
+
+        @self.post("/tracemalloc/start", summary="开始跟踪内存分配")
+        async def start_tracemalloc(frames: int = Query(10, description="每个分配记录的调用栈深度")) -> Response:
+            """
+            开始跟踪内存分配并记录基准快照，已在跟踪时只更新基准快照（快照在线程池中获取，不阻塞事件循环）
+
+            Raises:
+                HTTPException: 当参数无效时抛出
+            """
+            try:
+                return FastJSONResponse(content=await asyncio.to_thread(memory_tracer.start, frames))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @self.get("/tracemalloc/diff", summary="对比内存分配")
+        async def diff_tracemalloc(
+            limit: int = Query(20, description="返回增长最多的前 limit 项"),
+            key_type: str = Query("lineno", description="分组方式：lineno、filename 或 traceback")
+        ) -> Response:
+            """
+            对比当前快照与基准快照
+
+            Raises:
+                HTTPException: 当未开始跟踪或参数无效时抛出
+            """
+            try:
+                return FastJSONResponse(content=await asyncio.to_thread(memory_tracer.diff, limit, key_type))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @self.post("/tracemalloc/stop", summary="停止跟踪内存分配")
+        async def stop_tracemalloc() -> Response:
+            return FastJSONResponse(content=memory_tracer.stop())
+
+# 创建性能分析API实例
+router = ProfilingAPI()
@@ -0,0 +1,422 @@
+"""
+请求性能分析
+
+按需对指定路由接下来的 N 个请求做性能分析，不需要重新部署：
+- cprofile: 用 cProfile 记录请求期间的函数调用，结果可导出为 pstats 文件
+- sampling: 后台线程定期采样所有线程的调用栈，结果可导出为折叠栈（collapsed stack）文件，
+  可直接用 flamegraph.pl / speedscope 生成火焰图
+分析目标可以是完整路径，也可以是路由模板（如 /api/port-manager/leases/{port}），模板匹配该路由的所有请求。
+同一时间只分析一个请求，分析期间到达的其他匹配请求照常处理、不计入分析。
+cProfile 只记录事件循环线程：异步路由在事件循环线程中执行，同一时间段内其他协程的开销也会被计入；
+同步路由（def）在线程池中执行，cProfile 记录不到，cprofile 模式下这些请求改为同时采样所有线程，
+结果同样可以导出为折叠栈。
+
+MemoryTracer 用 tracemalloc 对比当前进程的内存分配与基准快照的差异。
+
+分析状态保存在当前进程内，多 worker 部署时只对收到请求的 worker 生效。
+"""
+import asyncio
+import cProfile
+import marshal
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from starlette.routing import Match
+
+
+@dataclass
+class CaptureSession:
+    """
+    一次性能分析
+
+    Attributes:
+        id: 分析ID
+        path: 要分析的请求路径（完整路径，如 /api/tianyitasks/uploadexcel）或路由模板
+        mode: cprofile 或 sampling
+        requests: 要分析的请求数
+        interval: 采样间隔（秒，仅 sampling）
+        captured: 已分析的请求数
+        request_seconds: 已分析请求的耗时（秒）
+        created_at: 创建时间戳
+        finished_at: 结束时间戳，未结束时为 None
+    """
+    id: str
+    path: str
+    mode: str
+    requests: int
+    interval: float
+    captured: int = 0
+    request_seconds: List[float] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    profile: Optional[cProfile.Profile] = field(default=None, repr=False)
+    stats: Optional[Dict[Any, Any]] = field(default=None, repr=False)
+    stacks: Counter = field(default_factory=Counter, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "path": self.path,
+            "mode": self.mode,
+            "requests": self.requests,
+            "interval": self.interval,
+            "captured": self.captured,
+            "request_seconds": self.request_seconds,
+            "samples": sum(self.stacks.values()),
+            "status": "finished" if self.finished else "running",
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def resolve_route(scope: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+    """
+    请求对应的路由模板，以及端点是否为同步函数
+
+    在请求处理前按应用的路由表匹配（与路由器的匹配规则相同）。
+
+    Returns:
+        Tuple[Optional[str], bool]: (路由模板, 是否在线程池中执行)，没有匹配的路由时为 (None, False)
+    """
+    for route in getattr(scope.get("app"), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            endpoint = getattr(route, "endpoint", None)
+            threaded = endpoint is not None and not asyncio.iscoroutinefunction(endpoint)
+            return getattr(route, "path_format", route.path), threaded
+    return None, False
+
+
+def _frame_name(frame: Any) -> str:
+    """折叠栈中的一帧：函数名 (文件:行号)，去掉折叠栈格式中的分隔符"""
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class RequestProfiler:
+    """
+    请求性能分析管理
+
+    由 ProfilingMiddleware 在请求进入时调用 profile_request，由管理接口创建和查询分析。
+    """
+
+    MODES = ("cprofile", "sampling")
+    HISTORY_SIZE = 10  # 保留最近的分析结果数
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._active: Optional[CaptureSession] = None
+        self._busy = False  # 正在分析一个请求
+        self._history: Deque[CaptureSession] = deque(maxlen=self.HISTORY_SIZE)
+        self._sampler: Optional[threading.Thread] = None
+        self._sampling = threading.Event()  # 采样线程只在分析请求期间采样
+        self._stop_sampler = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        """是否有进行中的分析"""
+        return self._active is not None
+
+    def start(self, path: str, mode: str, requests: int, interval: float = 0.005) -> CaptureSession:
+        """
+        开始分析 path 的接下来 requests 个请求
+
+        Args:
+            path: 请求路径或路由模板
+            mode: cprofile 或 sampling
+            requests: 要分析的请求数
+            interval: 采样间隔（秒，仅 sampling）
+
+        Returns:
+            CaptureSession: 新建的分析
+
+        Raises:
+            ValueError: 当参数无效或已有进行中的分析时抛出
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode 必须是 {' 或 '.join(self.MODES)}")
+        if requests < 1:
+            raise ValueError("requests 必须大于 0")
+        if not 0.001 <= interval <= 1:
+            raise ValueError("interval 必须在 0.001 到 1 秒之间")
+        with self._lock:
+            if self._active is not None:
+                raise ValueError(f"已有进行中的分析 {self._active.id}")
+            session = CaptureSession(id=uuid.uuid4().hex[:12], path=path, mode=mode, requests=requests, interval=interval)
+            if mode == "cprofile":
+                session.profile = cProfile.Profile()
+            else:
+                self._start_sampler(session)
+            self._active = session
+            self._history.append(session)
+        return session
+
+    def stop(self, session_id: str) -> CaptureSession:
+        """
+        提前结束分析，已分析的请求结果保留
+
+        Raises:
+            KeyError: 当分析不存在时抛出
+        """
+        session = self.get(session_id)
+        with self._lock:
+            if self._active is session and not self._busy:
+                self._finish(session)
+            elif self._active is session:
+                # 正在分析的请求结束后再结束
+                session.requests = session.captured + 1
+        return session
+
+    def get(self, session_id: str) -> CaptureSession:
+        """
+        Raises:
+            KeyError: 当分析不存在时抛出
+        """
+        for session in self._history:
+            if session.id == session_id:
+                return session
+        raise KeyError(session_id)
+
+    def sessions(self) -> List[CaptureSession]:
+        return list(self._history)
+
+    async def profile_request(
+        self,
+        path: str,
+        call: Callable[[], Awaitable[None]],
+        route: Optional[str] = None,
+        threaded: bool = False,
+    ) -> None:
+        """
+        处理一个请求，路径或路由模板匹配进行中的分析时对其做性能分析
+
+        Args:
+            path: 请求路径
+            call: 处理请求的协程函数
+            route: 请求匹配的路由模板，没有匹配的路由时为None
+            threaded: 端点是否在线程池中执行（同步路由），cprofile 模式下这类请求同时采样所有线程
+        """
+        if self._active is None:
+            # 没有进行中的分析，直接处理
+            await call()
+            return
+        with self._lock:
+            session: Optional[CaptureSession] = self._active
+            if session is None or session.path not in (path, route) or self._busy:
+                session = None
+            else:
+                self._busy = True
+                if threaded and self._sampler is None:
+                    self._start_sampler(session)
+        if session is None:
+            await call()
+            return
+
+        started = time.perf_counter()
+        try:
+            if session.profile is not None:
+                try:
+                    session.profile.enable()
+                except ValueError:
+                    # 已有其他分析工具在运行
+                    session.profile = None
+            if session.profile is None or threaded:
+                self._sampling.set()
+            try:
+                await call()
+            finally:
+                if session.profile is not None:
+                    session.profile.disable()
+                self._sampling.clear()
+        finally:
+            with self._lock:
+                self._busy = False
+                session.captured += 1
+                session.request_seconds.append(time.perf_counter() - started)
+                if session.captured >= session.requests:
+                    self._finish(session)
+
+    def _finish(self, session: CaptureSession) -> None:
+        """结束分析（调用方需持有锁）"""
+        if session.profile is not None:
+            session.profile.create_stats()
+            session.stats = session.profile.stats
+            session.profile = None
+        if self._sampler is not None:
+            self._stop_sampler.set()
+            self._sampler = None
+        session.finished_at = time.time()
+        self._active = None
+
+    def _start_sampler(self, session: CaptureSession) -> None:
+        """启动采样线程（调用方需持有锁）"""
+        self._stop_sampler = stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample_loop, args=(session, stop), name="request-profiler-sampler", daemon=True
+        )
+        self._sampler.start()
+
+    def _sample_loop(self, session: CaptureSession, stop: threading.Event) -> None:
+        """定期采样所有线程的调用栈，以线程名作为栈底"""
+        own = threading.get_ident()
+        while not stop.is_set():
+            if not self._sampling.wait(0.1):
+                continue
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, top in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                frame: Optional[FrameType] = top
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(";", ":"))
+                session.stacks[";".join(reversed(stack))] += 1
+            time.sleep(session.interval)
+
+    def pstats_bytes(self, session: CaptureSession) -> bytes:
+        """
+        pstats 格式的分析结果，可用 pstats.Stats(文件) / snakeviz 打开
+
+        Raises:
+            ValueError: 当分析未结束或不是 cprofile 模式时抛出
+        """
+        if session.mode != "cprofile":
+            raise ValueError("只有 cprofile 模式的分析可以导出 pstats")
+        if not session.finished:
+            raise ValueError("分析尚未结束")
+        if session.stats is None:
+            raise ValueError("没有分析结果（cProfile 未能启动）")
+        return marshal.dumps(session.stats)
+
+    def collapsed(self, session: CaptureSession) -> str:
+        """
+        折叠栈格式的采样结果，每行为 "栈底;...;栈顶 次数"
+
+        Raises:
+            ValueError: 当不是 sampling 模式、也没有采样过同步路由的请求时抛出
+        """
+        if session.mode != "sampling" and not session.stacks:
+            raise ValueError("只有 sampling 模式或分析过同步路由请求的分析可以导出折叠栈")
+        return "".join(f"{stack} {count}\n" for stack, count in session.stacks.most_common())
+
+
+class MemoryTracer:
+    """
+    tracemalloc 内存分配对比
+
+    start 时记录基准快照，diff 返回当前快照相对基准增长最多的分配位置。
+    """
+
+    KEY_TYPES = ("lineno", "filename", "traceback")
+
+    def __init__(self) -> None:
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_at: Optional[float] = None
+
+    def start(self, frames: int = 10) -> Dict[str, Any]:
+        """
+        开始跟踪内存分配并记录基准快照，已在跟踪时只更新基准快照
+
+        Raises:
+            ValueError: 当 frames 无效时抛出
+        """
+        if not 1 <= frames <= 100:
+            raise ValueError("frames 必须在 1 到 100 之间")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = self._snapshot()
+        self._started_at = time.time()
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        """停止跟踪并丢弃基准快照"""
+        tracemalloc.stop()
+        self._baseline = None
+        self._started_at = None
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "started_at": self._started_at,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+        }
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        """当前快照，排除 tracemalloc 自身和导入机制的分配"""
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def diff(self, limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+        """
+        对比当前快照与基准快照
+
+        Args:
+            limit: 返回增长最多的前 limit 项
+            key_type: 分组方式，lineno / filename / traceback
+
+        Returns:
+            Dict[str, Any]: 跟踪状态和差异列表
+
+        Raises:
+            ValueError: 当未开始跟踪或参数无效时抛出
+        """
+        if key_type not in self.KEY_TYPES:
+            raise ValueError(f"key_type 必须是 {' / '.join(self.KEY_TYPES)}")
+        if self._baseline is None or not tracemalloc.is_tracing():
+            raise ValueError("尚未开始跟踪内存分配")
+        stats = self._snapshot().compare_to(self._baseline, key_type)
+        return {
+            **self.status(),
+            "top": [
+                {
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                    "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+
+class ProfilingMiddleware:
+    """把请求交给 RequestProfiler，路径或路由模板匹配进行中的分析时做性能分析"""
+
+    def __init__(self, app: Any, profiler: RequestProfiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not self.profiler.active:
+            await self.app(scope, receive, send)
+            return
+        route, threaded = resolve_route(scope)
+        await self.profiler.profile_request(scope["path"], lambda: self.app(scope, receive, send), route, threaded)
+
+
+# 当前进程的分析管理
+request_profiler = RequestProfiler()
+memory_tracer = MemoryTracer()
@@ -1,15 +1,46 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, Header, HTTPException, UploadFile, File, Path
+import asyncio
+import base64
+import binascii
+import hmac
+import os
+import uuid
 import pandas as pd
-from typing import List
+from typing import List, Optional
 
-from api.api_router.tianyi_tasks.utils import fix_tasks
+from api.api_router.tianyi_tasks.schemas import RobotTaskItem
+from api.api_router.tianyi_tasks.utils import dispatcher, fix_tasks, get_dispatcher
+from libs.dispatcher import DispatchQueueFullError, DispatchRejectedError
 from models.wechat_robot_tasks.api.main_api2 import tianyi_get_wx_tasks
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask, RobotTaskType
+
+# 代理模式下接收的文件保存目录
+AGENT_FILE_DIR = os.getenv("ROBOT_AGENT_FILE_DIR", "data/agent_files")
 
 router = APIRouter(
     prefix="/tianyitasks",
     tags=["tianyiapi"],
 )
 
+def require_dispatcher():
+    """获取任务分发器，未启用时返回 503"""
+    try:
+        return get_dispatcher()
+    except DispatchRejectedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.on_event("startup")
+def start_dispatcher():
+    """启动分发器，并从任务日志恢复上次未发送完的任务"""
+    if dispatcher is not None:
+        dispatcher.start()
+
+@router.on_event("shutdown")
+def stop_dispatcher():
+    """停止分发器并关闭任务日志"""
+    if dispatcher is not None:
+        dispatcher.close(timeout=10)
+
 @router.post("/uploadexcel")
 async def upload_excel(file1: UploadFile = File(...), file2: UploadFile = File(...)):
     try:
@@ -19,13 +50,118 @@ async def upload_excel(file1: UploadFile = File(...), file2: UploadFile = File(.
         df2 = pd.read_excel(file2.file)
         
         tasks = tianyi_get_wx_tasks(df1, df2)
-        fix_tasks(tasks)
+        # 任务交给后台分发器发送，这里只负责入队（去重查询日志、等待队列空间都可能阻塞，放到线程中执行）
+        submitted = await asyncio.to_thread(fix_tasks, tasks)
         # 示例：将两个文件的行数返回
         result = {
             "file1_rows": len(df1),
             "file2_rows": len(df2),
+            "task_ids": submitted.task_ids,
+            "deduplicated": submitted.deduplicated,
         }
         return {"message": "Files processed successfully", "result": result}
+    except (DispatchQueueFullError, DispatchRejectedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing files: {str(e)}")
 
+def require_agent_token(x_agent_token: Optional[str] = Header(None, description="代理令牌")) -> None:
+    """
+    校验代理令牌
+    
+    Raises:
+        HTTPException: 未配置 ROBOT_AGENT_TOKEN 时返回 404，令牌不一致时返回 403
+    """
+    token = os.getenv("ROBOT_AGENT_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="代理接口未启用")
+    if x_agent_token is None or not hmac.compare_digest(x_agent_token.encode(), token.encode()):
+        raise HTTPException(status_code=403, detail="代理令牌无效")
+
+def remove_files(paths: List[str]) -> None:
+    """删除代理模式下写入但不再需要的文件"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@router.post("/tasks", dependencies=[Depends(require_agent_token)])
+async def submit_tasks(items: List[RobotTaskItem]):
+    """直接提交机器人任务（供其他实例以代理方式调用，需要请求头 X-Agent-Token）
+    
+    文件任务必须通过 file_base64 携带文件内容，保存到本机后再入队，不接受本机文件路径。
+    带 idempotency_key 的任务与已有任务重复时不会重新入队，返回已有任务的ID并列在 deduplicated 中。
+    """
+    # 先校验并解码所有文件，全部通过后再写入磁盘
+    decoded: List[Optional[bytes]] = []
+    for i, item in enumerate(items):
+        is_file = item.task_type != RobotTaskType.TEXT_TYPE.value
+        if is_file and item.file_base64 is None:
+            raise HTTPException(status_code=422, detail=f"第 {i} 个任务是文件任务，必须提供 file_base64")
+        if not is_file and item.file_base64 is not None:
+            raise HTTPException(status_code=422, detail=f"第 {i} 个任务是文本任务，不能携带 file_base64")
+        if item.file_base64 is None:
+            decoded.append(None)
+            continue
+        try:
+            decoded.append(base64.b64decode(item.file_base64, validate=True))
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=422, detail=f"第 {i} 个任务的 file_base64 不是有效的 base64")
+
+    tasks = []
+    written: List[str] = []
+    try:
+        for item, data in zip(items, decoded):
+            content = item.content
+            if data is not None:
+                os.makedirs(AGENT_FILE_DIR, exist_ok=True)
+                file_name = os.path.basename(item.file_name or "file")
+                content = os.path.join(AGENT_FILE_DIR, f"{uuid.uuid4().hex}_{file_name}")
+                written.append(content)
+                with open(content, "wb") as f:
+                    f.write(data)
+            tasks.append(RobotTask(
+                to_user=item.to_user, content=content, task_type=item.task_type, idempotency_key=item.idempotency_key
+            ))
+        submitted = await asyncio.to_thread(fix_tasks, tasks)
+    except BaseException as e:
+        # 入队失败时删除已写入的文件
+        remove_files(written)
+        if isinstance(e, (DispatchQueueFullError, DispatchRejectedError)):
+            raise HTTPException(status_code=503, detail=str(e))
+        raise
+    # 重复的任务没有入队，删除为它们写入的文件；同一批内互相重复时保留实际入队任务的文件
+    duplicates = set(submitted.deduplicated)
+    unused = []
+    for task, task_id in zip(tasks, submitted.task_ids):
+        if task_id in duplicates and task.content in written:
+            record = get_dispatcher().get(task_id)
+            if record is None or record.task.content != task.content:
+                unused.append(task.content)
+    remove_files(unused)
+    return {"task_ids": submitted.task_ids, "deduplicated": submitted.deduplicated}
+
+@router.get("/tasks")
+async def get_dispatch_stats():
+    """获取任务分发队列的统计信息"""
+    return require_dispatcher().stats()
+
+@router.get("/tasks/{task_id}")
+async def get_task_status(task_id: str = Path(..., description="任务ID")):
+    """查询任务的发送状态"""
+    record = require_dispatcher().get(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return record.to_dict()
+
+@router.delete("/tasks/{task_id}")
+async def cancel_task(task_id: str = Path(..., description="任务ID")):
+    """取消尚未发送的任务"""
+    task_dispatcher = require_dispatcher()
+    record = task_dispatcher.get(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not task_dispatcher.cancel(task_id):
+        raise HTTPException(status_code=409, detail="任务正在发送或已结束，无法取消")
+    return record.to_dict()
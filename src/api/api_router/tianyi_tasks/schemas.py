@@ -0,0 +1,26 @@
+"""
+天翼任务模块的请求/响应模型
+"""
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class RobotTaskItem(BaseModel):
+    """
+    直接提交的机器人任务
+    
+    Attributes:
+        to_user: 接收消息的用户或群组名称
+        content: 文本内容或文件路径
+        task_type: 任务类型，0 文本，1 图片
+        file_name: 随请求上传的文件名
+        file_base64: 随请求上传的文件内容（base64），设置后忽略 content
+        idempotency_key: 幂等键（可选），同一幂等键的任务只发送一次，重复提交返回原任务ID
+    """
+    to_user: str
+    content: str = ""
+    task_type: int = 0
+    file_name: Optional[str] = None
+    file_base64: Optional[str] = None
+    idempotency_key: Optional[str] = None
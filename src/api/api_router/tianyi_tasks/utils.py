@@ -1,29 +1,123 @@
+import os
+from typing import Optional, Union
 
-
-
+from libs.agent_client import RemoteAgentAutomation
+from libs.dispatcher import DeliverFunc, DispatchRejectedError, RobotAutomation, SubmitResult, TaskDispatcher
 from libs.main import WeChatAutomation
-from models.wechat_robot_tasks.types.robot_task_type import RobotTask
-
-wechat = WeChatAutomation()
+from libs.rate_limiter import SendRateLimiter
+from libs.sharded_dispatcher import ShardedDispatcher, ShardSpec
+from libs.task_journal import TaskJournal
+from libs.transports import create_transport
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask, RobotTaskType
 
-def fix_task_content(task: RobotTask):
+def fix_task_content(wechat: RobotAutomation, task: RobotTask) -> bool:
     content = task.content
     toUser = task.to_user
     print(f"发送消息给{toUser}，内容为{content}")
-    if task.task_type == 0:
+    if task.task_type == RobotTaskType.TEXT_TYPE.value:
         # 发送消息
-        wechat.send_message("AI苏博蒂奇", content)
-        pass
-    elif task.task_type == 1:
+        return wechat.send_message("AI苏博蒂奇", content)
+    elif task.task_type == RobotTaskType.IMAGE_TYPE.value:
         # 发送图片
-        wechat.send_file("文件传输助手", content)
-        pass
-    pass
+        return wechat.send_file("文件传输助手", content)
+    raise DispatchRejectedError(f"不支持的任务类型: {task.task_type}")
+
+def create_automation() -> WeChatAutomation:
+    """按环境变量 WECHAT_TRANSPORT（print / keyboard / simulated）创建自动化实例"""
+    return WeChatAutomation(create_transport(os.getenv("WECHAT_TRANSPORT", "print")))
+
+def create_rate_limiter() -> SendRateLimiter:
+    """按环境变量创建发送限速器，速率单位为条/秒，设为 0 表示不限速"""
+    return SendRateLimiter(
+        global_rate=float(os.getenv("ROBOT_GLOBAL_RATE", "1")),
+        global_burst=float(os.getenv("ROBOT_GLOBAL_BURST", "20")),
+        recipient_rate=float(os.getenv("ROBOT_RECIPIENT_RATE", "0.2")),
+        recipient_burst=float(os.getenv("ROBOT_RECIPIENT_BURST", "5")),
+    )
+
+def create_journal(shard: Optional[str] = None) -> Optional[TaskJournal]:
+    """按环境变量 ROBOT_JOURNAL_PATH 打开任务日志，设为空字符串表示不启用
+    
+    Args:
+        shard: 分片名称，每个分片使用单独的日志文件
+    """
+    path = os.getenv("ROBOT_JOURNAL_PATH", "data/robot_task_journal.db")
+    if not path:
+        return None
+    if shard is not None:
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{shard}{ext}"
+    return TaskJournal(path)
+
+def dedupe_by_content_enabled() -> bool:
+    """没有幂等键的任务是否按内容去重（环境变量 ROBOT_DEDUPE_BY_CONTENT=1 开启，默认关闭）"""
+    return os.getenv("ROBOT_DEDUPE_BY_CONTENT", "0") == "1"
+
+def create_shard_spec(index: int, target: str) -> ShardSpec:
+    """根据分片配置项创建分片：local 表示本机微信，其余视为远程代理地址"""
+    if target == "local":
+        return ShardSpec(name=f"{index}-local", automation_factory=create_automation)
+    health_client = RemoteAgentAutomation(target)
+    return ShardSpec(
+        name=f"{index}-{target.split('://')[-1].replace(':', '_').replace('/', '_')}",
+        automation_factory=lambda: RemoteAgentAutomation(target),
+        health_check=health_client.is_healthy,
+    )
+
+def create_dispatcher() -> Union[TaskDispatcher, ShardedDispatcher]:
+    """创建任务分发器
+    
+    环境变量 ROBOT_SHARDS 为逗号分隔的分片列表（如 local,http://10.0.0.2:8066），
+    未配置时只使用本机一个微信会话。
+    """
+    targets = [t.strip() for t in os.getenv("ROBOT_SHARDS", "").split(",") if t.strip()]
+    if not targets:
+        return TaskDispatcher(
+            deliver=fix_task_content,
+            automation_factory=create_automation,
+            rate_limiter=create_rate_limiter(),
+            journal=create_journal(),
+            dedupe_by_content=dedupe_by_content_enabled(),
+        )
+
+    def shard_dispatcher(spec: ShardSpec, deliver: DeliverFunc) -> TaskDispatcher:
+        # 每个分片对应一个账号，限速和任务日志都按分片独立
+        return TaskDispatcher(
+            deliver=deliver,
+            automation_factory=spec.automation_factory,
+            rate_limiter=create_rate_limiter(),
+            journal=create_journal(spec.name),
+            name=spec.name,
+            dedupe_by_content=dedupe_by_content_enabled(),
+        )
+
+    return ShardedDispatcher(
+        shards=[create_shard_spec(i, target) for i, target in enumerate(targets)],
+        deliver=fix_task_content,
+        dispatcher_factory=shard_dispatcher,
+    )
 
-def fix_tasks(tasks: list[RobotTask]):
-    for task in tasks:
-        fix_task_content(task)
-    pass
+def robot_dispatcher_enabled() -> bool:
+    """是否启用机器人任务分发器
+    
+    分发器独占本机微信会话和任务日志，只能由一个进程驱动；
+    多 worker 部署（如只提供端口管理）需要设置 ROBOT_DISPATCHER_ENABLED=0。
+    """
+    return os.getenv("ROBOT_DISPATCHER_ENABLED", "1") != "0"
 
+# 全局任务分发器，每个工作线程独占一个微信自动化会话；未启用时为 None
+dispatcher: Optional[Union[TaskDispatcher, ShardedDispatcher]] = create_dispatcher() if robot_dispatcher_enabled() else None
 
+def get_dispatcher() -> Union[TaskDispatcher, ShardedDispatcher]:
+    """获取全局任务分发器
+    
+    Raises:
+        DispatchRejectedError: 分发器未启用时抛出
+    """
+    if dispatcher is None:
+        raise DispatchRejectedError("机器人任务分发器未启用（ROBOT_DISPATCHER_ENABLED=0）")
+    return dispatcher
 
+def fix_tasks(tasks: list[RobotTask]) -> SubmitResult:
+    """将任务加入分发队列并立即返回任务ID列表（以及与已有任务重复、未重新入队的任务ID）"""
+    return get_dispatcher().submit(tasks)
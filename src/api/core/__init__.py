@@ -23,7 +23,8 @@ API 核心模块的初始化文件。
 
 from .schemas import ResponseModel
 from .exceptions import APIException
+from .responses import FastJSONResponse
 
 # 定义模块的公共接口
 # 只有在这里列出的名称才会被 from api.core import * 导入
-__all__ = ["ResponseModel", "APIException"] 
\ No newline at end of file
+__all__ = ["ResponseModel", "APIException", "FastJSONResponse"] 
\ No newline at end of file
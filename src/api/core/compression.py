@@ -0,0 +1,271 @@
+"""
+API 响应压缩中间件。
+
+这个模块提供按 Accept-Encoding 协商 gzip / brotli 的 ASGI 中间件：
+1. 已安装 brotli 时优先使用 brotli，否则使用 gzip
+2. 小于阈值的响应、已压缩的媒体类型（PNG、JPEG、ZIP 等）和已设置 Content-Encoding 的响应不压缩
+3. 流式响应（如 SSE 事件流）逐块压缩并立即刷新，仍然是流式的
+4. 统计压缩前后的字节数，用于评估节省的流量
+"""
+
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只支持 gzip
+    brotli = None
+
+# 默认不压缩的媒体类型前缀（本身已经压缩过，再压缩只会浪费 CPU）
+DEFAULT_EXCLUDED_MEDIA_TYPES: Tuple[str, ...] = (
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "image/webp",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.openxmlformats-officedocument",  # xlsx / docx 本身是 zip
+)
+
+
+@dataclass
+class CompressionStats:
+    """
+    压缩统计（当前进程内）
+
+    Attributes:
+        compressed: 各编码压缩的响应数
+        bytes_in: 各编码压缩前的字节数
+        bytes_out: 各编码压缩后的字节数
+        skipped: 各原因（too_small / media_type / encoded / not_accepted）未压缩的响应数
+    """
+    compressed: Dict[str, int] = field(default_factory=dict)
+    bytes_in: Dict[str, int] = field(default_factory=dict)
+    bytes_out: Dict[str, int] = field(default_factory=dict)
+    skipped: Dict[str, int] = field(default_factory=dict)
+
+    def skip(self, reason: str) -> None:
+        """记录一个未压缩的响应"""
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def add_response(self, encoding: str) -> None:
+        """记录一个压缩的响应"""
+        self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+
+    def add_bytes(self, encoding: str, size_in: int, size_out: int) -> None:
+        """记录压缩前后的字节数"""
+        self.bytes_in[encoding] = self.bytes_in.get(encoding, 0) + size_in
+        self.bytes_out[encoding] = self.bytes_out.get(encoding, 0) + size_out
+
+    @property
+    def bytes_saved(self) -> int:
+        """压缩节省的字节数"""
+        return sum(self.bytes_in.values()) - sum(self.bytes_out.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """
+    解析 Accept-Encoding 请求头。
+
+    Args:
+        value: 请求头的值，如 "gzip, br;q=0.9, *;q=0"
+
+    Returns:
+        Dict[str, float]: 编码名称（小写）到 q 值的映射
+    """
+    accepted: Dict[str, float] = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, number = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class _Encoder:
+    """gzip / brotli 增量压缩器"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 生成带 gzip 头的数据
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """压缩一块数据；finish 为 False 时刷新输出，保证客户端能立即解压已收到的数据"""
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if finish else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    响应压缩 ASGI 中间件。
+
+    Example:
+        app.add_middleware(CompressionMiddleware, minimum_size=500, stats=CompressionStats())
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        excluded_media_types: Tuple[str, ...] = DEFAULT_EXCLUDED_MEDIA_TYPES,
+        stats: Optional[CompressionStats] = None,
+    ) -> None:
+        """
+        初始化中间件
+
+        Args:
+            app: 下游 ASGI 应用
+            minimum_size: 小于该字节数的响应不压缩（流式响应总是压缩）
+            gzip_level: gzip 压缩级别（1-9）
+            brotli_quality: brotli 压缩质量（0-11），较低的值压缩更快
+            excluded_media_types: 不压缩的媒体类型前缀
+            stats: 压缩统计，如果为None则创建新的统计
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.excluded_media_types = excluded_media_types
+        self.stats = stats if stats is not None else CompressionStats()
+
+    def select_encoding(self, accept_encoding: str) -> Optional[str]:
+        """按 q 值选择编码，q 值相同时优先 brotli"""
+        accepted = parse_accept_encoding(accept_encoding)
+        default_q = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+            q = accepted.get(encoding, default_q)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = self.select_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            self.stats.skip("not_accepted")
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+
+class _CompressingSend:
+    """包装 send：暂存响应头，收到第一块响应体后决定是否压缩"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Any) -> None:
+        self.middleware = middleware
+        self.stats = middleware.stats
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Dict[str, Any]] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+        self.size_in = 0
+        self.size_out = 0
+
+    def _skip_reason(self, headers: List[Tuple[bytes, bytes]]) -> Optional[str]:
+        for key, value in headers:
+            if key == b"content-encoding":
+                return "encoded"
+            if key == b"content-type":
+                media_type = value.decode("latin-1").split(";")[0].strip().lower()
+                if media_type.startswith(self.middleware.excluded_media_types):
+                    return "media_type"
+        return None
+
+    async def __call__(self, message: Dict[str, Any]) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            reason = self._skip_reason(message.get("headers", []))
+            if reason is not None:
+                self.stats.skip(reason)
+                self.passthrough = True
+                await self.send(message)
+                return
+            self.start = message
+            return
+
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                # 完整响应且小于阈值，原样发送
+                self.stats.skip("too_small")
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.encoder = _Encoder(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            headers = [
+                (key, value) for key, value in self.start.get("headers", [])
+                if key not in (b"content-length", b"vary")
+            ]
+            vary = [value for key, value in self.start.get("headers", []) if key == b"vary"]
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+            headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+            if not more_body:
+                # 完整响应：一次压缩，设置新的 Content-Length
+                compressed = self.encoder.compress(body, finish=True)
+                headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                self.stats.add_response(self.encoding)
+                self.stats.add_bytes(self.encoding, len(body), len(compressed))
+                await self.send({**self.start, "headers": headers})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            # 流式响应：去掉 Content-Length，逐块压缩
+            self.stats.add_response(self.encoding)
+            await self.send({**self.start, "headers": headers})
+
+        compressed = self.encoder.compress(body, finish=not more_body)
+        self.size_in += len(body)
+        self.size_out += len(compressed)
+        if not more_body:
+            self.stats.add_bytes(self.encoding, self.size_in, self.size_out)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
@@ -0,0 +1,153 @@
+"""
+HTTP 指标中间件。
+
+这个模块为每个请求记录 Prometheus 风格的指标（按方法和路由模板分组，如 /api/port-manager/leases/{port}）：
+1. http_requests_total: 请求数（含状态码）
+2. http_request_duration_seconds: 请求耗时直方图
+3. http_requests_in_progress: 进行中的请求数
+4. http_request_size_bytes / http_response_size_bytes: 请求体和响应体大小直方图（响应体为压缩后的大小）
+5. http_exceptions_total: 未处理异常数（按异常类型）
+
+指标保存在 libs.metrics 的注册表中，由 /metrics 接口输出。
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.routing import Match
+
+from libs.metrics import MetricsRegistry
+
+# 没有匹配到任何路由的请求（404）归为同一组，避免任意路径导致标签数量无限增长
+UNMATCHED_ROUTE = "<unmatched>"
+
+# 请求耗时直方图的桶（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 请求体 / 响应体大小直方图的桶（字节）
+SIZE_BUCKETS: Tuple[float, ...] = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+class HTTPMetrics:
+    """
+    HTTP 层的指标集合
+
+    Attributes:
+        requests: 请求数（method, route, status）
+        duration: 请求耗时（method, route）
+        in_progress: 进行中的请求数（method, route）
+        request_size: 请求体大小（method, route）
+        response_size: 响应体大小（method, route）
+        exceptions: 未处理异常数（method, route, exception）
+    """
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        labels = ("method", "route")
+        self.requests = registry.counter("http_requests_total", "HTTP 请求数", labels + ("status",))
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP 请求耗时（秒）", labels, LATENCY_BUCKETS
+        )
+        self.in_progress = registry.gauge("http_requests_in_progress", "进行中的 HTTP 请求数", labels)
+        self.request_size = registry.histogram("http_request_size_bytes", "HTTP 请求体大小（字节）", labels, SIZE_BUCKETS)
+        self.response_size = registry.histogram("http_response_size_bytes", "HTTP 响应体大小（字节）", labels, SIZE_BUCKETS)
+        self.exceptions = registry.counter("http_exceptions_total", "未处理的异常数", labels + ("exception",))
+
+
+class MetricsMiddleware:
+    """
+    HTTP 指标 ASGI 中间件，应作为最外层的中间件添加，耗时和响应大小才包含其他中间件（如压缩）
+
+    Example:
+        app.add_middleware(MetricsMiddleware, metrics=HTTPMetrics(metrics_registry))
+    """
+
+    # 路由解析缓存的最大条目数，超过时清空（带路径参数的路由每个路径各占一条）
+    ROUTE_CACHE_SIZE = 1024
+
+    def __init__(self, app: Any, metrics: HTTPMetrics, excluded_paths: Tuple[str, ...] = ()) -> None:
+        """
+        初始化中间件
+
+        Args:
+            app: 下游 ASGI 应用
+            metrics: 指标集合
+            excluded_paths: 不记录指标的路径（如 /metrics 本身）
+        """
+        self.app = app
+        self.metrics = metrics
+        self.excluded_paths = excluded_paths
+        self._route_cache: Dict[Tuple[str, str], str] = {}
+
+    def resolve_route(self, scope: Dict[str, Any]) -> str:
+        """
+        请求对应的路由模板
+
+        在请求处理前按应用的路由表匹配（与路由器的匹配规则相同），结果按 (方法, 路径) 缓存，
+        这样进行中的请求数也能按路由分组。
+
+        Returns:
+            str: 路由模板，没有匹配的路由时为 UNMATCHED_ROUTE
+        """
+        key = (scope["method"], scope["path"])
+        route = self._route_cache.get(key)
+        if route is not None:
+            return route
+        route = UNMATCHED_ROUTE
+        partial: Optional[str] = None
+        for candidate in getattr(scope.get("app"), "routes", ()):
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate.path
+                break
+            if match == Match.PARTIAL and partial is None:
+                # 路径匹配但方法不匹配（405）
+                partial = candidate.path
+        else:
+            if partial is not None:
+                route = partial
+        if len(self._route_cache) >= self.ROUTE_CACHE_SIZE:
+            self._route_cache.clear()
+        self._route_cache[key] = route
+        return route
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        method = scope["method"]
+        route = self.resolve_route(scope)
+        status = 500  # 响应开始前抛出异常时由外层返回 500
+        request_size = 0
+        response_size = 0
+
+        async def counting_receive() -> Dict[str, Any]:
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Dict[str, Any]) -> None:
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = metrics.in_progress.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        except Exception as e:
+            metrics.exceptions.labels(method, route, type(e).__name__).inc()
+            raise
+        finally:
+            in_progress.dec()
+            metrics.duration.labels(method, route).observe(time.perf_counter() - started)
+            metrics.requests.labels(method, route, str(status)).inc()
+            metrics.request_size.labels(method, route).observe(request_size)
+            metrics.response_size.labels(method, route).observe(response_size)
@@ -0,0 +1,65 @@
+"""
+API 高性能 JSON 响应。
+
+这个模块提供全局使用的 JSON 序列化函数和响应类：
+1. 已安装 orjson 时使用 orjson 序列化，否则回退到标准库 json（输出与 starlette 的 JSONResponse 一致）
+2. pydantic 模型（如 ResponseModel）由 pydantic 直接序列化为 JSON，不经过中间字典
+
+FastJSONResponse 是应用的默认响应类，路由直接返回字典或 ResponseModel 时也会使用它。
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None  # type: ignore[assignment]
+
+
+def _default(obj: Any) -> Any:
+    """序列化 JSON 原生类型以外的对象（嵌套在字典、列表中的 pydantic 模型）"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    将内容序列化为紧凑的 UTF-8 JSON。
+    
+    Args:
+        content: 字典、列表等 JSON 原生类型，或 pydantic 模型
+        
+    Returns:
+        bytes: JSON 字节串
+    """
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    使用 dumps 序列化的 JSON 响应。
+    
+    Example:
+        return FastJSONResponse(content={"port": 8080})
+        return FastJSONResponse(status_code=404, content=ResponseModel(code=404, message="Not found"))
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
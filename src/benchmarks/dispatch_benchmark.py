@@ -0,0 +1,185 @@
+"""
+机器人任务分发基准测试
+
+将一组 RobotTask 通过任意传输后端回放，统计：
+- 总耗时、每个任务的平均耗时和 p95 耗时
+- 搜索、输入、粘贴、发送、打开微信等阶段各自的耗时占比
+
+使用方法（在项目根目录执行）：
+    python src/benchmarks/dispatch_benchmark.py --backend simulated --tasks 200 --recipients 20
+    python src/benchmarks/dispatch_benchmark.py --backend simulated --vehicle-excel a.xlsx --group-excel b.xlsx
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+sys.path.append("./src")
+from libs.main import WeChatAutomation
+from libs.transports import LatencyModel, SimulatedTransport, TimingProfile, WeChatTransport, create_transport
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask, RobotTaskType
+
+
+@dataclass
+class BenchmarkReport:
+    """
+    基准测试结果
+
+    Attributes:
+        backend: 传输后端名称
+        task_count: 回放的任务数
+        failed: 发送失败的任务数
+        total_seconds: 总耗时
+        per_task_seconds: 每个任务的平均耗时
+        p95_task_seconds: 单任务耗时的 95 分位
+        step_seconds: 各阶段累计耗时
+        step_share: 各阶段耗时占总耗时的比例
+        wait_seconds: 各界面就绪等待步骤的累计耗时
+    """
+    backend: str
+    task_count: int
+    failed: int
+    total_seconds: float
+    per_task_seconds: float
+    p95_task_seconds: float
+    step_seconds: Dict[str, float] = field(default_factory=dict)
+    step_share: Dict[str, float] = field(default_factory=dict)
+    wait_seconds: Dict[str, float] = field(default_factory=dict)
+
+
+def deliver_task(automation: WeChatAutomation, task: RobotTask) -> bool:
+    """按任务类型发送给任务的接收人"""
+    if task.task_type == RobotTaskType.IMAGE_TYPE.value:
+        return automation.send_file(task.to_user, task.content)
+    return automation.send_message(task.to_user, task.content)
+
+
+def replay_tasks(tasks: List[RobotTask], automation: WeChatAutomation) -> BenchmarkReport:
+    """
+    通过给定的自动化实例依次回放任务
+
+    Args:
+        tasks: 待回放的任务列表
+        automation: 使用目标传输后端的自动化实例
+
+    Returns:
+        BenchmarkReport: 基准测试结果
+    """
+    automation.reset()
+    automation.reset_step_timings()
+    durations: List[float] = []
+    failed = 0
+
+    started = time.perf_counter()
+    for task in tasks:
+        task_started = time.perf_counter()
+        try:
+            ok = deliver_task(automation, task)
+        except Exception:
+            ok = False
+        durations.append(time.perf_counter() - task_started)
+        if not ok:
+            failed += 1
+    total = time.perf_counter() - started
+
+    steps = dict(automation.step_timings)
+    # 状态机之外的开销（日志、任务分派等）
+    steps["other"] = max(total - sum(steps.values()), 0.0)
+    durations.sort()
+    return BenchmarkReport(
+        backend=automation.transport.name,
+        task_count=len(tasks),
+        failed=failed,
+        total_seconds=total,
+        per_task_seconds=total / len(tasks) if tasks else 0.0,
+        p95_task_seconds=durations[math.ceil(len(durations) * 0.95) - 1] if durations else 0.0,
+        step_seconds=steps,
+        step_share={step: (seconds / total if total else 0.0) for step, seconds in steps.items()},
+        wait_seconds={step: timing.total_seconds for step, timing in automation.wait_timings.items()},
+    )
+
+
+def generate_tasks(count: int, recipients: int, plates: int, image_ratio: float) -> List[RobotTask]:
+    """
+    生成与天翼日志任务形态相近的合成任务，按接收人排序
+
+    Args:
+        count: 任务总数
+        recipients: 接收群数量
+        plates: 每条文本消息包含的车牌数量
+        image_ratio: 图片任务所占比例
+    """
+    tasks = []
+    image_every = round(1 / image_ratio) if image_ratio > 0 else 0
+    for i in range(count):
+        to_user = f"服务群{i % recipients:03d}"
+        if image_every and i % image_every == 0:
+            tasks.append(RobotTask(to_user=to_user, content=f"data/pngs/{i}.png",
+                                   task_type=RobotTaskType.IMAGE_TYPE.value))
+        else:
+            content = "车辆组织: 示例组织{ctrl}{ENTER}车牌号码: " + ",".join(
+                f"苏A{n:05d}" for n in range(plates)
+            ) + "{ctrl}{ENTER}请及时处理离线车辆"
+            tasks.append(RobotTask(to_user=to_user, content=content))
+    tasks.sort(key=lambda x: x.to_user)
+    return tasks
+
+
+def load_tasks_from_excel(vehicle_excel: str, group_excel: str) -> List[RobotTask]:
+    """从车辆信息和群规则 Excel 生成真实任务"""
+    import pandas as pd
+    from models.wechat_robot_tasks.api.main_api2 import tianyi_get_wx_tasks
+    return tianyi_get_wx_tasks(pd.read_excel(vehicle_excel), pd.read_excel(group_excel))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='机器人任务分发基准测试')
+    parser.add_argument('--backend', default='simulated', choices=['print', 'keyboard', 'simulated'], help='传输后端')
+    parser.add_argument('--tasks', type=int, default=100, help='合成任务数量')
+    parser.add_argument('--recipients', type=int, default=10, help='合成任务的接收群数量')
+    parser.add_argument('--plates', type=int, default=30, help='每条文本消息的车牌数量')
+    parser.add_argument('--image-ratio', type=float, default=0.5, help='图片任务比例')
+    parser.add_argument('--vehicle-excel', help='车辆信息 Excel（与 --group-excel 一起使用时替代合成任务）')
+    parser.add_argument('--group-excel', help='群规则 Excel')
+    # 模拟后端延迟模型
+    defaults = LatencyModel()
+    parser.add_argument('--search-latency', type=float, default=defaults.search, help='打开搜索框延迟（秒）')
+    parser.add_argument('--char-latency', type=float, default=defaults.type_per_char, help='每字符输入延迟（秒）')
+    parser.add_argument('--paste-latency', type=float, default=defaults.paste, help='粘贴延迟（秒）')
+    parser.add_argument('--enter-latency', type=float, default=defaults.enter, help='回车延迟（秒）')
+    parser.add_argument('--wait-scale', type=float, default=defaults.wait_scale, help='就绪等待时间缩放比例')
+    parser.add_argument('--paste-threshold', type=int, default=TimingProfile().paste_threshold,
+                        help='文本长度达到该值时改用剪贴板粘贴，0 表示始终逐字输入')
+    parser.add_argument('--output', help='将结果以 JSON 保存到该文件')
+    args = parser.parse_args()
+
+    if args.vehicle_excel and args.group_excel:
+        tasks = load_tasks_from_excel(args.vehicle_excel, args.group_excel)
+    else:
+        tasks = generate_tasks(args.tasks, args.recipients, args.plates, args.image_ratio)
+
+    transport: WeChatTransport
+    if args.backend == SimulatedTransport.name:
+        transport = SimulatedTransport(LatencyModel(
+            search=args.search_latency,
+            type_per_char=args.char_latency,
+            paste=args.paste_latency,
+            enter=args.enter_latency,
+            wait_scale=args.wait_scale,
+        ))
+    else:
+        transport = create_transport(args.backend)
+    transport.profile.paste_threshold = args.paste_threshold
+
+    report = replay_tasks(tasks, WeChatAutomation(transport))
+    print(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(asdict(report), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,489 @@
+"""
+端口管理器压力测试
+
+先占用端口范围内一定比例的端口，再在本地 uvicorn 中启动端口管理器，
+用多个并发异步客户端持续请求分配端口（/free-port，随后释放租约）和检查端口（/check-port），统计：
+- 每秒分配 / 检查次数
+- 请求延迟的 p50、p99 和最大值
+- 服务端事件循环卡顿时间（监控协程实际唤醒时间相对预期的延迟）
+
+服务端运行在独立进程中，客户端负载不会与其争抢 GIL。
+
+使用方法（在项目根目录执行）：
+    python src/benchmarks/port_manager_benchmark.py --start-port 30000 --end-port 30999 --occupancy 0,0.5,0.9
+    python src/benchmarks/port_manager_benchmark.py --fixture test-server --end-port 30099 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+sys.path.append("./src")
+from test_server import MultiPortServer
+
+API_PREFIX = "/api/port-manager"
+
+
+class SocketOccupier:
+    """
+    轻量的端口占用工具：在指定端口上监听但不处理连接，接口与 MultiPortServer 一致
+    """
+
+    def __init__(self, ports: List[int]) -> None:
+        self.ports = ports
+        self.sockets: List[socket.socket] = []
+        self.failed_ports: List[int] = []
+
+    def start(self) -> None:
+        for port in self.ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind(("", port))
+                sock.listen()
+            except OSError:
+                sock.close()
+                self.failed_ports.append(port)
+                continue
+            self.sockets.append(sock)
+
+    def stop(self) -> None:
+        for sock in self.sockets:
+            sock.close()
+        self.sockets = []
+
+
+@dataclass
+class EndpointReport:
+    """
+    单个接口的压测结果
+
+    Attributes:
+        name: 负载名称
+        requests: 完成的请求数
+        succeeded: 成功（2xx）的请求数
+        status_counts: 各 HTTP 状态码（连接错误记为 error）的次数
+        seconds: 持续时间
+        per_second: 每秒成功次数
+        p50_ms: 延迟中位数（毫秒）
+        p99_ms: 延迟 99 分位（毫秒）
+        max_ms: 最大延迟（毫秒）
+        loop_stall_max_ms: 期间服务端事件循环的最大卡顿（毫秒）
+        loop_stall_p99_ms: 期间服务端事件循环卡顿的 99 分位（毫秒）
+        loop_stall_total_ms: 期间服务端事件循环的累计卡顿（毫秒）
+    """
+    name: str
+    requests: int
+    succeeded: int
+    status_counts: Dict[str, int]
+    seconds: float
+    per_second: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+    loop_stall_max_ms: float = 0.0
+    loop_stall_p99_ms: float = 0.0
+    loop_stall_total_ms: float = 0.0
+
+
+@dataclass
+class ScenarioReport:
+    """
+    某一占用比例下的压测结果
+
+    Attributes:
+        occupancy: 预先占用的端口比例
+        occupied_ports: 实际占用成功的端口数
+        endpoints: 各负载的结果
+    """
+    occupancy: float
+    occupied_ports: int
+    endpoints: List[EndpointReport] = field(default_factory=list)
+
+
+@dataclass
+class BenchmarkReport:
+    """
+    压测结果
+
+    Attributes:
+        start_port: 端口范围起点
+        end_port: 端口范围终点（包含）
+        fixture: 端口占用方式
+        clients: 并发客户端数
+        duration: 每种负载的持续时间（秒）
+        scenarios: 各占用比例下的结果
+    """
+    start_port: int
+    end_port: int
+    fixture: str
+    clients: int
+    duration: float
+    scenarios: List[ScenarioReport] = field(default_factory=list)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """返回已排序列表的 q 分位数，空列表返回 0"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(math.ceil(len(values) * q) - 1, 0))]
+
+
+class HttpConnection:
+    """
+    最小的 HTTP/1.1 keep-alive 客户端，只支持带 Content-Length 的响应
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str) -> Tuple[int, bytes]:
+        """
+        发送请求，连接断开时下一次请求自动重连
+
+        Returns:
+            Tuple[int, bytes]: 状态码和响应体
+        """
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        assert self._reader is not None
+        try:
+            self._writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: 0\r\n\r\n".encode())
+            status_line = await self._reader.readline()
+            if not status_line:
+                raise ConnectionError("连接已关闭")
+            status = int(status_line.split()[1])
+            length = 0
+            while True:
+                line = await self._reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            body = await self._reader.readexactly(length)
+            return status, body
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class LoadResult:
+    """一种负载的原始统计"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latencies: List[float] = []
+        self.status_counts: Dict[str, int] = {}
+        self.started = 0.0
+        self.finished = 0.0
+
+    def add(self, status: str, latency: Optional[float]) -> None:
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def report(self, stalls: List[Tuple[float, float]]) -> EndpointReport:
+        """
+        汇总结果
+
+        Args:
+            stalls: 服务端事件循环卡顿采样 (时间戳, 卡顿秒数)
+        """
+        seconds = self.finished - self.started
+        latencies = sorted(self.latencies)
+        window = sorted(lag for at, lag in stalls if self.started <= at <= self.finished)
+        succeeded = sum(count for status, count in self.status_counts.items() if status.startswith("2"))
+        return EndpointReport(
+            name=self.name,
+            requests=sum(self.status_counts.values()),
+            succeeded=succeeded,
+            status_counts=dict(sorted(self.status_counts.items())),
+            seconds=seconds,
+            per_second=succeeded / seconds if seconds > 0 else 0.0,
+            p50_ms=percentile(latencies, 0.5) * 1000,
+            p99_ms=percentile(latencies, 0.99) * 1000,
+            max_ms=(latencies[-1] if latencies else 0.0) * 1000,
+            loop_stall_max_ms=(window[-1] if window else 0.0) * 1000,
+            loop_stall_p99_ms=percentile(window, 0.99) * 1000,
+            loop_stall_total_ms=sum(window, 0.0) * 1000,
+        )
+
+
+async def timed_request(conn: HttpConnection, method: str, path: str, result: LoadResult) -> Tuple[int, bytes]:
+    """发送请求并记录状态码和延迟，连接错误时状态记为 error、状态码返回 0"""
+    started = time.perf_counter()
+    try:
+        status, body = await conn.request(method, path)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+        result.add("error", None)
+        return 0, b""
+    result.add(str(status), time.perf_counter() - started)
+    return status, body
+
+
+async def run_load(name: str, port: int, clients: int, duration: float, client_loop) -> LoadResult:
+    """
+    用 clients 个并发客户端运行 duration 秒
+
+    Args:
+        name: 负载名称
+        port: 服务端端口
+        clients: 并发客户端数
+        duration: 持续时间（秒）
+        client_loop: 单个客户端的请求循环 (conn, result, deadline)
+    """
+    result = LoadResult(name)
+    connections = [HttpConnection("127.0.0.1", port) for _ in range(clients)]
+    result.started = time.time()
+    deadline = time.perf_counter() + duration
+    try:
+        await asyncio.gather(*(client_loop(conn, result, deadline) for conn in connections))
+    finally:
+        result.finished = time.time()
+        for conn in connections:
+            conn.close()
+    return result
+
+
+async def run_scenario(
+    port: int,
+    start_port: int,
+    end_port: int,
+    clients: int,
+    duration: float,
+    ttl: float,
+) -> Tuple[LoadResult, LoadResult, LoadResult]:
+    """
+    依次运行分配负载和检查负载
+
+    Returns:
+        Tuple[LoadResult, LoadResult, LoadResult]: 分配、释放、检查的统计
+    """
+    releases = LoadResult("release")
+
+    async def allocate_loop(conn: HttpConnection, result: LoadResult, deadline: float) -> None:
+        path = f"{API_PREFIX}/free-port?start_port={start_port}&max_port={end_port}&ttl={ttl}"
+        while time.perf_counter() < deadline:
+            status, body = await timed_request(conn, "GET", path, result)
+            if status == 200:
+                # 立即释放，保持端口范围的占用比例不变
+                await timed_request(conn, "DELETE", f"{API_PREFIX}/leases/{json.loads(body)['port']}", releases)
+
+    async def check_loop(conn: HttpConnection, result: LoadResult, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            await timed_request(conn, "GET", f"{API_PREFIX}/check-port/{random.randint(start_port, end_port)}", result)
+
+    allocations = await run_load("allocate", port, clients, duration, allocate_loop)
+    releases.started, releases.finished = allocations.started, allocations.finished
+    checks = await run_load("check", port, clients, duration, check_loop)
+    return allocations, releases, checks
+
+
+def serve(port: int, state_path: str, interval: float, conn) -> None:
+    """
+    服务端进程：在 uvicorn 中运行端口管理器，同时监控事件循环卡顿
+
+    父进程通过 conn 发送停止消息后设置 server.should_exit 正常退出，再通过 conn 返回卡顿采样。
+    不使用 SIGTERM：uvicorn 捕获信号后会在 serve() 结束时重新抛出，进程来不及返回采样。
+    """
+    import uvicorn
+    from fastapi import FastAPI
+    from api.api_router.port_manager.api import PortManagerAPI
+
+    app = FastAPI()
+    app.include_router(PortManagerAPI(state_path=state_path), prefix="/api")
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", loop="asyncio"))
+    stalls: List[Tuple[float, float]] = []
+
+    async def monitor() -> None:
+        """每 interval 秒唤醒一次，记录实际唤醒时间相对预期的延迟"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            stalls.append((time.time(), max(loop.time() - expected, 0.0)))
+
+    async def main() -> None:
+        task = asyncio.ensure_future(monitor())
+        try:
+            await server.serve()
+        finally:
+            task.cancel()
+
+    def wait_for_stop() -> None:
+        """等待父进程的停止消息（或管道关闭），通知 uvicorn 退出"""
+        try:
+            conn.recv()
+        except EOFError:
+            pass
+        server.should_exit = True
+
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+    asyncio.run(main())
+    conn.send(stalls)
+    conn.close()
+
+
+def pick_free_port() -> int:
+    """由系统分配一个临时端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port: int, timeout: float = 30.0) -> None:
+    """等待服务端开始监听"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"服务端未能在 {timeout} 秒内启动")
+
+
+def stop_server(process, conn, timeout: float = 30.0) -> List[Tuple[float, float]]:
+    """
+    通知服务端进程退出并取回事件循环卡顿采样
+
+    Args:
+        process: 服务端进程
+        conn: 与服务端进程相连的双向管道
+        timeout: 等待服务端返回采样的时间（秒）
+
+    Returns:
+        List[Tuple[float, float]]: (时间戳, 卡顿秒数) 采样
+
+    Raises:
+        RuntimeError: 服务端没有返回任何采样
+    """
+    stalls: List[Tuple[float, float]] = []
+    try:
+        conn.send("stop")
+        if conn.poll(timeout):
+            stalls = conn.recv()
+    except (EOFError, OSError):
+        pass
+    finally:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    if not stalls:
+        raise RuntimeError(f"服务端没有返回事件循环卡顿采样（退出码 {process.exitcode}）")
+    return stalls
+
+
+def run_benchmark(
+    start_port: int,
+    end_port: int,
+    occupancy: float,
+    fixture: str,
+    clients: int,
+    duration: float,
+    ttl: float,
+    stall_interval: float,
+) -> ScenarioReport:
+    """
+    在给定占用比例下启动服务端并运行负载
+
+    Args:
+        start_port: 端口范围起点
+        end_port: 端口范围终点（包含）
+        occupancy: 预先占用的端口比例
+        fixture: 占用方式，sockets（随机端口上监听的套接字）或 test-server（从起点开始连续的 selector 模式 MultiPortServer）
+        clients: 并发客户端数
+        duration: 每种负载的持续时间（秒）
+        ttl: 分配端口的租期（秒）
+        stall_interval: 事件循环卡顿采样间隔（秒）
+
+    Returns:
+        ScenarioReport: 压测结果
+    """
+    ports = list(range(start_port, end_port + 1))
+    count = int(len(ports) * occupancy)
+    occupier: Union[MultiPortServer, SocketOccupier]
+    if fixture == "test-server":
+        occupier = MultiPortServer(start_port, start_port + count - 1, mode="selector")
+    else:
+        occupier = SocketOccupier(sorted(random.Random(0).sample(ports, count)))
+
+    context = multiprocessing.get_context("spawn")
+    control, child_conn = context.Pipe()
+    server_port = pick_free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        process = context.Process(
+            target=serve,
+            args=(server_port, os.path.join(directory, "port_manager.state"), stall_interval, child_conn),
+        )
+        process.start()
+        occupier.start()
+        try:
+            wait_until_listening(server_port)
+            allocations, releases, checks = asyncio.run(
+                run_scenario(server_port, start_port, end_port, clients, duration, ttl)
+            )
+        finally:
+            occupier.stop()
+            stalls = stop_server(process, control)
+
+    return ScenarioReport(
+        occupancy=occupancy,
+        occupied_ports=count - len(occupier.failed_ports),
+        endpoints=[result.report(stalls) for result in (allocations, releases, checks)],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端口管理器压力测试')
+    parser.add_argument('--start-port', type=int, default=30000, help='端口范围起点')
+    parser.add_argument('--end-port', type=int, default=30999, help='端口范围终点（包含）')
+    parser.add_argument('--occupancy', default='0,0.5,0.9', help='预先占用的端口比例，逗号分隔')
+    parser.add_argument('--fixture', default='sockets', choices=['sockets', 'test-server'],
+                        help='占用方式：sockets 在随机端口上监听；test-server 用 MultiPortServer 从起点连续占用')
+    parser.add_argument('--clients', type=int, default=32, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=5.0, help='每种负载的持续时间（秒）')
+    parser.add_argument('--ttl', type=float, default=60.0, help='分配端口的租期（秒）')
+    parser.add_argument('--stall-interval', type=float, default=0.005, help='事件循环卡顿采样间隔（秒）')
+    parser.add_argument('--output', help='将结果以 JSON 保存到该文件')
+    args = parser.parse_args()
+
+    report = BenchmarkReport(
+        start_port=args.start_port,
+        end_port=args.end_port,
+        fixture=args.fixture,
+        clients=args.clients,
+        duration=args.duration,
+    )
+    for occupancy in (float(value) for value in args.occupancy.split(',')):
+        report.scenarios.append(run_benchmark(
+            args.start_port, args.end_port, occupancy, args.fixture,
+            args.clients, args.duration, args.ttl, args.stall_interval,
+        ))
+    print(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(asdict(report), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
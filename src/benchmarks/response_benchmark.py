@@ -0,0 +1,147 @@
+"""
+JSON 响应序列化微基准测试
+
+对常见的响应内容，比较构造响应的耗时：
+- baseline: starlette JSONResponse（标准库 json），ResponseModel 先转换为字典（原全局异常处理的做法）
+- fast: FastJSONResponse（orjson 可用时使用 orjson），ResponseModel 直接由 pydantic 序列化
+
+使用方法（在项目根目录执行）：
+    python src/benchmarks/response_benchmark.py
+    python src/benchmarks/response_benchmark.py --number 20000 --output response_benchmark.json
+"""
+import argparse
+import json
+import sys
+import timeit
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+# 直接导入 core 包，避免导入 api 包时创建应用和所有路由
+sys.path.append("./src/api")
+from fastapi.responses import JSONResponse
+from core import responses
+from core.responses import FastJSONResponse
+from core.schemas import ResponseModel
+
+
+@dataclass
+class CaseReport:
+    """
+    单个响应内容的测试结果
+
+    Attributes:
+        name: 响应内容名称
+        size_bytes: 响应体字节数（fast）
+        baseline_us: 原做法每次构造响应的耗时（微秒）
+        fast_us: FastJSONResponse 每次构造响应的耗时（微秒）
+        speedup: baseline_us / fast_us
+    """
+    name: str
+    size_bytes: int
+    baseline_us: float
+    fast_us: float
+    speedup: float
+
+
+@dataclass
+class BenchmarkReport:
+    """
+    基准测试结果
+
+    Attributes:
+        serializer: FastJSONResponse 使用的序列化库
+        number: 每个用例的执行次数
+        cases: 各响应内容的结果
+    """
+    serializer: str
+    number: int
+    cases: List[CaseReport] = field(default_factory=list)
+
+
+def build_cases() -> Dict[str, Any]:
+    """常见的响应内容"""
+    now = datetime.now().isoformat()
+    return {
+        # 全局异常处理返回的错误信封
+        "error_envelope": ResponseModel(code=404, message="Not found", data=None),
+        # 包含少量数据的成功信封
+        "small_envelope": ResponseModel(data={"port": 30001, "allocated_at": now, "expires_at": now}),
+        # 包含列表数据的成功信封（如任务状态列表）
+        "list_envelope": ResponseModel(data=[
+            {"task_id": f"{i:08x}", "to_user": f"服务群{i:03d}", "status": "sent", "attempts": 1, "updated_at": now}
+            for i in range(100)
+        ]),
+        # 端口管理器的租约响应
+        "lease": {"port": 30001, "allocated_at": now, "expires_at": now},
+        # 端口管理器的范围状态响应（空闲端口段）
+        "status_runs": {
+            "start": 20000,
+            "end": 29999,
+            "available_count": 5000,
+            "unavailable_count": 5000,
+            "checked_at": now,
+            "free_runs": [(20000 + i * 20, 20000 + i * 20 + 9) for i in range(500)],
+        },
+    }
+
+
+def baseline_response(content: Any) -> JSONResponse:
+    """原做法：pydantic 模型先转换为字典，再由 JSONResponse 用标准库 json 序列化"""
+    if isinstance(content, ResponseModel):
+        content = content.model_dump()
+    return JSONResponse(content=content)
+
+
+def fast_response(content: Any) -> FastJSONResponse:
+    return FastJSONResponse(content=content)
+
+
+def measure(func: Callable[[Any], Any], content: Any, number: int) -> float:
+    """返回每次调用的最短平均耗时（微秒）"""
+    return min(timeit.repeat(lambda: func(content), number=number, repeat=5)) / number * 1e6
+
+
+def run_benchmark(number: int) -> BenchmarkReport:
+    """
+    运行所有用例
+
+    Args:
+        number: 每个用例每轮的执行次数
+
+    Returns:
+        BenchmarkReport: 基准测试结果
+    """
+    report = BenchmarkReport(serializer="orjson" if responses.orjson is not None else "json", number=number)
+    for name, content in build_cases().items():
+        baseline_body = baseline_response(content).body
+        fast_body = fast_response(content).body
+        # 两种做法的输出必须等价
+        assert json.loads(baseline_body) == json.loads(fast_body), name
+        baseline_us = measure(baseline_response, content, number)
+        fast_us = measure(fast_response, content, number)
+        report.cases.append(CaseReport(
+            name=name,
+            size_bytes=len(fast_body),
+            baseline_us=baseline_us,
+            fast_us=fast_us,
+            speedup=baseline_us / fast_us if fast_us else 0.0,
+        ))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 响应序列化微基准测试')
+    parser.add_argument('--number', type=int, default=5000, help='每个用例每轮的执行次数')
+    parser.add_argument('--output', help='将结果以 JSON 保存到该文件')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.number)
+    print(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(asdict(report), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+远程机器人代理客户端
+
+把另一台机器（或另一个微信账号）上运行的本服务当作发送后端：
+任务通过 POST /api/tianyitasks/tasks 提交给远程代理，由代理自己的分发器发送，
+客户端轮询 GET /api/tianyitasks/tasks/{task_id} 直到任务结束。
+
+RemoteAgentAutomation 提供与 WeChatAutomation 相同的 send_message / send_file 接口，
+可以直接作为 TaskDispatcher 的自动化实例使用。
+"""
+import base64
+import os
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+
+class RemoteAgentAutomation:
+    """
+    通过远程代理发送消息
+
+    Attributes:
+        base_url: 代理服务地址，例如 http://10.0.0.2:8066
+        timeout: 单个任务从提交到结束的最长等待时间（秒）
+        poll_interval: 轮询任务状态的间隔（秒）
+        token: 代理令牌，随提交请求发送（X-Agent-Token），默认读取环境变量 ROBOT_AGENT_TOKEN
+    """
+
+    # 远程任务的结束状态
+    FINISHED_STATUSES = ("sent", "failed", "cancelled")
+
+    def __init__(
+        self, base_url: str, timeout: float = 120.0, poll_interval: float = 0.2, token: Optional[str] = None
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.token = token if token is not None else os.getenv("ROBOT_AGENT_TOKEN")
+        self._session = self._new_session()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        if self.token:
+            session.headers["X-Agent-Token"] = self.token
+        return session
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/api/tianyitasks{path}"
+
+    def _send(self, item: Dict[str, Any]) -> bool:
+        """提交一个任务并等待远程发送完成"""
+        response = self._session.post(self._url("/tasks"), json=[item], timeout=10)
+        response.raise_for_status()
+        task_id = response.json()["task_ids"][0]
+
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            status = self._session.get(self._url(f"/tasks/{task_id}"), timeout=10)
+            status.raise_for_status()
+            state = status.json()["status"]
+            if state in self.FINISHED_STATUSES:
+                return state == "sent"
+            time.sleep(self.poll_interval)
+        raise TimeoutError(f"远程任务 {task_id} 在 {self.timeout} 秒内未完成")
+
+    def send_message(self, user: str, message: str) -> bool:
+        """通过代理发送消息"""
+        return self._send({"to_user": user, "content": message, "task_type": 0})
+
+    def send_file(self, user: str, file_path: str) -> bool:
+        """通过代理发送文件，文件内容随请求一起上传"""
+        with open(file_path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        return self._send({
+            "to_user": user,
+            "task_type": 1,
+            "file_name": os.path.basename(file_path),
+            "file_base64": encoded,
+        })
+
+    def is_healthy(self) -> bool:
+        """代理是否在线且分发器在运行"""
+        try:
+            # 健康检查在监控线程中执行，不与发送共用会话
+            response = requests.get(self._url("/tasks"), timeout=3)
+            return response.status_code == 200 and bool(response.json().get("running"))
+        except (requests.RequestException, ValueError):
+            return False
+
+    def reset(self) -> None:
+        """重建 HTTP 会话"""
+        self._session.close()
+        self._session = self._new_session()
@@ -0,0 +1,675 @@
+"""
+机器人任务分发模块
+
+将 RobotTask 的投递从请求处理流程中剥离出来：
+- 单个后台工作线程独占 WeChatAutomation 会话，保证并发上传时键盘操作不会交错
+- 有界内存队列，队列已满时对调用方施加背压
+- 投递失败的任务按指数退避重试
+- 记录每个任务的状态，支持取消尚未发送的任务
+- 可选的任务日志（TaskJournal），重启后跳过已发送任务并恢复未完成任务
+- 入队、发送、失败、重试、排队时间、各接收人发送耗时和队列长度记录到指标注册表（libs.metrics），由 /metrics 输出
+"""
+import heapq
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol, Tuple
+
+from libs.main import WeChatAutomation
+from libs.metrics import MetricsRegistry, metrics_registry
+from libs.rate_limiter import SendRateLimiter
+from libs.task_journal import JournalEntry, TaskJournal, journal_key
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask
+
+
+class DispatchStatus(Enum):
+    """任务分发状态枚举"""
+    QUEUED = "queued"          # 排队等待发送
+    SENDING = "sending"        # 正在发送
+    RETRYING = "retrying"      # 发送失败，等待重试
+    SENT = "sent"              # 发送成功
+    FAILED = "failed"          # 重试耗尽，发送失败
+    CANCELLED = "cancelled"    # 已取消
+
+
+# 处于这些状态的任务不会再被处理
+FINISHED_STATUSES = (DispatchStatus.SENT, DispatchStatus.FAILED, DispatchStatus.CANCELLED)
+
+
+class DispatchQueueFullError(Exception):
+    """分发队列已满，调用方应稍后重试"""
+
+
+class DispatchRejectedError(Exception):
+    """不可重试的投递错误（如不支持的任务类型），任务将直接标记为失败"""
+
+
+@dataclass
+class DispatchRecord:
+    """
+    单个任务的分发记录
+
+    Attributes:
+        task_id: 任务ID
+        task: 待发送的机器人任务
+        status: 当前分发状态
+        attempts: 已尝试发送的次数
+        error: 最近一次失败的错误信息
+        created_at: 入队时间戳
+        updated_at: 最近一次状态变更时间戳
+        next_attempt_at: 下一次允许发送的时间戳（用于退避重试）
+        key: 日志键（见 task_journal.journal_key），仅在启用任务日志时设置
+    """
+    task_id: str
+    task: RobotTask
+    status: DispatchStatus = DispatchStatus.QUEUED
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    next_attempt_at: float = 0.0
+    key: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典"""
+        return {
+            "task_id": self.task_id,
+            "to_user": self.task.to_user,
+            "task_type": self.task.task_type,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+@dataclass
+class SubmitResult:
+    """
+    一批任务的提交结果
+
+    Attributes:
+        task_ids: 与提交的任务一一对应的任务ID
+        deduplicated: 与已有任务重复、没有重新入队的任务ID（即已有任务的ID）
+    """
+    task_ids: List[str]
+    deduplicated: List[str] = field(default_factory=list)
+
+
+class RobotAutomation(Protocol):
+    """
+    投递函数使用的自动化接口
+
+    本机的 WeChatAutomation 和远程代理 RemoteAgentAutomation 都实现了这些方法。
+    """
+
+    def send_message(self, user: str, message: str) -> bool: ...
+
+    def send_file(self, user: str, file_path: str) -> bool: ...
+
+
+# 投递函数：使用工作线程持有的自动化实例发送单个任务，返回是否成功
+DeliverFunc = Callable[[RobotAutomation, RobotTask], bool]
+
+# 单次发送耗时直方图的桶（秒），包含搜索聊天、输入和粘贴
+SEND_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 任务从入队到第一次发送的等待时间直方图的桶（秒）
+QUEUE_WAIT_BUCKETS: Tuple[float, ...] = (0.1, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+class DispatchMetrics:
+    """
+    单个分发器的指标（以 dispatcher 标签区分分片）
+
+    入队速率高于发送速率、排队时间和队列长度持续增长时，瓶颈在发送；
+    反之队列常空、发送线程空闲时，瓶颈在任务生成。
+    发送耗时按接收人分组，接收人数量应是有限的群列表。
+
+    Attributes:
+        queued: 入队的任务数（含从任务日志恢复的任务）
+        sent / failed / cancelled: 各结束状态的任务数
+        migrated: 被 drain 取出、迁移到其他分发器的任务数（不计入 cancelled）
+        retries: 发送失败后安排重试的次数
+        queue_depth: 排队 + 等待重试的任务数
+        queue_wait: 任务从入队到第一次发送的等待时间
+    """
+
+    def __init__(self, name: str, registry: MetricsRegistry = metrics_registry) -> None:
+        self.name = name
+        labels = ("dispatcher",)
+        self.queued = registry.counter("robot_tasks_queued_total", "入队的机器人任务数", labels).labels(name)
+        finished = registry.counter("robot_tasks_finished_total", "结束的机器人任务数", labels + ("status",))
+        self.sent = finished.labels(name, DispatchStatus.SENT.value)
+        self.failed = finished.labels(name, DispatchStatus.FAILED.value)
+        self.cancelled = finished.labels(name, DispatchStatus.CANCELLED.value)
+        self.migrated = finished.labels(name, "migrated")
+        self.retries = registry.counter("robot_task_retries_total", "机器人任务重试次数", labels).labels(name)
+        self.queue_depth = registry.gauge("robot_queue_depth", "排队和等待重试的机器人任务数", labels).labels(name)
+        self.queue_wait = registry.histogram(
+            "robot_task_queue_wait_seconds", "机器人任务从入队到第一次发送的等待时间（秒）", labels, QUEUE_WAIT_BUCKETS
+        ).labels(name)
+        self._send_duration = registry.histogram(
+            "robot_send_duration_seconds", "单次发送机器人任务的耗时（秒）", labels + ("recipient", "result"), SEND_BUCKETS
+        )
+
+    def observe_send(self, recipient: str, ok: bool, seconds: float) -> None:
+        """记录一次发送的耗时"""
+        self._send_duration.labels(self.name, recipient, "success" if ok else "failure").observe(seconds)
+
+
+class TaskDispatcher:
+    """
+    机器人任务分发器
+
+    所有任务都由同一个工作线程发送，该线程独占 WeChatAutomation 实例。
+    调用方只负责入队，入队后立即返回任务ID，可通过任务ID查询状态或取消任务。
+
+    任务按接收人（to_user）分队列保存，同一接收人的任务按入队顺序发送，
+    不同接收人按首次入队顺序轮流调度。
+
+    特点：
+    - 背压：待发送任务数达到上限时，submit 在超时后抛出 DispatchQueueFullError
+    - 重试：失败任务以 backoff_base * 2^(n-1) 秒（不超过 backoff_max）的间隔重试
+    - 限速：配置 rate_limiter 后，某个接收人被限速时先发送其他接收人的任务，
+      只有所有接收人都需要等待时才休眠
+    - 优先继续发送上一个接收人的任务，以复用已打开的聊天会话
+    - 幂等：配置 journal 后，调用方提供了幂等键（RobotTask.idempotency_key）的任务，
+      同一幂等键的任务在排队中或去重窗口内已发送时不会再次入队，提交结果中报告为重复；
+      dedupe_by_content 开启时没有幂等键的任务按内容去重，默认不去重（相同内容可以重复发送）；
+      启动时从日志恢复未完成的任务（崩溃时正在发送的任务会重新发送一次）
+    """
+
+    def __init__(
+        self,
+        deliver: DeliverFunc,
+        automation_factory: Callable[[], RobotAutomation] = WeChatAutomation,
+        max_queue_size: int = 1000,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        max_history: int = 10000,
+        rate_limiter: Optional[SendRateLimiter] = None,
+        journal: Optional[TaskJournal] = None,
+        name: str = "default",
+        dedupe_by_content: bool = False,
+    ) -> None:
+        """
+        初始化分发器
+
+        Args:
+            deliver: 投递函数
+            automation_factory: 创建自动化实例的工厂，在工作线程中调用
+            max_queue_size: 待发送任务（排队 + 等待重试）的最大数量
+            max_retries: 首次发送失败后的最大重试次数
+            backoff_base: 退避基准时间（秒）
+            backoff_max: 退避最长时间（秒）
+            max_history: 保留的已结束任务记录数量
+            rate_limiter: 发送限速器，None 表示不限速
+            journal: 任务日志，None 表示不持久化
+            name: 分发器名称，作为指标的 dispatcher 标签（分片时为分片名称）
+            dedupe_by_content: 没有幂等键的任务是否按内容去重（需要配置 journal）
+        """
+        self._deliver = deliver
+        self._automation_factory = automation_factory
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_history = max_history
+        self.rate_limiter = rate_limiter
+        self.journal = journal
+        self.dedupe_by_content = dedupe_by_content
+        self.metrics = DispatchMetrics(name)
+
+        self._cond = threading.Condition()                         # 保护以下所有状态
+        self._records: "OrderedDict[str, DispatchRecord]" = OrderedDict()
+        self._queues: "OrderedDict[str, Deque[str]]" = OrderedDict()  # 接收人 -> 待发送任务
+        self._retry_heap: List[Tuple[float, int, str]] = []        # (下次发送时间, 序号, 任务ID)
+        self._last_recipient: Optional[str] = None                  # 上一个发送的接收人
+        self._retry_seq = 0
+        self._finished: Deque[str] = deque()                       # 已结束任务，按结束顺序
+        self._pending = 0                                          # 排队 + 等待重试的任务数
+        self._key_index: Dict[str, str] = {}                       # 日志键 -> 内存中的任务ID
+        self._running = False
+        self._worker: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """启动工作线程（重复调用无副作用）"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._resume()
+            self._worker = threading.Thread(
+                target=self._run, name="robot-task-dispatcher", daemon=True
+            )
+            self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止工作线程，正在发送的任务会在完成后退出"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+        if self.journal is not None:
+            self.journal.flush()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """停止工作线程并关闭任务日志"""
+        self.stop(timeout)
+        if self.journal is not None:
+            self.journal.close()
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def submit(
+        self,
+        tasks: List[RobotTask],
+        timeout: Optional[float] = 0.0,
+        task_ids: Optional[List[str]] = None,
+    ) -> SubmitResult:
+        """
+        批量提交任务
+
+        一批任务要么全部入队，要么全部不入队。与已有任务重复的任务不会入队，
+        返回已有任务的ID，并列在 SubmitResult.deduplicated 中。
+
+        Args:
+            tasks: 待发送的任务列表
+            timeout: 队列空间不足时的最长等待时间（秒），None 表示一直等待
+            task_ids: 指定任务ID（用于在分发器之间迁移任务），None 表示自动生成
+
+        Returns:
+            SubmitResult: 与 tasks 一一对应的任务ID列表，以及其中重复的任务ID
+
+        Raises:
+            DispatchQueueFullError: 等待超时后队列空间仍不足
+        """
+        if len(tasks) > self.max_queue_size:
+            raise DispatchQueueFullError(
+                f"任务数量 {len(tasks)} 超过队列容量 {self.max_queue_size}"
+            )
+        # 先启动（并从日志恢复），再做去重判断
+        self.start()
+        ids = list(task_ids) if task_ids is not None else [uuid.uuid4().hex for _ in tasks]
+        # 计算日志键和查询已发送记录都涉及 I/O，放在锁外完成
+        keys: List[Optional[str]] = [None] * len(tasks)
+        delivered: Dict[str, JournalEntry] = {}
+        if self.journal is not None:
+            for i, task in enumerate(tasks):
+                task_key = keys[i] = journal_key(task, ids[i], self.dedupe_by_content)
+                entry = self.journal.find_delivered(task_key)
+                if entry is not None:
+                    delivered[task_key] = entry
+
+        with self._cond:
+            def new_count() -> int:
+                return sum(
+                    1 for key in keys
+                    if key is None or (key not in delivered and self._find_duplicate(key) is None)
+                )
+            has_room = self._cond.wait_for(
+                lambda: self._pending + new_count() <= self.max_queue_size, timeout
+            )
+            if not has_room:
+                raise DispatchQueueFullError(
+                    f"分发队列已满（{self._pending}/{self.max_queue_size}），请稍后重试"
+                )
+            result = SubmitResult(task_ids=[])
+            added: List[DispatchRecord] = []
+            for task_id, task, key in zip(ids, tasks, keys):
+                duplicate = self._find_duplicate(key) if key is not None else None
+                if duplicate is None and key is not None and key in delivered:
+                    # 去重窗口内已发送过，恢复原任务的记录
+                    duplicate = self._restore_delivered(delivered[key])
+                if duplicate is not None:
+                    # 同一任务仍在排队、发送中，或刚刚发送过，返回原任务
+                    result.task_ids.append(duplicate.task_id)
+                    result.deduplicated.append(duplicate.task_id)
+                    continue
+                record = DispatchRecord(task_id=task_id, task=task, key=key)
+                self._enqueue(record)
+                self._journal(record)
+                added.append(record)
+                result.task_ids.append(record.task_id)
+            self._cond.notify_all()
+
+        if self.journal is not None and added:
+            # 入队记录立即落盘，保证已接受的任务在崩溃后仍能恢复
+            self.journal.flush()
+        if result.deduplicated:
+            print(f"{len(result.deduplicated)} 个任务与已有任务重复，未重新入队")
+        return result
+
+    def get(self, task_id: str) -> Optional[DispatchRecord]:
+        """查询任务分发记录"""
+        with self._cond:
+            return self._records.get(task_id)
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        取消尚未发送的任务
+
+        Returns:
+            bool: 是否取消成功；正在发送或已结束的任务无法取消
+        """
+        with self._cond:
+            record = self._records.get(task_id)
+            if record is None or record.status not in (DispatchStatus.QUEUED, DispatchStatus.RETRYING):
+                return False
+            # 队列中的条目在出队时按状态跳过
+            self._finish(record, DispatchStatus.CANCELLED)
+            return True
+
+    def drain(self, reason: str) -> List[Tuple[str, RobotTask]]:
+        """
+        取消所有尚未发送的任务并返回它们，用于把任务迁移到其他分发器
+
+        取出的任务不计入 cancelled；调用方迁移成功后计入 metrics.migrated，失败时用 requeue 放回。
+
+        Args:
+            reason: 记录在被取消任务上的原因
+
+        Returns:
+            List[Tuple[str, RobotTask]]: (任务ID, 任务) 列表，按接收人队列顺序
+        """
+        with self._cond:
+            drained = []
+            waiting = [task_id for queue in self._queues.values() for task_id in queue]
+            waiting += [task_id for _, _, task_id in sorted(self._retry_heap)]
+            for task_id in waiting:
+                record = self._records.get(task_id)
+                if record is None or record.status not in (DispatchStatus.QUEUED, DispatchStatus.RETRYING):
+                    continue
+                self._finish(record, DispatchStatus.CANCELLED, reason, migrated=True)
+                drained.append((record.task_id, record.task))
+            return drained
+
+    def requeue(self, drained: List[Tuple[str, RobotTask]]) -> None:
+        """
+        把 drain 取出但未能迁移的任务放回队列（不受队列容量限制）
+
+        Args:
+            drained: drain 返回的 (任务ID, 任务) 列表
+        """
+        with self._cond:
+            task_ids = set()
+            for task_id, task in drained:
+                record = self._records.get(task_id)
+                if record is None:
+                    # 记录已被历史淘汰，按原任务ID重建
+                    key = journal_key(task, task_id, self.dedupe_by_content) if self.journal is not None else None
+                    record = DispatchRecord(task_id=task_id, task=task, key=key)
+                elif record.status != DispatchStatus.CANCELLED:
+                    continue
+                record.status = DispatchStatus.QUEUED
+                record.error = None
+                record.updated_at = time.time()
+                self._enqueue(record, requeued=True)
+                self._journal(record)
+                task_ids.add(task_id)
+            if task_ids:
+                self._finished = deque(task_id for task_id in self._finished if task_id not in task_ids)
+                self._cond.notify_all()
+        if self.journal is not None and task_ids:
+            self.journal.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取分发器统计信息"""
+        with self._cond:
+            counts = {status.value: 0 for status in DispatchStatus}
+            for record in self._records.values():
+                counts[record.status.value] += 1
+            return {
+                "running": self._running,
+                "queue_depth": self._pending,
+                "max_queue_size": self.max_queue_size,
+                "status_counts": counts,
+            }
+
+    # ------------------------------------------------------------------
+    # 内部实现（以下方法除 _run / _attempt 外都需在持有 self._cond 时调用）
+    # ------------------------------------------------------------------
+    def _enqueue(self, record: DispatchRecord, requeued: bool = False) -> None:
+        """将排队状态的任务加入所属接收人的队列
+
+        Args:
+            requeued: 迁移失败放回的任务，不重复计入 queued
+        """
+        self._records[record.task_id] = record
+        self._queues.setdefault(record.task.to_user, deque()).append(record.task_id)
+        if record.key is not None:
+            self._key_index[record.key] = record.task_id
+        self._pending += 1
+        if not requeued:
+            self.metrics.queued.inc()
+        self.metrics.queue_depth.set(self._pending)
+
+    def _find_duplicate(self, key: str) -> Optional[DispatchRecord]:
+        """查找内存中未结束、或在去重窗口内已发送的同一任务"""
+        record = self._records.get(self._key_index.get(key, ""))
+        if record is None or self.journal is None:
+            return None
+        if record.status in (DispatchStatus.FAILED, DispatchStatus.CANCELLED):
+            return None
+        if record.status == DispatchStatus.SENT and time.time() - record.updated_at > self.journal.dedupe_window:
+            return None
+        return record
+
+    def _restore_delivered(self, entry: JournalEntry) -> DispatchRecord:
+        """把日志中已发送的任务恢复为内存中的记录，便于按任务ID查询"""
+        record = self._records.get(entry.task_id)
+        if record is None:
+            record = DispatchRecord(
+                task_id=entry.task_id,
+                task=entry.task,
+                status=DispatchStatus.SENT,
+                attempts=entry.attempts,
+                created_at=entry.created_at,
+                updated_at=entry.updated_at,
+                key=entry.key,
+            )
+            self._records[record.task_id] = record
+            self._key_index[entry.key] = record.task_id
+            self._finished.append(record.task_id)
+        return record
+
+    def _resume(self) -> None:
+        """从任务日志恢复未结束的任务"""
+        if self.journal is None:
+            return
+        entries = self.journal.pending()
+        for entry in entries:
+            if self._find_duplicate(entry.key) is not None:
+                continue
+            self._enqueue(DispatchRecord(
+                task_id=entry.task_id,
+                task=entry.task,
+                attempts=entry.attempts,
+                created_at=entry.created_at,
+                key=entry.key,
+            ))
+        if entries:
+            print(f"从任务日志恢复 {len(entries)} 个未完成的任务")
+
+    def _journal(self, record: DispatchRecord) -> None:
+        """记录任务的最新状态到任务日志（只写缓冲区，不等待落盘）"""
+        if self.journal is None or record.key is None:
+            return
+        self.journal.record(JournalEntry(
+            key=record.key,
+            task_id=record.task_id,
+            task=record.task,
+            status=record.status.value,
+            attempts=record.attempts,
+            error=record.error,
+            created_at=record.created_at,
+            updated_at=record.updated_at,
+        ))
+
+    def _finish(
+        self, record: DispatchRecord, status: DispatchStatus, error: Optional[str] = None, migrated: bool = False
+    ) -> None:
+        """将任务标记为结束状态，并淘汰过旧的历史记录
+
+        Args:
+            migrated: 任务被 drain 取出准备迁移，不计入 cancelled，迁移成功后由调用方计入 migrated
+        """
+        if record.status in (DispatchStatus.QUEUED, DispatchStatus.RETRYING):
+            self._pending -= 1
+            self.metrics.queue_depth.set(self._pending)
+        if status == DispatchStatus.SENT:
+            self.metrics.sent.inc()
+        elif status == DispatchStatus.FAILED:
+            self.metrics.failed.inc()
+        elif not migrated:
+            self.metrics.cancelled.inc()
+        record.status = status
+        record.error = error
+        record.updated_at = time.time()
+        self._journal(record)
+        self._finished.append(record.task_id)
+        while len(self._finished) > self.max_history:
+            evicted = self._records.pop(self._finished.popleft(), None)
+            if evicted is not None and evicted.key is not None and self._key_index.get(evicted.key) == evicted.task_id:
+                del self._key_index[evicted.key]
+        self._cond.notify_all()
+
+    def _queue_head(self, recipient: str) -> Optional[DispatchRecord]:
+        """返回接收人队列中第一个待发送的任务，顺带清理已取消的条目和空队列"""
+        queue = self._queues[recipient]
+        while queue:
+            record = self._records.get(queue[0])
+            if record is not None and record.status == DispatchStatus.QUEUED:
+                return record
+            queue.popleft()
+        del self._queues[recipient]
+        return None
+
+    def _next_ready(self, now: float) -> Tuple[Optional[DispatchRecord], Optional[float]]:
+        """
+        取出下一个可发送的任务并扣除限速令牌
+
+        Args:
+            now: 当前单调时钟时间
+
+        Returns:
+            (任务记录, None) 或 (None, 需要等待的秒数；无任务时为 None)
+        """
+        # 到期的重试任务放回所属接收人队列的队首
+        while self._retry_heap and self._retry_heap[0][0] <= now:
+            _, _, task_id = heapq.heappop(self._retry_heap)
+            record = self._records.get(task_id)
+            if record is not None and record.status == DispatchStatus.RETRYING:
+                record.status = DispatchStatus.QUEUED
+                self._queues.setdefault(record.task.to_user, deque()).appendleft(task_id)
+
+        waits: List[float] = []
+        if self._retry_heap:
+            waits.append(self._retry_heap[0][0] - now)
+
+        limiter = self.rate_limiter
+        global_delay = limiter.global_delay(now) if limiter is not None else 0.0
+        if global_delay > 0:
+            if self._queues:
+                waits.append(global_delay)
+            return None, min(waits) if waits else None
+
+        # 优先继续发送上一个接收人，其次按接收人入队顺序
+        recipients = list(self._queues)
+        last = self._last_recipient
+        if last is not None and last in self._queues:
+            recipients.remove(last)
+            recipients.insert(0, last)
+        for recipient in recipients:
+            record = self._queue_head(recipient)
+            if record is None:
+                continue
+            if limiter is not None:
+                delay = limiter.recipient_delay(recipient, now)
+                if delay > 0:
+                    waits.append(delay)
+                    continue
+                limiter.acquire(recipient, now)
+            self._queues[recipient].popleft()
+            self._last_recipient = recipient
+            return record, None
+
+        return None, min(waits) if waits else None
+
+    def _backoff(self, attempts: int) -> float:
+        """计算第 attempts 次失败后的退避时间"""
+        return min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+
+    def _attempt(self, automation: RobotAutomation, record: DispatchRecord) -> Tuple[bool, Optional[str], bool]:
+        """
+        发送一次任务（不持有锁）
+
+        Returns:
+            (是否成功, 错误信息, 是否允许重试)
+        """
+        try:
+            if self._deliver(automation, record.task):
+                return True, None, False
+            return False, "投递函数返回失败", True
+        except DispatchRejectedError as e:
+            return False, str(e), False
+        except Exception as e:
+            return False, f"{type(e).__name__}: {e}", True
+
+    def _run(self) -> None:
+        """工作线程主循环"""
+        automation = self._automation_factory()
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    record, wait = self._next_ready(time.monotonic())
+                    if record is not None:
+                        break
+                    self._cond.wait(wait)
+                self._pending -= 1
+                self.metrics.queue_depth.set(self._pending)
+                record.status = DispatchStatus.SENDING
+                record.attempts += 1
+                record.updated_at = time.time()
+                if record.attempts == 1:
+                    self.metrics.queue_wait.observe(max(record.updated_at - record.created_at, 0.0))
+                self._journal(record)
+                self._cond.notify_all()
+
+            started = time.perf_counter()
+            ok, error, retryable = self._attempt(automation, record)
+            self.metrics.observe_send(record.task.to_user, ok, time.perf_counter() - started)
+
+            with self._cond:
+                if ok:
+                    self._finish(record, DispatchStatus.SENT)
+                elif retryable and record.attempts <= self.max_retries:
+                    record.status = DispatchStatus.RETRYING
+                    record.error = error
+                    record.updated_at = time.time()
+                    backoff = self._backoff(record.attempts)
+                    record.next_attempt_at = record.updated_at + backoff
+                    self._retry_seq += 1
+                    heapq.heappush(
+                        self._retry_heap, (time.monotonic() + backoff, self._retry_seq, record.task_id)
+                    )
+                    self._pending += 1
+                    self.metrics.retries.inc()
+                    self.metrics.queue_depth.set(self._pending)
+                    self._journal(record)
+                else:
+                    self._finish(record, DispatchStatus.FAILED, error)
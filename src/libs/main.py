@@ -1,10 +1,20 @@
 import platform
-import os
-import subprocess
+import sys
 import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
-# from pynput.keyboard import Key, Controller
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.append("./src")
+from libs.metrics import metrics_registry
+from libs.transports import PrintTransport, WeChatTransport
+
+# 各阶段（open / search / type / paste / send）单次耗时，用于判断发送慢在搜索、输入还是粘贴
+STEP_DURATION = metrics_registry.histogram(
+    "robot_step_duration_seconds", "微信自动化各阶段单次耗时（秒）", ("step",),
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
 
 class WeChatState(Enum):
     """微信状态枚举"""
@@ -13,24 +23,86 @@ class WeChatState(Enum):
     SEARCHING = "searching"    # 正在搜索
     CHATTING = "chatting"      # 正在聊天
 
+class BatchItemType(Enum):
+    """批量发送条目类型"""
+    TEXT = "text"    # 文本消息
+    FILE = "file"    # 文件
+
+@dataclass(frozen=True)
+class BatchItem:
+    """批量发送的单个条目
+    
+    Attributes:
+        item_type: 条目类型
+        content: 文本内容或文件路径
+    """
+    item_type: BatchItemType
+    content: str
+
+@dataclass
+class WaitTiming:
+    """界面就绪等待的统计
+    
+    Attributes:
+        count: 等待次数
+        total_seconds: 累计等待耗时
+        timeouts: 超时次数
+    """
+    count: int = 0
+    total_seconds: float = 0.0
+    timeouts: int = 0
+
+@dataclass
+class BatchItemResult:
+    """批量发送中单个条目的结果
+    
+    Attributes:
+        index: 条目在批次中的下标
+        success: 是否发送成功
+        error: 失败原因
+    """
+    index: int
+    success: bool
+    error: Optional[str] = None
+
 class WeChatAutomation:
-    """微信自动化状态机"""
+    """微信自动化状态机
     
-    def __init__(self):
+    状态机只负责打开微信、搜索聊天和发送流程，具体的按键与剪贴板操作
+    由传输后端（libs.transports）完成，默认使用只打印操作的 PrintTransport。
+    各阶段耗时累计在 step_timings 中（同时记录到 robot_step_duration_seconds 指标），嵌套阶段的耗时计入最外层阶段；
+    每个界面就绪等待的次数、耗时和超时次数记录在 wait_timings 中。
+    """
+    
+    def __init__(self, transport: Optional[WeChatTransport] = None):
         self.current_state = WeChatState.CLOSED
+        self.current_chat: Optional[str] = None  # 当前打开的聊天对象
         self.system = platform.system().lower()
-        # self.keyboard = Controller()
-        # 根据系统设置快捷键
-        # self.cmd_key = Key.cmd if self.system == 'darwin' else Key.ctrl
+        self.transport: WeChatTransport = transport if transport is not None else PrintTransport()
+        self.step_timings: Dict[str, float] = {}  # 各阶段累计耗时（秒）
+        self.wait_timings: Dict[str, WaitTiming] = {}  # 各就绪等待步骤的统计
+        self._active_step: Optional[str] = None
     
-    def _execute_command(self, command: list, shell: bool = False) -> bool:
-        """执行系统命令"""
+    @contextmanager
+    def _timed(self, step: str) -> Iterator[None]:
+        """统计一个阶段的耗时，嵌套调用时只计入最外层阶段"""
+        if self._active_step is not None:
+            yield
+            return
+        self._active_step = step
+        started = time.perf_counter()
         try:
-            subprocess.run(command, shell=shell)
-            return True
-        except Exception as e:
-            print(f"执行命令时出错: {str(e)}")
-            return False
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.step_timings[step] = self.step_timings.get(step, 0.0) + elapsed
+            STEP_DURATION.labels(step).observe(elapsed)
+            self._active_step = None
+    
+    def reset_step_timings(self):
+        """清空阶段耗时和就绪等待统计"""
+        self.step_timings = {}
+        self.wait_timings = {}
     
     def _process_message(self, text: str) -> str:
         """处理消息文本，将特殊标记转换为实际换行符
@@ -43,168 +115,161 @@ class WeChatAutomation:
         return text.replace("{ctrl}{ENTER}", "\n")
     
     def _type_text(self, text: str):
-        """使用 pynput 输入文本"""
-        print(f"模拟输入文本: {text}")
-        # for char in text:
-        #     if char == "\n":
-        #         # 根据操作系统选择换行快捷键
-        #         if self.system == 'darwin':
-        #             # macOS 使用 Command+Enter
-        #             self.keyboard.press(Key.cmd)
-        #             self.keyboard.press(Key.enter)
-        #             self.keyboard.release(Key.enter)
-        #             self.keyboard.release(Key.cmd)
-        #         else:
-        #             # Windows 使用 Ctrl+Enter
-        #             self.keyboard.press(Key.ctrl)
-        #             self.keyboard.press(Key.enter)
-        #             self.keyboard.release(Key.enter)
-        #             self.keyboard.release(Key.ctrl)
-        #         time.sleep(0.5)  # 等待换行完成
-        #     else:
-        #         self.keyboard.type(char)
-        #         time.sleep(0.1)  # 添加延迟以确保输入稳定
+        """输入文本
+        
+        文本长度达到后端配置的粘贴阈值时通过剪贴板一次性粘贴，
+        否则逐字输入，换行符转换为不发送的换行快捷键。
+        """
+        threshold = self.transport.profile.paste_threshold
+        if 0 < threshold <= len(text) and self.transport.paste_text(text):
+            return
+        lines = text.split("\n")
+        for i, line in enumerate(lines):
+            if i > 0:
+                self.transport.press_newline()
+            if line:
+                self.transport.type_text(line)
     
     def clear_message_list(self) -> bool:
         """清空消息列表
         Returns:
             bool: 是否成功清空消息列表
         """
-        print("模拟清空消息列表")
+        self.transport.clear_input()
         return True
-        # # 全选消息列表
-        # print("全选消息列表...")
-        # self.keyboard.press(self.cmd_key)
-        # self.keyboard.press('a')
-        # self.keyboard.release('a')
-        # self.keyboard.release(self.cmd_key)
-        # time.sleep(0.5)
-        
-        # # 删除选中的消息
-        # print("删除选中的消息...")
-        # self.keyboard.press(Key.delete)
-        # self.keyboard.release(Key.delete)
-        # time.sleep(0.5)
-        
-        # print("消息列表清空完成")
-        # return True
     
     def _press_enter(self):
         """按回车键"""
-        print("模拟按回车键")
-        # self.keyboard.press(Key.enter)
-        # self.keyboard.release(Key.enter)
-        # time.sleep(0.5)  # 等待操作完成
+        self.transport.press_enter()
     
     def _press_cmd_f(self):
         """按 Command+F (macOS) 或 Ctrl+F (Windows)"""
-        print("模拟按 Command+F")
-        # self.keyboard.press(self.cmd_key)
-        # self.keyboard.press('f')
-        # self.keyboard.release('f')
-        # self.keyboard.release(self.cmd_key)
-        # time.sleep(0.5)
+        self.transport.press_find()
     
     def _press_esc(self):
         """按 ESC 键"""
-        print("模拟按 ESC 键")
-        # self.keyboard.press(Key.esc)
-        # self.keyboard.release(Key.esc)
-        # time.sleep(0.3)
+        self.transport.press_esc()
     
     def _press_cmd_v(self):
         """按 Command+V (macOS) 或 Ctrl+V (Windows)"""
-        print("模拟按 Command+V")
-        # self.keyboard.press(self.cmd_key)
-        # self.keyboard.press('v')
-        # self.keyboard.release('v')
-        # self.keyboard.release(self.cmd_key)
-        # time.sleep(0.5)
+        self.transport.press_paste()
     
     def _copy_file_to_clipboard(self, file_path: str) -> bool:
         """将文件复制到剪贴板"""
-        print(f"模拟复制文件到剪贴板: {file_path}")
-        return True
-        # if not os.path.exists(file_path):
-        #     print(f"文件不存在: {file_path}")
-        #     return False
-            
-        # try:
-        #     if self.system == 'darwin':
-        #         # macOS 使用 osascript 来复制文件到剪贴板
-        #         script = f'''
-        #         tell application "System Events"
-        #             set the clipboard to POSIX file "{file_path}"
-        #         end tell
-        #         '''
-        #         success = self._execute_command(['osascript', '-e', script])
-        #         if not success:
-        #             print("复制文件到剪贴板失败")
-        #             return False
-        #     elif self.system == 'windows':
-        #         # Windows 使用 clip
-        #         subprocess.run(['clip'], input=file_path.encode(), shell=True)
-        #     else:
-        #         print(f"不支持的操作系统: {self.system}")
-        #         return False
-        #     time.sleep(0.5)  # 等待剪贴板操作完成
-        #     return True
-        # except Exception as e:
-        #     print(f"复制文件到剪贴板时出错: {str(e)}")
-        #     return False
+        return self.transport.copy_files_to_clipboard([file_path])
+    
+    def _supports_multi_file_clipboard(self) -> bool:
+        """当前后端是否支持一次把多个文件放入剪贴板"""
+        return self.transport.supports_multi_file_clipboard()
+    
+    def _copy_files_to_clipboard(self, file_paths: List[str]) -> bool:
+        """将多个文件一次性复制到剪贴板"""
+        return self.transport.copy_files_to_clipboard(file_paths)
+    
+    def _wait_ready(self, step: str) -> bool:
+        """等待界面完成 step 步骤，并记录等待耗时"""
+        started = time.perf_counter()
+        ready = self.transport.wait_ready(step)
+        timing = self.wait_timings.setdefault(step, WaitTiming())
+        timing.count += 1
+        timing.total_seconds += time.perf_counter() - started
+        if not ready:
+            timing.timeouts += 1
+        return ready
+    
+    def _is_chat_focused(self) -> bool:
+        """校验微信窗口仍在前台、聊天输入框仍有焦点"""
+        return self.transport.is_chat_focused()
+    
+    def _invalidate_chat(self):
+        """放弃当前聊天会话，下次发送时重新搜索"""
+        if self.current_state in (WeChatState.SEARCHING, WeChatState.CHATTING):
+            self.current_state = WeChatState.OPENED
+        self.current_chat = None
     
     def open_wechat(self) -> bool:
         """打开微信"""
-        print("模拟打开微信")
+        if self.current_state != WeChatState.CLOSED:
+            return True
+        with self._timed("open"):
+            if not self.transport.activate_app():
+                return False
+            # 等待微信启动并切换到前台
+            if not self._wait_ready("launch"):
+                print("等待微信启动超时")
+                return False
+            self.current_state = WeChatState.OPENED
         return True
-        # if self.current_state == WeChatState.CLOSED:
-        #     if self.system == 'darwin':
-        #         success = self._execute_command(['osascript', '-e', 'tell application "WeChat" to activate'])
-        #     elif self.system == 'windows':
-        #         success = self._execute_command(['start', 'weixin://'], shell=True)
-        #     else:
-        #         print(f"不支持的操作系统: {self.system}")
-        #         return False
-            
-        #     if success:
-        #         self.current_state = WeChatState.OPENED
-        #         time.sleep(1)  # 等待微信启动
-        #         return True
-        # return False
     
     def search(self, keyword: str) -> bool:
         """搜索聊天 并打开聊天框"""
-        print(f"模拟搜索聊天: {keyword}")
+        if self.current_state != WeChatState.OPENED:
+            return False
+        print(f"搜索聊天: {keyword}")
+        # 发送 Command+F (macOS) 或 Ctrl+F (Windows)
+        self._press_cmd_f()
+        self._wait_ready("search_box")  # 等待搜索框出现
+        self.current_state = WeChatState.SEARCHING
+        
+        # 输入搜索关键词
+        self._type_text(keyword)
+        self._wait_ready("search_results")  # 等待搜索结果
+        
+        # 第一次按回车确认搜索
+        self._press_enter()
+        self._wait_ready("chat_open")  # 等待选中的聊天框打开
+        
+        # 第二次按回车选择第一个聊天框
+        self._press_enter()
+        self.current_state = WeChatState.CHATTING
+        self.current_chat = keyword
+        
+        # 为了重新获取输入框焦点
+        # 发送 Command+F (macOS) 或 Ctrl+F (Windows)
+        self._press_cmd_f()
+        # esc
+        self._press_esc()
+        # 清空消息列表
+        self.clear_message_list()
+        return True
+    
+    def _open_chat(self, user: str) -> bool:
+        """确保已打开与 user 的聊天框
+        
+        如果当前已在与 user 的聊天中且校验通过，直接复用该会话；
+        只有在接收人变化或校验失败时才重新搜索。
+        Args:
+            user: 接收消息的用户或群组名称
+        Returns:
+            bool: 聊天框是否已就绪
+        """
+        # 确保微信已打开
+        if not self.open_wechat():
+            print("打开微信失败")
+            return False
+        
+        if self.current_state == WeChatState.CHATTING and self.current_chat == user:
+            if self._is_chat_focused():
+                print(f"复用与 {user} 的聊天会话")
+                return True
+            print("聊天窗口校验失败，重新搜索...")
+        
+        # 如果当前在聊天状态，先退出
+        if self.current_state in (WeChatState.SEARCHING, WeChatState.CHATTING):
+            print("退出当前聊天...")
+            self._press_esc()
+            self._wait_ready("chat_closed")
+            self._invalidate_chat()
+        
+        # 先搜索用户
+        print(f"搜索用户 {user}...")
+        with self._timed("search"):
+            found = self.search(user)
+        if not found:
+            print(f"搜索用户 {user} 失败")
+            self._invalidate_chat()
+            return False
         return True
-        # if self.current_state == WeChatState.OPENED:
-        #     # 发送 Command+F (macOS) 或 Ctrl+F (Windows)
-        #     self._press_cmd_f()
-            
-        #     time.sleep(0.5)  # 等待搜索框出现
-        #     self.current_state = WeChatState.SEARCHING
-            
-        #     # 使用 pynput 输入搜索关键词
-        #     self._type_text(keyword)
-        #     time.sleep(0.5)  # 等待搜索结果
-            
-        #     # 第一次按回车确认搜索
-        #     self._press_enter()
-        #     time.sleep(0.5)  # 等待搜索结果列表
-            
-        #     # 第二次按回车选择第一个聊天框
-        #     self._press_enter()
-        #     self.current_state = WeChatState.CHATTING
-
-        #     # 为了重新获取输入框焦点
-        #     # 发送 Command+F (macOS) 或 Ctrl+F (Windows)
-        #     self._press_cmd_f()
-        #     # esc
-        #     self._press_esc()
-        #     # 清空消息列表
-        #     self.clear_message_list()
-            
-        #     return True
-        # return False
     
     def send_message(self, user: str, message: str) -> bool:
         """发送消息
@@ -212,39 +277,24 @@ class WeChatAutomation:
             user: 接收消息的用户或群组名称
             message: 要发送的消息内容，支持特殊换行符 {ctrl}{ENTER}
         """
-        print(f"模拟发送消息给 {user}: {message}")
+        print(f"开始发送消息给 {user}...")
+        print(f"当前状态: {self.current_state}")
+        try:
+            if not self._open_chat(user):
+                return False
+            # 处理消息文本
+            processed_message = self._process_message(message)
+            # 发送消息
+            with self._timed("type"):
+                self._type_text(processed_message)
+            with self._timed("send"):
+                self._press_enter()  # 最后发送消息
+        except Exception:
+            # 发送过程中出错，聊天框状态不可信，下次重新搜索
+            self._invalidate_chat()
+            raise
+        print("消息发送完成")
         return True
-        # print(f"开始发送消息给 {user}...")
-        # print(f"当前状态: {self.current_state}")
-        
-        # # 确保微信已打开
-        # if self.current_state == WeChatState.CLOSED:
-        #     if not self.open_wechat():
-        #         print("打开微信失败")
-        #         return False
-        #     time.sleep(1)  # 等待微信启动
-        
-        # # 如果当前在聊天状态，先退出
-        # if self.current_state == WeChatState.CHATTING:
-        #     print("退出当前聊天...")
-        #     self._press_esc()
-        #     time.sleep(0.5)
-        #     self.current_state = WeChatState.OPENED
-        
-        # # 先搜索用户
-        # print(f"搜索用户 {user}...")
-        # if not self.search(user):
-        #     print(f"搜索用户 {user} 失败")
-        #     return False
-            
-        # print("搜索成功，准备发送消息...")
-        # # 处理消息文本
-        # processed_message = self._process_message(message)
-        # # 发送消息
-        # self._type_text(processed_message)
-        # self._press_enter()  # 最后发送消息
-        # print("消息发送完成")
-        # return True
     
     def send_file(self, user: str, file_path: str) -> bool:
         """发送文件
@@ -252,57 +302,123 @@ class WeChatAutomation:
             user: 接收文件的用户或群组名称
             file_path: 要发送的文件路径
         """
-        print(f"模拟发送文件给 {user}: {file_path}")
+        print(f"开始发送文件给 {user}...")
+        print(f"当前状态: {self.current_state}")
+        try:
+            if not self._open_chat(user):
+                return False
+            with self._timed("paste"):
+                # 将文件复制到剪贴板
+                copied = self._copy_file_to_clipboard(file_path)
+                if copied:
+                    # 粘贴文件
+                    self._press_cmd_v()
+                    self._wait_ready("paste")  # 确保文件粘贴完成
+            if not copied:
+                print("复制文件到剪贴板失败")
+                self._invalidate_chat()
+                return False
+            # 按回车发送
+            with self._timed("send"):
+                self._press_enter()
+        except Exception:
+            self._invalidate_chat()
+            raise
+        print("文件发送完成")
         return True
-        # print(f"开始发送文件给 {user}...")
-        # print(f"当前状态: {self.current_state}")
-        
-        # # 确保微信已打开
-        # if self.current_state == WeChatState.CLOSED:
-        #     if not self.open_wechat():
-        #         print("打开微信失败")
-        #         return False
-        #     time.sleep(1)  # 等待微信启动
+    
+    def _send_file_run(self, file_paths: List[str]) -> Tuple[int, Optional[str]]:
+        """在当前聊天框中发送一组连续的文件
         
-        # # 如果当前在聊天状态，先退出
-        # if self.current_state == WeChatState.CHATTING:
-        #     print("退出当前聊天...")
-        #     self._press_esc()
-        #     time.sleep(0.5)
-        #     self.current_state = WeChatState.OPENED
+        系统支持时一次粘贴全部文件，否则逐个粘贴。
+        Returns:
+            Tuple[int, Optional[str]]: (已发送的文件数, 失败原因)，全部成功时失败原因为 None；
+            失败时前面已发送的文件不受影响，从第「已发送的文件数」个文件开始都未发送
+        """
+        if len(file_paths) > 1 and self._supports_multi_file_clipboard():
+            groups = [file_paths]
+        else:
+            groups = [[path] for path in file_paths]
+        sent = 0
+        for group in groups:
+            try:
+                with self._timed("paste"):
+                    if len(group) > 1:
+                        copied = self._copy_files_to_clipboard(group)
+                    else:
+                        copied = self._copy_file_to_clipboard(group[0])
+                    if copied:
+                        self._press_cmd_v()
+                        self._wait_ready("paste")  # 等待文件粘贴完成
+                if not copied:
+                    return sent, "复制文件到剪贴板失败"
+                with self._timed("send"):
+                    self._press_enter()
+            except Exception as e:
+                return sent, f"{type(e).__name__}: {e}"
+            sent += len(group)
+        return sent, None
+    
+    def send_batch(self, user: str, items: List[BatchItem]) -> List[BatchItemResult]:
+        """向同一接收人按顺序批量发送文本和文件
         
-        # # 先搜索用户
-        # print(f"搜索用户 {user}...")
-        # if not self.search(user):
-        #     print(f"搜索用户 {user} 失败")
-        #     return False
+        只打开一次聊天框，连续的文件合并为一次剪贴板操作（系统支持时）。
+        某个条目失败后会重新打开聊天框继续发送后续条目。
+        Args:
+            user: 接收消息的用户或群组名称
+            items: 按发送顺序排列的条目列表
+        Returns:
+            List[BatchItemResult]: 与 items 一一对应的发送结果
+        """
+        print(f"开始向 {user} 批量发送 {len(items)} 个条目...")
+        results: List[Optional[BatchItemResult]] = [None] * len(items)
+        index = 0
+        while index < len(items):
+            item = items[index]
+            # 连续的文件条目合并为一组
+            end = index + 1
+            if item.item_type == BatchItemType.FILE:
+                while end < len(items) and items[end].item_type == BatchItemType.FILE:
+                    end += 1
             
-        # print("搜索成功，准备发送文件...")
-        
-        # # 将文件复制到剪贴板
-        # print(f"复制文件到剪贴板: {file_path}")
-        # if not self._copy_file_to_clipboard(file_path):
-        #     print("复制文件到剪贴板失败")
-        #     return False
-        
-        # print("文件已复制到剪贴板，准备粘贴...")
-        # # 粘贴文件
-        # self._press_cmd_v()
-        # time.sleep(1)  # 增加等待时间，确保文件粘贴完成
+            error: Optional[str] = None
+            sent = 0  # 本组中已发送的条目数，失败时只有之后的条目标记为失败
+            try:
+                if not self._open_chat(user):
+                    error = f"打开与 {user} 的聊天失败"
+                elif item.item_type == BatchItemType.TEXT:
+                    with self._timed("type"):
+                        self._type_text(self._process_message(item.content))
+                    with self._timed("send"):
+                        self._press_enter()
+                    sent = 1
+                else:
+                    sent, error = self._send_file_run([items[i].content for i in range(index, end)])
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            if error is not None:
+                self._invalidate_chat()
+            
+            for i in range(index, end):
+                failed = error is not None and i >= index + sent
+                results[i] = BatchItemResult(index=i, success=not failed, error=error if failed else None)
+            index = end
         
-        # print("文件已粘贴，准备发送...")
-        # # 按回车发送
-        # self._press_enter()
-        # print("文件发送完成")
-        # return True
+        print("批量发送完成")
+        return [result for result in results if result is not None]
     
     def get_current_state(self) -> WeChatState:
         """获取当前状态"""
         return self.current_state
     
+    def get_current_chat(self) -> Optional[str]:
+        """获取当前打开的聊天对象"""
+        return self.current_chat
+    
     def reset(self):
         """重置状态机"""
         self.current_state = WeChatState.CLOSED
+        self.current_chat = None
 
 def main():
     # 测试状态机
@@ -322,6 +438,16 @@ def main():
         print("文件发送成功")
     else:
         print("文件发送失败")
+    
+    # 批量发送
+    print("尝试批量发送...")
+    results = wechat.send_batch("文件传输助手", [
+        BatchItem(BatchItemType.TEXT, "第一条消息"),
+        BatchItem(BatchItemType.FILE, file_path),
+        BatchItem(BatchItemType.FILE, file_path),
+        BatchItem(BatchItemType.TEXT, "最后一条消息"),
+    ])
+    print(f"批量发送结果: {results}")
 
 if __name__ == "__main__":
     main()
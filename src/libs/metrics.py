@@ -0,0 +1,414 @@
+"""
+指标模块
+
+提供 Prometheus 文本格式的计数器（Counter）、仪表（Gauge）和直方图（Histogram）：
+- 更新只做一次字典查找和数值加法，不加锁，锁只在第一次出现某个标签组合时使用。
+  HTTP 指标在事件循环线程中更新；多个线程同时更新同一个标签组合时极少数情况下可能丢失一次计数，
+  对监控数据可以接受
+- 直方图的桶在创建标签组合时预先分配，观测时二分查找所在的桶，输出时再累加
+- 多 worker 部署时，每个 worker 定期把自己的快照写入共享目录（按 worker 编号命名），
+  输出指标时读取所有 worker 的快照并汇总；重新拉起的 worker 从同编号的快照继续累加计数器和直方图，
+  保证汇总后的计数器单调递增
+
+使用示例：
+    requests = metrics_registry.counter("app_requests_total", "请求数", ("route",))
+    requests.labels("/api/x").inc()
+    print(metrics_registry.render())
+"""
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认的耗时直方图桶（秒）
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _CounterValue:
+    """单个标签组合的计数器值"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        self.value += amount
+
+    def reset(self) -> None:
+        self.value = 0.0
+
+
+class _GaugeValue:
+    """单个标签组合的仪表值"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def reset(self) -> None:
+        self.value = 0.0
+
+
+class _HistogramValue:
+    """单个标签组合的直方图值，counts[i] 为落在第 i 个桶（不累加）的观测数"""
+
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]) -> None:
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * len(upper_bounds)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.upper_bounds)
+        self.sum = 0.0
+
+
+class _Metric:
+    """指标基类，按标签值组合保存各自的值"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()  # 只在创建新的标签组合时使用
+
+    def _new_value(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        """
+        获取标签值组合对应的值对象，不存在时创建
+
+        Raises:
+            ValueError: 当标签值个数与标签名个数不一致时抛出
+        """
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                value = self._values.setdefault(tuple(str(v) for v in values), self._new_value())
+        return value
+
+    def reset(self) -> None:
+        """清零所有值（保留值对象，调用方缓存的值对象仍然有效）"""
+        for value in list(self._values.values()):
+            value.reset()
+
+    def samples(self) -> List[List[Any]]:
+        """快照：[[标签值列表, 值], ...]"""
+        return [[list(labels), value.value] for labels, value in list(self._values.items())]
+
+    def load(self, samples: Iterable[List[Any]]) -> None:
+        """在当前值上累加快照中的值"""
+        for labels, number in samples:
+            self.labels(*labels).value += number
+
+    def describe(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    """只增不减的计数器，如请求数、错误数"""
+
+    type_name = "counter"
+
+    def _new_value(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """无标签计数器加 amount"""
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """可增可减的仪表，如进行中的请求数、队列长度"""
+
+    type_name = "gauge"
+
+    def _new_value(self) -> _GaugeValue:
+        return _GaugeValue()
+
+    def set(self, value: float) -> None:
+        """设置无标签仪表的值"""
+        self.labels().set(value)
+
+    def load(self, samples: Iterable[List[Any]]) -> None:
+        # 仪表反映的是某个时刻的状态，不从旧快照继承
+        pass
+
+
+class Histogram(_Metric):
+    """直方图，如请求耗时、响应大小"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """
+        Args:
+            buckets: 桶的上界（升序），自动补上 +Inf
+
+        Raises:
+            ValueError: 当桶的上界不是升序时抛出
+        """
+        super().__init__(name, documentation, labelnames)
+        upper_bounds = [float(b) for b in buckets]
+        if upper_bounds != sorted(set(upper_bounds)):
+            raise ValueError("直方图的桶必须升序且不重复")
+        if not upper_bounds or upper_bounds[-1] != math.inf:
+            upper_bounds.append(math.inf)
+        self.upper_bounds = tuple(upper_bounds)
+
+    def _new_value(self) -> _HistogramValue:
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value: float) -> None:
+        """无标签直方图记录一次观测"""
+        self.labels().observe(value)
+
+    def samples(self) -> List[List[Any]]:
+        """快照：[[标签值列表, 各桶计数, 总和], ...]"""
+        return [[list(labels), list(value.counts), value.sum] for labels, value in list(self._values.items())]
+
+    def load(self, samples: Iterable[List[Any]]) -> None:
+        for labels, counts, total in samples:
+            if len(counts) != len(self.upper_bounds):
+                continue  # 桶定义已变化，旧数据无法合并
+            value = self.labels(*labels)
+            for i, count in enumerate(counts):
+                value.counts[i] += count
+            value.sum += total
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "buckets": [_format_number(b) for b in self.upper_bounds]}
+
+
+def _format_number(value: float) -> str:
+    """Prometheus 文本格式的数值"""
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    同名指标只创建一次，重复注册返回已有的指标（类型或标签不一致时报错）。
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir: Optional[str] = None  # 多 worker 快照目录，None 表示单进程
+        self.worker_id: Optional[int] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._stop_flusher = threading.Event()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is None:
+                self._metrics[metric.name] = metric
+                return metric
+        if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+            raise ValueError(f"指标 {metric.name} 已以不同的类型或标签注册")
+        return existing
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前进程的指标快照（可 JSON 序列化）"""
+        return {
+            "worker": self.worker_id,
+            "pid": os.getpid(),
+            "metrics": {
+                name: {**metric.describe(), "samples": metric.samples()}
+                for name, metric in list(self._metrics.items())
+            },
+        }
+
+    # ---- 多 worker 汇总 ----
+
+    def _snapshot_path(self, worker_id: int) -> str:
+        assert self.multiprocess_dir is not None
+        return os.path.join(self.multiprocess_dir, f"worker-{worker_id}.json")
+
+    def set_multiprocess_dir(self, directory: str) -> None:
+        """
+        主进程在 fork worker 之前调用，设置快照目录并清除上次运行留下的快照
+
+        Args:
+            directory: 快照目录，不存在时创建
+        """
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "worker-*.json")):
+            os.remove(path)
+        self.multiprocess_dir = directory
+
+    def start_worker(self, worker_id: int, flush_interval: float = 5.0) -> None:
+        """
+        worker 进程启动时调用：清零从主进程继承的值，从同编号的旧快照继续累加，并启动定期写快照的线程
+
+        Args:
+            worker_id: worker 编号
+            flush_interval: 写快照的间隔（秒）
+        """
+        self.worker_id = worker_id
+        for metric in list(self._metrics.values()):
+            metric.reset()
+        if self.multiprocess_dir is None:
+            return
+        try:
+            with open(self._snapshot_path(worker_id), encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        if previous is not None:
+            for name, data in previous.get("metrics", {}).items():
+                existing = self._metrics.get(name)
+                if existing is not None and existing.type_name == data.get("type"):
+                    existing.load(data.get("samples", []))
+        self._stop_flusher = stop = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_loop, args=(stop, flush_interval), name="metrics-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def _flush_loop(self, stop: threading.Event, interval: float) -> None:
+        while not stop.wait(interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"写入指标快照失败: {e}")
+
+    def flush(self) -> None:
+        """把当前 worker 的快照写入共享目录（先写临时文件再替换，读取方不会读到不完整的文件）"""
+        if self.multiprocess_dir is None or self.worker_id is None:
+            return
+        path = self._snapshot_path(self.worker_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """所有 worker 的快照；单进程时只有当前进程的快照"""
+        if self.multiprocess_dir is None or self.worker_id is None:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.multiprocess_dir, "worker-*.json"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # worker 已被清理或快照损坏
+        return snapshots
+
+    # ---- 输出 ----
+
+    def render(self) -> str:
+        """
+        Prometheus 文本格式（version 0.0.4）的指标，多 worker 时为所有 worker 的汇总
+
+        Returns:
+            str: 指标文本
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        for snapshot in self.collect():
+            for name, data in snapshot.get("metrics", {}).items():
+                family = merged.setdefault(name, {**data, "values": {}})
+                if family["type"] != data["type"] or family.get("buckets") != data.get("buckets"):
+                    continue  # 不同版本的 worker 定义不一致，跳过
+                values = family["values"]
+                for sample in data["samples"]:
+                    labels = tuple(sample[0])
+                    if data["type"] == "histogram":
+                        current = values.get(labels)
+                        if current is None:
+                            values[labels] = [list(sample[1]), sample[2]]
+                        else:
+                            current[0] = [a + b for a, b in zip(current[0], sample[1])]
+                            current[1] += sample[2]
+                    else:
+                        values[labels] = values.get(labels, 0.0) + sample[1]
+
+        lines: List[str] = []
+        for name in sorted(merged):
+            family = merged[name]
+            labelnames = family["labelnames"]
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for labels, value in sorted(family["values"].items()):
+                if family["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_number(value)}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(family["buckets"], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_number(total)}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
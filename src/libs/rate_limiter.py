@@ -0,0 +1,119 @@
+"""
+发送限速模块
+
+使用令牌桶对机器人发送进行限速，避免短时间内大量发送导致客户端被限流：
+- 全局令牌桶限制整体发送速率
+- 每个接收人一个令牌桶，限制对同一群的连续发送
+
+限速器本身不做任何等待，只告诉调用方还需要等待多久，
+由调度器决定在等待期间先发送其他接收人的任务。
+"""
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    Attributes:
+        rate: 每秒补充的令牌数
+        burst: 桶容量，即允许的最大突发发送数
+    """
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("令牌桶速率必须大于 0，容量不能小于 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = now if now is not None else time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """按流逝时间补充令牌"""
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def delay(self, now: float) -> float:
+        """距离可以取得一个令牌还需等待的秒数，0 表示立即可取"""
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        """取走一个令牌（调用前应确认 delay 为 0）"""
+        self._refill(now)
+        self._tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """令牌桶是否已满（满桶与新建的桶等价）"""
+        self._refill(now)
+        return self._tokens >= self.burst
+
+
+class SendRateLimiter:
+    """
+    全局 + 按接收人的发送限速器
+
+    任一速率为 None 时表示不对该维度限速。
+    """
+
+    # 空闲接收人令牌桶超过该数量时清理满桶
+    MAX_IDLE_BUCKETS: int = 1000
+
+    def __init__(
+        self,
+        global_rate: Optional[float] = None,
+        global_burst: float = 1,
+        recipient_rate: Optional[float] = None,
+        recipient_burst: float = 1,
+    ) -> None:
+        """
+        初始化限速器
+
+        Args:
+            global_rate: 全局每秒发送数
+            global_burst: 全局突发容量
+            recipient_rate: 每个接收人每秒发送数
+            recipient_burst: 每个接收人突发容量
+        """
+        self._global = TokenBucket(global_rate, global_burst) if global_rate else None
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self._recipients: Dict[str, TokenBucket] = {}
+
+    def _recipient_bucket(self, recipient: str, now: float) -> Optional[TokenBucket]:
+        if not self.recipient_rate:
+            return None
+        bucket = self._recipients.get(recipient)
+        if bucket is None:
+            if len(self._recipients) >= self.MAX_IDLE_BUCKETS:
+                self._recipients = {
+                    name: b for name, b in self._recipients.items() if not b.is_full(now)
+                }
+            bucket = TokenBucket(self.recipient_rate, self.recipient_burst, now)
+            self._recipients[recipient] = bucket
+        return bucket
+
+    def global_delay(self, now: float) -> float:
+        """全局令牌桶还需等待的秒数"""
+        return self._global.delay(now) if self._global is not None else 0.0
+
+    def recipient_delay(self, recipient: str, now: float) -> float:
+        """接收人令牌桶还需等待的秒数"""
+        bucket = self._recipient_bucket(recipient, now)
+        return bucket.delay(now) if bucket is not None else 0.0
+
+    def delay(self, recipient: str, now: float) -> float:
+        """向 recipient 发送一条消息还需等待的秒数"""
+        return max(self.global_delay(now), self.recipient_delay(recipient, now))
+
+    def acquire(self, recipient: str, now: float) -> None:
+        """记录一次向 recipient 的发送"""
+        if self._global is not None:
+            self._global.consume(now)
+        bucket = self._recipient_bucket(recipient, now)
+        if bucket is not None:
+            bucket.consume(now)
@@ -0,0 +1,368 @@
+"""
+分片任务分发模块
+
+把机器人任务分散到多个发送后端（多个微信账号或多台机器上的代理），
+每个后端（分片）有自己的 TaskDispatcher 和工作线程，各分片并行发送：
+- 按 to_user 一致性哈希选择分片，同一个群始终由同一个账号发送
+- 分片连续发送失败或健康检查失败时摘除，其未发送的任务迁移到其他分片
+- 摘除的分片恢复健康（无健康检查时为一个检查周期后）重新加入哈希环
+- 统计每个分片的发送数量和吞吐
+"""
+import bisect
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from libs.dispatcher import DeliverFunc, DispatchQueueFullError, DispatchRecord, RobotAutomation, SubmitResult, TaskDispatcher
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask
+
+
+class ConsistentHashRing:
+    """
+    一致性哈希环
+
+    每个节点在环上放置 replicas 个虚拟节点，节点增减时只有相邻区间的键会改变归属。
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 100) -> None:
+        self.replicas = replicas
+        self._points: List[int] = []         # 排序后的虚拟节点位置
+        self._owners: Dict[int, str] = {}    # 虚拟节点位置 -> 节点
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def add(self, node: str) -> None:
+        """加入节点"""
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: str) -> None:
+        """移除节点"""
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: n for p, n in self._owners.items() if n != node}
+
+    @property
+    def nodes(self) -> Set[str]:
+        """环上的所有节点"""
+        return set(self._owners.values())
+
+    def get(self, key: str) -> Optional[str]:
+        """返回 key 所属的节点，环为空时返回 None"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+@dataclass
+class ShardSpec:
+    """
+    分片配置
+
+    Attributes:
+        name: 分片名称
+        automation_factory: 创建该分片自动化实例（本地 WeChatAutomation 或远程代理）的工厂
+        health_check: 健康检查函数，None 表示只根据发送结果判断
+    """
+    name: str
+    automation_factory: Callable[[], RobotAutomation]
+    health_check: Optional[Callable[[], bool]] = None
+
+
+@dataclass
+class ShardState:
+    """
+    分片运行状态
+
+    Attributes:
+        spec: 分片配置
+        dispatcher: 分片的任务分发器
+        healthy: 是否在哈希环上
+        consecutive_failures: 连续发送失败次数
+        sent: 发送成功数
+        failed: 发送失败次数（含重试）
+        busy_seconds: 发送累计耗时
+    """
+    spec: ShardSpec
+    dispatcher: TaskDispatcher
+    healthy: bool = True
+    consecutive_failures: int = 0
+    sent: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    started_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的统计信息"""
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "name": self.spec.name,
+            "healthy": self.healthy,
+            "consecutive_failures": self.consecutive_failures,
+            "sent": self.sent,
+            "failed": self.failed,
+            "queue_depth": self.dispatcher.stats()["queue_depth"],
+            # 发送期间的吞吐（条/秒）和自启动以来的平均吞吐
+            "busy_throughput": self.sent / self.busy_seconds if self.busy_seconds else 0.0,
+            "throughput": self.sent / elapsed,
+        }
+
+
+class ShardedDispatcher:
+    """
+    多分片任务分发器
+
+    对外提供与 TaskDispatcher 相同的 start / stop / close / submit / get / cancel / stats 接口。
+    """
+
+    def __init__(
+        self,
+        shards: List[ShardSpec],
+        deliver: DeliverFunc,
+        dispatcher_factory: Optional[Callable[[ShardSpec, DeliverFunc], TaskDispatcher]] = None,
+        max_consecutive_failures: int = 3,
+        health_interval: float = 10.0,
+    ) -> None:
+        """
+        初始化分片分发器
+
+        Args:
+            shards: 分片配置列表
+            deliver: 投递函数
+            dispatcher_factory: 为分片创建 TaskDispatcher 的工厂，可用于配置限速和任务日志
+            max_consecutive_failures: 连续失败达到该次数时摘除分片
+            health_interval: 健康检查间隔（秒）
+        """
+        if not shards:
+            raise ValueError("至少需要一个分片")
+        self._deliver = deliver
+        self.max_consecutive_failures = max_consecutive_failures
+        self.health_interval = health_interval
+
+        factory = dispatcher_factory or (
+            lambda spec, wrapped: TaskDispatcher(
+                deliver=wrapped, automation_factory=spec.automation_factory, name=spec.name
+            )
+        )
+        self._lock = threading.Lock()
+        self._shards: Dict[str, ShardState] = {}
+        for spec in shards:
+            dispatcher = factory(spec, self._wrap_deliver(spec.name))
+            self._shards[spec.name] = ShardState(spec=spec, dispatcher=dispatcher)
+        self._ring = ConsistentHashRing(list(self._shards))
+
+        self._wakeup = threading.Event()
+        self._running = False
+        self._monitor: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """启动所有分片和健康监控线程"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        for shard in self._shards.values():
+            shard.dispatcher.start()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="robot-shard-monitor", daemon=True)
+        self._monitor.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止所有分片"""
+        with self._lock:
+            self._running = False
+        self._wakeup.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout)
+            self._monitor = None
+        for shard in self._shards.values():
+            shard.dispatcher.stop(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """停止所有分片并关闭各自的任务日志"""
+        self.stop(timeout)
+        for shard in self._shards.values():
+            shard.dispatcher.close(timeout)
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def route(self, to_user: str) -> str:
+        """返回接收人当前所属的分片名称"""
+        with self._lock:
+            owner = self._ring.get(to_user)
+        # 最后一个分片永远不会被摘除，哈希环不会为空
+        assert owner is not None
+        return owner
+
+    def submit(
+        self,
+        tasks: List[RobotTask],
+        timeout: Optional[float] = 0.0,
+        task_ids: Optional[List[str]] = None,
+    ) -> SubmitResult:
+        """
+        按接收人路由并批量提交任务
+
+        所有分片都接受后才算成功；任一分片队列已满时撤销已提交的部分（不包括与已有任务重复的任务）
+        并抛出 DispatchQueueFullError。
+        """
+        self.start()
+        groups: Dict[str, List[int]] = {}
+        for i, task in enumerate(tasks):
+            groups.setdefault(self.route(task.to_user), []).append(i)
+
+        result = SubmitResult(task_ids=[""] * len(tasks))
+        submitted: List[Tuple[str, SubmitResult]] = []
+        try:
+            for name, indexes in groups.items():
+                shard_result = self._shards[name].dispatcher.submit(
+                    [tasks[i] for i in indexes],
+                    timeout,
+                    [task_ids[i] for i in indexes] if task_ids is not None else None,
+                )
+                submitted.append((name, shard_result))
+                for i, task_id in zip(indexes, shard_result.task_ids):
+                    result.task_ids[i] = task_id
+                result.deduplicated.extend(shard_result.deduplicated)
+        except DispatchQueueFullError:
+            for name, shard_result in submitted:
+                for task_id in set(shard_result.task_ids) - set(shard_result.deduplicated):
+                    self._shards[name].dispatcher.cancel(task_id)
+            raise
+        return result
+
+    def get(self, task_id: str) -> Optional[DispatchRecord]:
+        """查询任务记录；任务被迁移过时返回最新的一条"""
+        records = [
+            record for record in (shard.dispatcher.get(task_id) for shard in self._shards.values())
+            if record is not None
+        ]
+        if not records:
+            return None
+        return max(records, key=lambda record: record.updated_at)
+
+    def cancel(self, task_id: str) -> bool:
+        """取消尚未发送的任务"""
+        return any(shard.dispatcher.cancel(task_id) for shard in self._shards.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """汇总所有分片的统计信息"""
+        shard_stats = [shard.dispatcher.stats() for shard in self._shards.values()]
+        counts: Dict[str, int] = {}
+        for stats in shard_stats:
+            for status, count in stats["status_counts"].items():
+                counts[status] = counts.get(status, 0) + count
+        with self._lock:
+            shards = [shard.to_dict() for shard in self._shards.values()]
+        return {
+            "running": self._running,
+            "queue_depth": sum(stats["queue_depth"] for stats in shard_stats),
+            "max_queue_size": sum(stats["max_queue_size"] for stats in shard_stats),
+            "status_counts": counts,
+            "shards": shards,
+        }
+
+    # ------------------------------------------------------------------
+    # 健康管理
+    # ------------------------------------------------------------------
+    def _wrap_deliver(self, name: str) -> DeliverFunc:
+        """包装投递函数，记录分片的发送结果"""
+        def deliver(automation: RobotAutomation, task: RobotTask) -> bool:
+            started = time.perf_counter()
+            ok = False
+            try:
+                ok = self._deliver(automation, task)
+                return ok
+            finally:
+                self._on_result(name, ok, time.perf_counter() - started)
+        return deliver
+
+    def _on_result(self, name: str, ok: bool, seconds: float) -> None:
+        """更新分片统计，连续失败过多时通知监控线程摘除分片"""
+        with self._lock:
+            shard = self._shards[name]
+            shard.busy_seconds += seconds
+            if ok:
+                shard.sent += 1
+                shard.consecutive_failures = 0
+                return
+            shard.failed += 1
+            shard.consecutive_failures += 1
+            should_evict = shard.healthy and shard.consecutive_failures >= self.max_consecutive_failures
+        if should_evict:
+            self._wakeup.set()
+
+    def _evict(self, name: str) -> None:
+        """摘除分片，并把它尚未发送的任务迁移到新的归属分片"""
+        with self._lock:
+            shard = self._shards[name]
+            if not shard.healthy or len(self._ring.nodes) <= 1:
+                # 最后一个健康分片不摘除，任务留在原地等待恢复
+                return
+            shard.healthy = False
+            self._ring.remove(name)
+        self._migrate(name)
+
+    def _migrate(self, name: str) -> None:
+        """
+        把摘除分片尚未发送的任务迁移到新的归属分片
+
+        迁移成功后才计入 migrated；目标分片队列已满时把任务放回原分片，下个检查周期重试。
+        """
+        shard = self._shards[name]
+        drained = shard.dispatcher.drain(f"分片 {name} 不可用，任务已迁移")
+        if not drained:
+            return
+        try:
+            self.submit([task for _, task in drained], 30.0, [task_id for task_id, _ in drained])
+        except DispatchQueueFullError as e:
+            shard.dispatcher.requeue(drained)
+            print(f"迁移分片 {name} 的 {len(drained)} 个任务失败，已放回原分片等待重试: {str(e)}")
+            return
+        shard.dispatcher.metrics.migrated.inc(len(drained))
+        print(f"分片 {name} 不可用，迁移 {len(drained)} 个任务")
+
+    def _restore(self, name: str) -> None:
+        """分片恢复健康后重新加入哈希环"""
+        with self._lock:
+            shard = self._shards[name]
+            if shard.healthy:
+                return
+            shard.healthy = True
+            shard.consecutive_failures = 0
+            self._ring.add(name)
+        print(f"分片 {name} 已恢复")
+
+    def _monitor_loop(self) -> None:
+        """健康监控线程：处理连续失败的分片，并定期执行健康检查"""
+        while True:
+            self._wakeup.wait(self.health_interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._running:
+                    return
+                shards = list(self._shards.values())
+            for shard in shards:
+                name = shard.spec.name
+                check = shard.spec.health_check
+                healthy = check() if check is not None else True
+                if shard.healthy and (not healthy or shard.consecutive_failures >= self.max_consecutive_failures):
+                    self._evict(name)
+                elif not shard.healthy and healthy:
+                    # 没有健康检查的分片在摘除一个检查周期后重新尝试
+                    self._restore(name)
+                elif not shard.healthy and shard.dispatcher.stats()["queue_depth"]:
+                    # 上次迁移失败放回的任务
+                    self._migrate(name)
@@ -0,0 +1,308 @@
+"""
+机器人任务日志（journal）
+
+以 SQLite（WAL 模式）持久化每个 RobotTask 的分发状态，进程崩溃重启后可以：
+- 跳过已经发送过的任务，避免重复发送
+- 恢复尚未发送完成的任务，避免丢失
+
+每个任务以日志键标识（见 journal_key）：调用方提供幂等键时按幂等键去重；
+可选按内容哈希去重；两者都没有时以任务ID为键，只用于崩溃恢复，不去重。
+状态更新先写入内存缓冲区，由后台线程按批次提交，每批只触发一次 fsync，
+日志写入不会明显增加单个任务的发送耗时。
+"""
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask, RobotTaskType
+
+
+# 日志键的前缀：调用方提供的幂等键 / 任务ID（内容哈希键为不带前缀的十六进制串）
+CLIENT_KEY_PREFIX = "client:"
+TASK_KEY_PREFIX = "task:"
+
+
+def content_key(task: RobotTask) -> str:
+    """
+    按任务内容计算日志键
+
+    文本任务对内容本身取哈希；文件任务优先对文件内容取哈希，
+    这样重新生成的同一张图片（文件名不同）也会被识别为同一个任务。
+    """
+    content_hash = hashlib.sha256()
+    if task.task_type != RobotTaskType.TEXT_TYPE.value and os.path.isfile(task.content):
+        with open(task.content, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                content_hash.update(chunk)
+    else:
+        content_hash.update(str(task.content).encode('utf-8'))
+    key = hashlib.sha256()
+    key.update(f"{task.to_user}\0{task.task_type}\0".encode('utf-8'))
+    key.update(content_hash.digest())
+    return key.hexdigest()
+
+
+def journal_key(task: RobotTask, task_id: str, dedupe_by_content: bool = False) -> str:
+    """
+    计算任务在日志中的键，键相同的任务视为同一个任务
+
+    Args:
+        task: 机器人任务
+        task_id: 任务ID
+        dedupe_by_content: 调用方没有提供幂等键时是否按内容去重
+
+    Returns:
+        str: 调用方提供了幂等键（task.idempotency_key）时为该幂等键；
+        否则开启 dedupe_by_content 时为内容哈希；都没有时为任务ID（不会与其他任务重复）
+    """
+    if task.idempotency_key:
+        return CLIENT_KEY_PREFIX + task.idempotency_key
+    if dedupe_by_content:
+        return content_key(task)
+    return TASK_KEY_PREFIX + task_id
+
+
+@dataclass
+class JournalEntry:
+    """
+    日志中的一条任务记录
+
+    Attributes:
+        key: 日志键（见 journal_key）
+        task_id: 任务ID
+        task: 机器人任务
+        status: 分发状态（与 DispatchStatus 的取值一致）
+        attempts: 已尝试发送次数
+        error: 最近一次失败的错误信息
+        created_at: 入队时间戳
+        updated_at: 最近一次状态变更时间戳
+    """
+    key: str
+    task_id: str
+    task: RobotTask
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+
+def _reopen_after_fork(ref: "weakref.ref[TaskJournal]") -> None:
+    journal = ref()
+    if journal is not None:
+        journal._after_fork()
+
+
+class TaskJournal:
+    """
+    基于 SQLite 的任务日志
+
+    特点：
+    - WAL 模式 + synchronous=FULL，每次提交都会落盘
+    - 状态更新批量提交：缓冲区满 flush_batch 条或每隔 flush_interval 秒提交一次
+    - 入队记录可通过 flush() 立即落盘，保证已接受的任务不会丢失
+    """
+
+    # 未结束的状态，重启后需要恢复
+    PENDING_STATUSES: Tuple[str, ...] = ("queued", "sending", "retrying")
+    SENT_STATUS: str = "sent"
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.2,
+        flush_batch: int = 200,
+        dedupe_window: float = 12 * 3600,
+        retention: float = 7 * 24 * 3600,
+    ) -> None:
+        """
+        打开（或创建）任务日志
+
+        Args:
+            path: SQLite 数据库文件路径
+            flush_interval: 后台批量提交的间隔（秒）
+            flush_batch: 缓冲区达到该条数时立即提交
+            dedupe_window: 已发送任务在该时间窗口内（秒）视为重复
+            retention: 超过该时间（秒）的已结束记录在打开时清理
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.dedupe_window = dedupe_window
+
+        self._db_lock = threading.Lock()         # 保护数据库连接
+        self._buffer_lock = threading.Condition()  # 保护写缓冲区
+        self._buffer: Dict[str, JournalEntry] = {}  # 日志键 -> 最新记录（同一任务只保留最后一次更新）
+        self._closed = False
+
+        self._conn = self._connect()
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS robot_tasks (
+                key TEXT PRIMARY KEY,
+                task_id TEXT NOT NULL,
+                to_user TEXT NOT NULL,
+                task_type INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_robot_tasks_status ON robot_tasks(status)")
+        self._conn.execute(
+            "DELETE FROM robot_tasks WHERE status NOT IN (?, ?, ?) AND updated_at < ?",
+            (*self.PENDING_STATUSES, time.time() - retention),
+        )
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="robot-task-journal", daemon=True)
+        self._flusher.start()
+        # 多 worker 模式下主进程打开日志后 fork，子进程需要重新连接
+        self._inherited_conns: List[sqlite3.Connection] = []
+        os.register_at_fork(after_in_child=functools.partial(_reopen_after_fork, weakref.ref(self)))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _after_fork(self) -> None:
+        """
+        fork 后在子进程中重新连接数据库并启动提交线程
+
+        SQLite 连接不能跨 fork 使用，继承的连接只保留引用、不再使用也不关闭（关闭会影响父进程的锁）；
+        缓冲区中的更新由父进程提交，子进程丢弃。
+        """
+        if self._closed:
+            return
+        self._inherited_conns.append(self._conn)
+        self._db_lock = threading.Lock()
+        self._buffer_lock = threading.Condition()
+        self._buffer = {}
+        self._conn = self._connect()
+        self._flusher = threading.Thread(target=self._flush_loop, name="robot-task-journal", daemon=True)
+        self._flusher.start()
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def record(self, entry: JournalEntry) -> None:
+        """缓冲一条状态更新，由后台线程批量提交"""
+        with self._buffer_lock:
+            self._buffer[entry.key] = entry
+            if len(self._buffer) >= self.flush_batch:
+                self._buffer_lock.notify()
+
+    def flush(self) -> None:
+        """立即提交缓冲区中的所有更新"""
+        # 取出缓冲区与写库在同一把锁内完成，避免并发提交时旧状态覆盖新状态
+        with self._db_lock:
+            with self._buffer_lock:
+                entries = list(self._buffer.values())
+                self._buffer.clear()
+            if not entries:
+                return
+            rows = [
+                (e.key, e.task_id, e.task.to_user, e.task.task_type, str(e.task.content),
+                 e.status, e.attempts, e.error, e.created_at, e.updated_at)
+                for e in entries
+            ]
+            # 一个事务提交整批更新，只触发一次 fsync
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO robot_tasks
+                        (key, task_id, to_user, task_type, content, status, attempts, error, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        task_id = excluded.task_id,
+                        status = excluded.status,
+                        attempts = excluded.attempts,
+                        error = excluded.error,
+                        created_at = excluded.created_at,
+                        updated_at = excluded.updated_at
+                    """,
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _flush_loop(self) -> None:
+        """后台批量提交线程"""
+        while True:
+            with self._buffer_lock:
+                if self._closed:
+                    return
+                self._buffer_lock.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"任务日志写入失败: {str(e)}")
+
+    def close(self) -> None:
+        """提交剩余更新并关闭日志"""
+        with self._buffer_lock:
+            self._closed = True
+            self._buffer_lock.notify()
+        self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _row_to_entry(self, row: tuple) -> JournalEntry:
+        key, task_id, to_user, task_type, content, status, attempts, error, created_at, updated_at = row
+        client_key = key[len(CLIENT_KEY_PREFIX):] if key.startswith(CLIENT_KEY_PREFIX) else None
+        return JournalEntry(
+            key=key,
+            task_id=task_id,
+            task=RobotTask(to_user=to_user, content=content, task_type=task_type, idempotency_key=client_key),
+            status=status,
+            attempts=attempts,
+            error=error,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+    def find_delivered(self, key: str) -> Optional[JournalEntry]:
+        """查找去重窗口内已发送的同一任务"""
+        with self._buffer_lock:
+            entry = self._buffer.get(key)
+        if entry is None:
+            with self._db_lock:
+                row = self._conn.execute("SELECT * FROM robot_tasks WHERE key = ?", (key,)).fetchone()
+            entry = self._row_to_entry(row) if row is not None else None
+        if entry is None or entry.status != self.SENT_STATUS:
+            return None
+        if time.time() - entry.updated_at > self.dedupe_window:
+            return None
+        return entry
+
+    def pending(self) -> List[JournalEntry]:
+        """返回所有未结束的任务（按入队顺序），用于重启后恢复分发"""
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT * FROM robot_tasks WHERE status IN (?, ?, ?) ORDER BY created_at",
+                self.PENDING_STATUSES,
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
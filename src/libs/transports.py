@@ -0,0 +1,507 @@
+"""
+微信自动化传输后端
+
+WeChatAutomation 只负责状态机（打开微信、搜索聊天、发送消息），
+具体的键盘、剪贴板操作由传输后端完成：
+- PrintTransport: 只打印操作，不做任何真实输入（默认后端）
+- KeyboardTransport: 使用 pynput / pyautogui 操作真实键盘和剪贴板
+- SimulatedTransport: 按可配置的延迟模型休眠，用于测量分发吞吐
+
+界面就绪等待不再使用固定的 sleep：能观测到的条件（微信是否在前台、剪贴板是否已写入）
+通过 wait_until 短间隔轮询，观测不到的步骤使用按操作系统区分的 TimingProfile 中的等待时间。
+"""
+import os
+import platform
+import random
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Callable, Dict, List, Optional
+
+
+def wait_until(condition: Callable[[], bool], timeout: float, interval: float = 0.05) -> bool:
+    """
+    轮询等待条件成立
+
+    Args:
+        condition: 就绪条件
+        timeout: 最长等待时间（秒）
+        interval: 轮询间隔（秒）
+
+    Returns:
+        bool: 超时前条件是否成立
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if condition():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+
+
+# PowerShell 把这些字符都当作单引号，单引号字符串中需要重复一次转义
+_POWERSHELL_SINGLE_QUOTES = "'‘’‚‛"
+
+
+def _powershell_quote(value: str) -> str:
+    """把 value 转换为 PowerShell 单引号字符串字面量（其中不做变量展开）"""
+    escaped = "".join(char * 2 if char in _POWERSHELL_SINGLE_QUOTES else char for char in value)
+    return f"'{escaped}'"
+
+
+def _applescript_quote(value: str) -> str:
+    """把 value 转换为 AppleScript 双引号字符串字面量"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+@dataclass
+class TimingProfile:
+    """
+    界面操作的等待参数（单位：秒）
+
+    Attributes:
+        poll_interval: 轮询就绪条件的间隔
+        launch_timeout: 等待微信切换到前台的超时
+        clipboard_timeout: 等待剪贴板写入完成的超时
+        key_delay: 每次按键后的等待
+        char_delay: 逐字输入时每个字符后的等待
+        paste_threshold: 文本长度达到该值时改用剪贴板粘贴输入，0 表示始终逐字输入
+        step_delays: 无法观测就绪条件的步骤的等待时间，键为步骤名
+    """
+    poll_interval: float = 0.05
+    launch_timeout: float = 5.0
+    clipboard_timeout: float = 1.0
+    key_delay: float = 0.05
+    char_delay: float = 0.02
+    paste_threshold: int = 1
+    step_delays: Dict[str, float] = field(default_factory=lambda: {
+        "launch": 1.0,          # 无法检测前台窗口时的启动等待
+        "search_box": 0.3,      # 搜索框弹出
+        "search_results": 0.5,  # 搜索结果返回
+        "chat_open": 0.3,       # 选中聊天后聊天框打开
+        "chat_closed": 0.2,     # ESC 退出当前聊天
+        "paste": 0.5,           # 文件粘贴到输入框
+    })
+
+    def delay(self, step: str) -> float:
+        """步骤的等待时间，未配置的步骤不等待"""
+        return self.step_delays.get(step, 0.0)
+
+
+# 各操作系统的默认等待参数，Windows 版微信的搜索和粘贴响应更慢
+TIMING_PROFILES: Dict[str, TimingProfile] = {
+    "darwin": TimingProfile(),
+    "windows": TimingProfile(
+        key_delay=0.08,
+        char_delay=0.03,
+        step_delays={
+            "launch": 1.5,
+            "search_box": 0.4,
+            "search_results": 0.8,
+            "chat_open": 0.4,
+            "chat_closed": 0.3,
+            "paste": 0.8,
+        },
+    ),
+}
+
+
+def timing_profile_for(system: str) -> TimingProfile:
+    """返回操作系统对应的等待参数"""
+    return TIMING_PROFILES.get(system, TimingProfile())
+
+
+class WeChatTransport(ABC):
+    """微信自动化底层操作接口"""
+
+    # 后端名称，用于日志和基准测试报告
+    name: str = "base"
+
+    def __init__(self, profile: Optional[TimingProfile] = None) -> None:
+        self.system = platform.system().lower()
+        self.profile = profile if profile is not None else timing_profile_for(self.system)
+
+    @abstractmethod
+    def activate_app(self) -> bool:
+        """激活（打开）微信窗口"""
+
+    @abstractmethod
+    def press_find(self) -> None:
+        """按 Command+F (macOS) 或 Ctrl+F (Windows)"""
+
+    @abstractmethod
+    def press_enter(self) -> None:
+        """按回车键"""
+
+    @abstractmethod
+    def press_esc(self) -> None:
+        """按 ESC 键"""
+
+    @abstractmethod
+    def press_paste(self) -> None:
+        """按 Command+V (macOS) 或 Ctrl+V (Windows)"""
+
+    @abstractmethod
+    def press_newline(self) -> None:
+        """在输入框中换行而不发送（Command+Enter / Ctrl+Enter）"""
+
+    @abstractmethod
+    def clear_input(self) -> None:
+        """清空输入框（全选后删除）"""
+
+    @abstractmethod
+    def type_text(self, text: str) -> None:
+        """逐字输入不含换行符的文本"""
+
+    @abstractmethod
+    def copy_files_to_clipboard(self, file_paths: List[str]) -> bool:
+        """将一个或多个文件复制到剪贴板"""
+
+    @abstractmethod
+    def paste_text(self, text: str) -> bool:
+        """通过剪贴板一次性输入文本（可包含换行），不支持或失败时返回 False"""
+
+    @abstractmethod
+    def wait_ready(self, step: str) -> bool:
+        """等待界面完成 step 步骤，返回是否在超时前就绪"""
+
+    def supports_multi_file_clipboard(self) -> bool:
+        """是否支持一次把多个文件放入剪贴板"""
+        return self.system in ('darwin', 'windows')
+
+    def is_chat_focused(self) -> bool:
+        """校验微信窗口仍在前台"""
+        return True
+
+    def _execute_command(self, command: list, shell: bool = False) -> bool:
+        """执行系统命令"""
+        try:
+            subprocess.run(command, shell=shell)
+            return True
+        except Exception as e:
+            print(f"执行命令时出错: {str(e)}")
+            return False
+
+
+class PrintTransport(WeChatTransport):
+    """只打印操作的后端，不做任何真实输入"""
+
+    name = "print"
+
+    def activate_app(self) -> bool:
+        print("模拟打开微信")
+        return True
+
+    def press_find(self) -> None:
+        print("模拟按 Command+F")
+
+    def press_enter(self) -> None:
+        print("模拟按回车键")
+
+    def press_esc(self) -> None:
+        print("模拟按 ESC 键")
+
+    def press_paste(self) -> None:
+        print("模拟按 Command+V")
+
+    def press_newline(self) -> None:
+        print("模拟换行")
+
+    def clear_input(self) -> None:
+        print("模拟清空消息列表")
+
+    def type_text(self, text: str) -> None:
+        print(f"模拟输入文本: {text}")
+
+    def copy_files_to_clipboard(self, file_paths: List[str]) -> bool:
+        print(f"模拟复制 {len(file_paths)} 个文件到剪贴板: {file_paths}")
+        return True
+
+    def paste_text(self, text: str) -> bool:
+        print(f"模拟粘贴文本: {text}")
+        return True
+
+    def wait_ready(self, step: str) -> bool:
+        print(f"模拟等待 {step} 就绪")
+        return True
+
+
+class KeyboardTransport(WeChatTransport):
+    """
+    操作真实键盘和剪贴板的后端
+
+    优先使用 pynput，未安装时退回 pyautogui。
+    """
+
+    name = "keyboard"
+
+    def __init__(self, profile: Optional[TimingProfile] = None) -> None:
+        super().__init__(profile)
+        try:
+            from pynput.keyboard import Controller, Key
+            self._keyboard = Controller()
+            self._key = Key
+            self._pyautogui = None
+        except ImportError:
+            try:
+                import pyautogui
+            except ImportError as e:
+                raise RuntimeError("KeyboardTransport 需要安装 pynput 或 pyautogui") from e
+            self._keyboard = None
+            self._pyautogui = pyautogui
+        try:
+            import pyperclip
+            self._pyperclip = pyperclip
+        except ImportError:
+            self._pyperclip = None
+        # 根据系统设置快捷键
+        self._cmd_name = 'cmd' if self.system == 'darwin' else 'ctrl'
+
+    @property
+    def _gui(self) -> ModuleType:
+        """pyautogui 模块（未安装 pynput 时使用）"""
+        assert self._pyautogui is not None
+        return self._pyautogui
+
+    def _hotkey(self, key: str) -> None:
+        """按下 Command/Ctrl + key"""
+        if self._keyboard is not None:
+            cmd_key = getattr(self._key, self._cmd_name)
+            with self._keyboard.pressed(cmd_key):
+                self._keyboard.press(key)
+                self._keyboard.release(key)
+        else:
+            self._gui.hotkey(self._cmd_name, key)
+
+    def _tap(self, name: str) -> None:
+        """按下并释放一个特殊键"""
+        if self._keyboard is not None:
+            key = getattr(self._key, name)
+            self._keyboard.press(key)
+            self._keyboard.release(key)
+        else:
+            self._gui.press(name)
+
+    def activate_app(self) -> bool:
+        if self.system == 'darwin':
+            return self._execute_command(['osascript', '-e', 'tell application "WeChat" to activate'])
+        if self.system == 'windows':
+            return self._execute_command(['start', 'weixin://'], shell=True)
+        print(f"不支持的操作系统: {self.system}")
+        return False
+
+    def press_find(self) -> None:
+        self._hotkey('f')
+        time.sleep(self.profile.key_delay)
+
+    def press_enter(self) -> None:
+        self._tap('enter')
+        time.sleep(self.profile.key_delay)
+
+    def press_esc(self) -> None:
+        self._tap('esc')
+        time.sleep(self.profile.key_delay)
+
+    def press_paste(self) -> None:
+        self._hotkey('v')
+        time.sleep(self.profile.key_delay)
+
+    def press_newline(self) -> None:
+        # macOS 使用 Command+Enter，Windows 使用 Ctrl+Enter
+        if self._keyboard is not None:
+            with self._keyboard.pressed(getattr(self._key, self._cmd_name)):
+                self._tap('enter')
+        else:
+            self._gui.hotkey(self._cmd_name, 'enter')
+        time.sleep(self.profile.key_delay)
+
+    def clear_input(self) -> None:
+        self._hotkey('a')
+        time.sleep(self.profile.key_delay)
+        self._tap('delete')
+        time.sleep(self.profile.key_delay)
+
+    def type_text(self, text: str) -> None:
+        for char in text:
+            if self._keyboard is not None:
+                self._keyboard.type(char)
+            else:
+                self._gui.write(char)
+            time.sleep(self.profile.char_delay)  # 添加延迟以确保输入稳定
+
+    def paste_text(self, text: str) -> bool:
+        if self._pyperclip is None:
+            return False
+        self._pyperclip.copy(text)
+        # 等待剪贴板内容确实更新后再粘贴
+        if not wait_until(lambda: self._pyperclip.paste() == text,
+                          self.profile.clipboard_timeout, self.profile.poll_interval):
+            print("写入剪贴板超时")
+            return False
+        self.press_paste()
+        return True
+
+    def copy_files_to_clipboard(self, file_paths: List[str]) -> bool:
+        missing = [path for path in file_paths if not os.path.exists(path)]
+        if missing:
+            print(f"文件不存在: {missing}")
+            return False
+        try:
+            if self.system == 'darwin':
+                # macOS 使用 osascript 把文件列表放入剪贴板
+                files = ", ".join(f'POSIX file {_applescript_quote(path)}' for path in file_paths)
+                success = self._execute_command(['osascript', '-e', f'set the clipboard to {{{files}}}'])
+            elif self.system == 'windows':
+                # Windows 使用 PowerShell 以文件列表（CF_HDROP）形式写入剪贴板；
+                # -LiteralPath 不展开 [ ] * ? 等通配符
+                paths = ",".join(_powershell_quote(path) for path in file_paths)
+                success = self._execute_command(
+                    ['powershell', '-NoProfile', '-Command', f'Set-Clipboard -LiteralPath {paths}']
+                )
+            else:
+                print(f"不支持的操作系统: {self.system}")
+                return False
+            return success
+        except Exception as e:
+            print(f"复制文件到剪贴板时出错: {str(e)}")
+            return False
+
+    def wait_ready(self, step: str) -> bool:
+        if step == "launch" and self.can_detect_app():
+            # 轮询微信是否已切换到前台
+            return wait_until(self.is_app_active, self.profile.launch_timeout, self.profile.poll_interval)
+        # 检测不到前台窗口时（如 Windows 上只安装了 pynput）按固定时间等待
+        time.sleep(self.profile.delay(step))
+        return True
+
+    def can_detect_app(self) -> bool:
+        """能否检测微信是否为前台窗口（Windows 需要 pyautogui 读取前台窗口标题）"""
+        return self.system == 'darwin' or (self.system == 'windows' and self._pyautogui is not None)
+
+    def is_app_active(self) -> bool:
+        """微信是否为前台窗口，无法检测时视为是"""
+        if self.system == 'darwin':
+            result = subprocess.run(
+                ['osascript', '-e', 'tell application "System Events" to get name of first process whose frontmost is true'],
+                capture_output=True, text=True
+            )
+            return result.stdout.strip() == "WeChat"
+        if self.system == 'windows' and self._pyautogui is not None:
+            title = self._pyautogui.getActiveWindowTitle() or ""
+            return "微信" in title or "WeChat" in title
+        return True
+
+    def is_chat_focused(self) -> bool:
+        return self.is_app_active()
+
+
+@dataclass
+class LatencyModel:
+    """
+    模拟后端的延迟模型（单位：秒）
+
+    Attributes:
+        activate: 激活微信窗口
+        search: 打开搜索框
+        type_per_char: 每输入一个字符
+        paste: 粘贴
+        enter: 按回车（发送 / 确认搜索）
+        key: 其他按键（ESC、换行、清空输入框）
+        clipboard: 写入剪贴板
+        wait_scale: 就绪等待时间（TimingProfile.step_delays）的缩放比例，0 表示忽略
+        jitter: 随机抖动比例，例如 0.1 表示 ±10%
+    """
+    activate: float = 0.5
+    search: float = 0.3
+    type_per_char: float = 0.01
+    paste: float = 0.2
+    enter: float = 0.05
+    key: float = 0.02
+    clipboard: float = 0.05
+    wait_scale: float = 1.0
+    jitter: float = 0.0
+
+
+class SimulatedTransport(WeChatTransport):
+    """按延迟模型休眠的模拟后端，不做任何真实输入"""
+
+    name = "simulated"
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        seed: int = 0,
+        profile: Optional[TimingProfile] = None,
+    ) -> None:
+        super().__init__(profile)
+        self.latency = latency if latency is not None else LatencyModel()
+        self._random = random.Random(seed)
+
+    def _sleep(self, seconds: float) -> None:
+        if self.latency.jitter:
+            seconds *= 1 + self._random.uniform(-self.latency.jitter, self.latency.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def activate_app(self) -> bool:
+        self._sleep(self.latency.activate)
+        return True
+
+    def press_find(self) -> None:
+        self._sleep(self.latency.search)
+
+    def press_enter(self) -> None:
+        self._sleep(self.latency.enter)
+
+    def press_esc(self) -> None:
+        self._sleep(self.latency.key)
+
+    def press_paste(self) -> None:
+        self._sleep(self.latency.paste)
+
+    def press_newline(self) -> None:
+        self._sleep(self.latency.key)
+
+    def clear_input(self) -> None:
+        self._sleep(self.latency.key * 2)
+
+    def type_text(self, text: str) -> None:
+        self._sleep(self.latency.type_per_char * len(text))
+
+    def copy_files_to_clipboard(self, file_paths: List[str]) -> bool:
+        self._sleep(self.latency.clipboard)
+        return True
+
+    def paste_text(self, text: str) -> bool:
+        self._sleep(self.latency.clipboard + self.latency.paste)
+        return True
+
+    def wait_ready(self, step: str) -> bool:
+        self._sleep(self.profile.delay(step) * self.latency.wait_scale)
+        return True
+
+    def supports_multi_file_clipboard(self) -> bool:
+        return True
+
+
+def create_transport(name: str) -> WeChatTransport:
+    """
+    按名称创建传输后端
+
+    Args:
+        name: 后端名称，print / keyboard / simulated
+
+    Raises:
+        ValueError: 未知的后端名称
+    """
+    if name == PrintTransport.name:
+        return PrintTransport()
+    if name == KeyboardTransport.name:
+        return KeyboardTransport()
+    if name == SimulatedTransport.name:
+        return SimulatedTransport()
+    raise ValueError(f"未知的传输后端: {name}")
@@ -1,31 +1,195 @@
 # 导入 FastAPI 实例
 import uvicorn
 from api import create_app
+import importlib.util
 import os
+import random
+import shutil
+import signal
 import sys
+import tempfile
+import time
 import argparse
+from typing import Dict
 
-# 创建 FastAPI 应用实例
+from api.api_router.tianyi_tasks.utils import robot_dispatcher_enabled
+from libs.metrics import metrics_registry
+
+# 创建 FastAPI 应用实例（多 worker 模式下在主进程中预加载，fork 后各 worker 共享）
 app = create_app()
 
+# 快速退出的 worker 被视为启动失败，重新拉起前等待一段时间，避免反复崩溃
+WORKER_MIN_UPTIME = 1.0
+
+
+def resolve_impl(name: str, preferred: str, fallback: str) -> str:
+    """
+    解析事件循环 / HTTP 解析器实现
+
+    Args:
+        name: 命令行参数值，auto 表示已安装 preferred 时使用 preferred，否则使用 fallback
+        preferred: 更快的实现（uvloop / httptools）
+        fallback: 纯 Python 实现（asyncio / h11）
+
+    Returns:
+        str: 实现名称
+    """
+    if name == "auto":
+        return preferred if importlib.util.find_spec(preferred) is not None else fallback
+    if name == preferred and importlib.util.find_spec(preferred) is None:
+        raise ValueError(f"未安装 {preferred}")
+    return name
+
+
+def run_worker(config: uvicorn.Config, sock, worker_id: int, max_requests: int, jitter: int) -> None:
+    """在 fork 出的子进程中运行一个 worker，处理完 max_requests 个请求后退出由主进程重新拉起"""
+    # 独立进程组，终端的 Ctrl+C 只发给主进程，由主进程统一转发
+    os.setpgid(0, 0)
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    os.environ["SERVER_WORKER_ID"] = str(worker_id)
+    # 各 worker 的指标写入共享目录，由 /metrics 汇总
+    metrics_registry.start_worker(worker_id, float(os.getenv("METRICS_FLUSH_INTERVAL", "5")))
+    if max_requests > 0:
+        # 加入随机抖动，避免所有 worker 同时重启
+        config.limit_max_requests = max_requests + random.randint(0, jitter)
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        try:
+            # 退出前写入最后的指标快照，重新拉起的 worker 从这里继续累加
+            metrics_registry.flush()
+        except OSError as e:
+            print(f"写入指标快照失败: {e}")
+        sys.stdout.flush()
+        os._exit(0)
+
+
+def serve_workers(config: uvicorn.Config, workers: int, max_requests: int, jitter: int, graceful_timeout: float) -> None:
+    """
+    预加载应用后 fork 多个 worker 共享同一个监听套接字，并监控 worker：
+    - worker 退出（达到最大请求数或异常退出）时重新拉起
+    - 收到 SIGTERM / SIGINT 时转发 SIGTERM，worker 停止接受新连接并处理完已有请求后退出，
+      超过 graceful_timeout 仍未退出的 worker 被强制结束
+    """
+    sock = config.bind_socket()
+    config.load()
+    # 指标快照目录，未设置 METRICS_MULTIPROC_DIR 时使用临时目录并在退出时删除
+    metrics_dir = os.getenv("METRICS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="agilex-metrics-")
+    metrics_registry.set_multiprocess_dir(metrics_dir)
+    children: Dict[int, tuple] = {}  # pid -> (worker 编号, 启动时间)
+    stopping = False
+
+    def spawn(worker_id: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(config, sock, worker_id, max_requests, jitter)
+        children[pid] = (worker_id, time.monotonic())
+        print(f"worker {worker_id} 已启动 (pid {pid})")
+        if stopping:
+            # 启动过程中收到了停止信号
+            os.kill(pid, signal.SIGTERM)
+
+    def handle_stop(signum, frame) -> None:
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        print(f"收到信号 {signum}，等待 worker 处理完已有请求...")
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+
+    deadline = None
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping:
+                if deadline is None:
+                    deadline = time.monotonic() + graceful_timeout
+                elif time.monotonic() > deadline:
+                    # 超时仍未退出，强制结束
+                    for child in list(children):
+                        try:
+                            os.kill(child, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+            time.sleep(0.1)
+            continue
+        if pid not in children:
+            continue
+        worker_id, started = children.pop(pid)
+        if stopping:
+            continue
+        print(f"worker {worker_id} 已退出 (pid {pid}, 状态 {status})，重新启动")
+        if time.monotonic() - started < WORKER_MIN_UPTIME:
+            time.sleep(WORKER_MIN_UPTIME)
+        if not stopping:
+            spawn(worker_id)
+
+    sock.close()
+    if not os.getenv("METRICS_MULTIPROC_DIR"):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    print("所有 worker 已停止")
+
+
 def main():
     """主函数"""
     try:
-        # 创建命令行参数解析器
+        # 创建命令行参数解析器，所有参数都可以用环境变量设置默认值
         parser = argparse.ArgumentParser(description='启动 FastAPI 服务器')
-        parser.add_argument('--port', type=int, default=8066, help='服务器端口号 (默认: 8001)')
+        parser.add_argument('--host', default=os.getenv('SERVER_HOST', '0.0.0.0'), help='监听地址 (默认: 0.0.0.0，环境变量 SERVER_HOST)')
+        parser.add_argument('--port', type=int, default=int(os.getenv('SERVER_PORT', '8066')), help='服务器端口号 (默认: 8066，环境变量 SERVER_PORT)')
+        parser.add_argument('--workers', type=int, default=int(os.getenv('SERVER_WORKERS', '1')),
+                            help='worker 进程数 (默认: 1，环境变量 SERVER_WORKERS)。机器人任务分发器只能由一个进程驱动，'
+                                 '大于 1 时必须设置 ROBOT_DISPATCHER_ENABLED=0')
+        parser.add_argument('--loop', default=os.getenv('SERVER_LOOP', 'auto'), choices=['auto', 'asyncio', 'uvloop'],
+                            help='事件循环实现，auto 表示已安装 uvloop 时使用 uvloop (环境变量 SERVER_LOOP)')
+        parser.add_argument('--http', default=os.getenv('SERVER_HTTP', 'auto'), choices=['auto', 'h11', 'httptools'],
+                            help='HTTP 解析器，auto 表示已安装 httptools 时使用 httptools (环境变量 SERVER_HTTP)')
+        parser.add_argument('--backlog', type=int, default=int(os.getenv('SERVER_BACKLOG', '2048')), help='监听队列长度 (默认: 2048，环境变量 SERVER_BACKLOG)')
+        parser.add_argument('--keep-alive', type=int, default=int(os.getenv('SERVER_KEEP_ALIVE', '5')), help='keep-alive 空闲超时（秒）(默认: 5，环境变量 SERVER_KEEP_ALIVE)')
+        parser.add_argument('--max-requests', type=int, default=int(os.getenv('SERVER_MAX_REQUESTS', '0')),
+                            help='每个 worker 处理该数量的请求后重启，0 表示不重启 (环境变量 SERVER_MAX_REQUESTS)')
+        parser.add_argument('--max-requests-jitter', type=int, default=int(os.getenv('SERVER_MAX_REQUESTS_JITTER', '0')),
+                            help='为每个 worker 的最大请求数加上 0 到该值的随机数 (环境变量 SERVER_MAX_REQUESTS_JITTER)')
+        parser.add_argument('--graceful-timeout', type=float, default=float(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30')),
+                            help='收到 SIGTERM 后等待已有请求完成的最长时间（秒）(默认: 30，环境变量 SERVER_GRACEFUL_TIMEOUT)')
         args = parser.parse_args()
-        
-        print(f"服务器将在端口 {args.port} 上启动...")
-        
-        # 启动服务器
-        uvicorn.run(
+        if args.workers < 1:
+            parser.error('--workers 必须大于 0')
+        if args.workers > 1 and robot_dispatcher_enabled():
+            # 每个 worker 各自的分发器会恢复同一份任务日志并同时操作同一个微信会话，导致重复发送和按键交错
+            parser.error('机器人任务分发器只能由一个进程驱动，--workers 大于 1 时需要设置 ROBOT_DISPATCHER_ENABLED=0')
+
+        config = uvicorn.Config(
             app,  # 直接使用 app 实例
-            host="0.0.0.0",
+            host=args.host,
             port=args.port,
+            loop=resolve_impl(args.loop, 'uvloop', 'asyncio'),
+            http=resolve_impl(args.http, 'httptools', 'h11'),
+            backlog=args.backlog,
+            timeout_keep_alive=args.keep_alive,
+            timeout_graceful_shutdown=args.graceful_timeout,
             log_level="info",
             reload=False  # 在生产环境中禁用重载
         )
+        print(f"服务器将在端口 {args.port} 上启动 (workers={args.workers}, loop={config.loop}, http={config.http})...")
+
+        if args.workers == 1 and args.max_requests <= 0:
+            # 单进程直接运行
+            uvicorn.Server(config).run()
+        else:
+            serve_workers(config, args.workers, args.max_requests, args.max_requests_jitter, args.graceful_timeout)
     except Exception as e:
         print(f"Error starting application: {e}")
         sys.exit(1)
@@ -13,10 +13,13 @@ class RobotTask:
     # 发送的人
     # 发送的内容
     
-    def __init__(self, to_user, content,task_type:int = RobotTaskType.TEXT_TYPE.value,):
+    # 幂等键（可选），由调用方提供，同一幂等键的任务只发送一次
+    
+    def __init__(self, to_user, content,task_type:int = RobotTaskType.TEXT_TYPE.value, idempotency_key = None):
         self.task_type = task_type
         self.to_user = to_user
         self.content = content
+        self.idempotency_key = idempotency_key
         pass
     
     def __str__(self):
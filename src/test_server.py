@@ -1,16 +1,41 @@
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+import errno
+import selectors
 import sys
 import threading
 import time
 import socket
+from types import ModuleType
+from typing import Optional
+
+resource: Optional[ModuleType]
+try:
+    import resource
+except ImportError:  # Windows 没有 resource
+    resource = None
+
+# selector 模式下每个连接返回的固定响应
+SELECTOR_RESPONSE = b"HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 3\r\nConnection: close\r\n\r\nok\n"
 
 class MultiPortServer:
-    def __init__(self, start_port, end_port):
+    """
+    在一段连续端口上启动 HTTP 服务器
+
+    mode:
+        threaded: 每个端口一个线程和一个 HTTPServer，返回目录列表（端口多时启动很慢）
+        selector: 单线程用 selectors 同时监听所有端口，返回固定响应，数千个端口也能在一秒内启动
+    """
+    def __init__(self, start_port, end_port, mode="threaded"):
+        if mode not in ("threaded", "selector"):
+            raise ValueError(f"未知的模式: {mode}")
         self.start_port = start_port
         self.end_port = end_port
+        self.mode = mode
         self.servers = []
         self.threads = []
         self.failed_ports = []
+        self._selector = None
+        self._running = False
 
     def run_server(self, port):
         try:
@@ -28,6 +53,9 @@ class MultiPortServer:
                 self.failed_ports.append(port)
 
     def start(self):
+        if self.mode == "selector":
+            self._start_selector()
+            return
         for port in range(self.start_port, self.end_port + 1):
             thread = threading.Thread(target=self.run_server, args=(port,))
             thread.daemon = True
@@ -36,21 +64,95 @@ class MultiPortServer:
             print(f"尝试启动端口 {port} 的服务器")
             time.sleep(0.1)  # 避免端口冲突
 
+    def _raise_file_limit(self, count):
+        # 每个端口占用一个文件描述符，必要时把软限制提高到硬限制
+        if resource is None:
+            return
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        needed = count + 256
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            except (ValueError, OSError):
+                pass
+
+    def _start_selector(self):
+        self._raise_file_limit(self.end_port - self.start_port + 1)
+        self._selector = selectors.DefaultSelector()
+        for port in range(self.start_port, self.end_port + 1):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('', port))
+                sock.listen(128)
+                sock.setblocking(False)
+            except OSError as e:
+                sock.close()
+                if e.errno == errno.EADDRINUSE:
+                    print(f"端口 {port} 已被占用")
+                else:
+                    print(f"端口 {port} 启动失败: {str(e)}")
+                self.failed_ports.append(port)
+                continue
+            self.servers.append(sock)
+            self._selector.register(sock, selectors.EVENT_READ, None)
+        self._running = True
+        thread = threading.Thread(target=self._serve_selector)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+        print(f"服务器运行在 {len(self.servers)} 个端口 ({self.start_port}-{self.end_port})")
+
+    def _serve_selector(self):
+        selector = self._selector
+        assert selector is not None
+        while self._running:
+            for key, _ in selector.select(timeout=0.2):
+                sock = key.fileobj
+                if key.data is None:
+                    # 监听套接字：接受新连接
+                    try:
+                        conn, _ = sock.accept()
+                    except OSError:
+                        continue
+                    conn.setblocking(False)
+                    selector.register(conn, selectors.EVENT_READ, True)
+                    continue
+                # 连接套接字：读到请求后返回固定响应并关闭
+                try:
+                    if sock.recv(4096):
+                        sock.send(SELECTOR_RESPONSE)
+                except OSError:
+                    pass
+                selector.unregister(sock)
+                sock.close()
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
     def stop(self):
+        if self.mode == "selector":
+            self._running = False
+            for thread in self.threads:
+                thread.join()
+            self.servers = []
+            return
         for server in self.servers:
             server.shutdown()
         for thread in self.threads:
             thread.join()
 
 def main():
-    if len(sys.argv) != 3:
-        print("使用方法: python test_server.py <起始端口> <结束端口>")
+    if len(sys.argv) not in (3, 4):
+        print("使用方法: python test_server.py <起始端口> <结束端口> [threaded|selector]")
         sys.exit(1)
     
     start_port = int(sys.argv[1])
     end_port = int(sys.argv[2])
+    mode = sys.argv[3] if len(sys.argv) == 4 else "threaded"
     
-    server = MultiPortServer(start_port, end_port)
+    server = MultiPortServer(start_port, end_port, mode)
     try:
         server.start()
         print(f"\n服务器启动完成:")
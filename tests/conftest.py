@@ -0,0 +1,19 @@
+"""
+测试公共配置
+
+测试直接导入 src 下的模块（与 src/main.py 的运行方式相同）。
+api 包的 __init__ 会创建 FastAPI 应用，端口管理等模块本身并不依赖 FastAPI，
+因此把 api / api.api_router 注册为只有包路径的空包，导入子模块时不执行包的初始化。
+"""
+import os
+import sys
+import types
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+for _name in ("api", "api.api_router"):
+    if _name not in sys.modules:
+        _package = types.ModuleType(_name)
+        _package.__path__ = [os.path.join(SRC_DIR, *_name.split("."))]
+        sys.modules[_name] = _package
@@ -0,0 +1,37 @@
+"""机器人任务分发器开关：多 worker 部署时关闭分发器"""
+import importlib
+import sys
+
+import pytest
+
+from libs.dispatcher import DispatchRejectedError
+
+UTILS = "api.api_router.tianyi_tasks.utils"
+
+
+def import_utils():
+    # utils 在导入时按环境变量创建全局分发器，每次测试重新导入
+    pytest.importorskip("requests")
+    sys.modules.pop(UTILS, None)
+    return importlib.import_module(UTILS)
+
+
+def test_disabled_dispatcher_is_not_created(monkeypatch):
+    monkeypatch.setenv("ROBOT_DISPATCHER_ENABLED", "0")
+    utils = import_utils()
+    assert not utils.robot_dispatcher_enabled()
+    assert utils.dispatcher is None
+    with pytest.raises(DispatchRejectedError):
+        utils.get_dispatcher()
+
+
+def test_dispatcher_enabled_by_default(monkeypatch, tmp_path):
+    monkeypatch.delenv("ROBOT_DISPATCHER_ENABLED", raising=False)
+    monkeypatch.delenv("ROBOT_SHARDS", raising=False)
+    monkeypatch.setenv("ROBOT_JOURNAL_PATH", str(tmp_path / "journal.db"))
+    utils = import_utils()
+    try:
+        assert utils.robot_dispatcher_enabled()
+        assert utils.get_dispatcher() is utils.dispatcher
+    finally:
+        utils.dispatcher.close(timeout=5)
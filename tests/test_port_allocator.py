@@ -0,0 +1,80 @@
+"""端口分配位图：释放与复用、next-fit 游标回绕、连续端口段"""
+from api.api_router.port_manager.allocator import PortBitmap, free_runs
+
+
+def test_next_free_skips_allocated_ports():
+    bitmap = PortBitmap()
+    for port in (1000, 1001, 1003):
+        bitmap.add(port)
+    assert bitmap.next_free(1000, 1010) == 1002
+    assert bitmap.next_free(1000, 1010) == 1004
+    assert len(bitmap) == 3
+
+
+def test_released_port_is_reused_after_cursor_wraps():
+    bitmap = PortBitmap()
+    ports = []
+    for _ in range(5):
+        port = bitmap.next_free(2000, 2004)
+        bitmap.add(port)
+        ports.append(port)
+    assert ports == [2000, 2001, 2002, 2003, 2004]
+    # 范围已满
+    assert bitmap.next_free(2000, 2004) is None
+
+    # 释放中间的端口后，游标到达 max_port 后回到起点继续查找
+    bitmap.discard(2002)
+    assert 2002 not in bitmap
+    assert bitmap.next_free(2000, 2004) == 2002
+
+
+def test_next_fit_continues_after_last_allocation():
+    bitmap = PortBitmap()
+    first = bitmap.next_free(3000, 3100)
+    bitmap.add(first)
+    # 释放后不立即复用，继续从上次分配之后查找
+    bitmap.discard(first)
+    assert bitmap.next_free(3000, 3100) == first + 1
+
+
+def test_rewind_moves_cursor_back_to_released_port():
+    bitmap = PortBitmap()
+    candidates = [bitmap.next_free(4000, 4100) for _ in range(4)]
+    assert candidates == [4000, 4001, 4002, 4003]
+    bitmap.add(candidates[0])
+    # 多余的候选端口释放后，下一次分配从第一个释放的端口开始
+    bitmap.rewind(min(candidates[1:]))
+    assert bitmap.next_free(4000, 4100) == 4001
+    # rewind 不会把游标向后移动
+    bitmap.rewind(4050)
+    assert bitmap.next_free(4000, 4100) == 4002
+
+
+def test_full_blocks_are_skipped_and_reopened():
+    bitmap = PortBitmap()
+    block = PortBitmap.BLOCK_PORTS
+    for port in range(0, 3 * block):
+        bitmap.add(port)
+    assert bitmap.next_free(0, 10 * block) == 3 * block
+    bitmap.discard(block + 5)
+    assert bitmap.next_free(0, 10 * block) == 3 * block + 1
+    bitmap.rewind(0)
+    assert bitmap.next_free(0, 10 * block) == block + 5
+
+
+def test_next_free_run_skips_allocated_ports():
+    bitmap = PortBitmap()
+    bitmap.add(5003)
+    assert bitmap.next_free_run(5000, 5020, 4) == 5004
+    assert bitmap.next_free_run(5000, 5010, 3) == 5008
+    # 游标到达范围末尾后回到起点查找
+    assert bitmap.next_free_run(5000, 5010, 3) == 5000
+    assert bitmap.next_free_run(5000, 5010, 20) is None
+
+
+def test_range_bits_and_free_runs():
+    bitmap = PortBitmap()
+    for port in (6001, 6002, 6005):
+        bitmap.add(port)
+    bits = bitmap.range_bits(6000, 6009)
+    assert free_runs(bytes(bits), 6000, 10) == [(6000, 6000), (6003, 6004), (6006, 6009)]
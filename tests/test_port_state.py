@@ -0,0 +1,117 @@
+"""端口共享状态：到期时间堆的续租、释放和回收"""
+import random
+
+import pytest
+
+from api.api_router.port_manager.state import PortState
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = PortState(str(tmp_path / "ports.state"))
+    yield state
+    state.close()
+
+
+def assert_heap_consistent(state: PortState) -> None:
+    """堆与记录一一对应，且满足最小堆性质"""
+    records, size = state._get_counts()
+    assert size == records == len(state)
+    for index in range(size):
+        port = state._heap_port[index]
+        assert state.status(port) != PortState.FREE
+        assert state._heap_index[port] == index
+        assert state._heap_time[index] == state._expires_at[port]
+        if index > 0:
+            assert state._heap_time[(index - 1) // 2] <= state._heap_time[index]
+
+
+def test_pop_expired_reclaims_in_expiry_order(state):
+    with state.lock:
+        state.record(1000, PortState.LEASED, 0, 30)
+        state.record(1001, PortState.BUSY, 0, 10)
+        state.record(1002, PortState.RESERVED, 0, 20)
+        assert state.pop_expired(15) == 1
+        assert state.status(1001) == PortState.FREE and 1001 not in state.bitmap
+        assert state.pop_expired(25) == 1
+        assert len(state) == 1
+        assert state.get(1000).is_used
+
+
+def test_renew_and_release_update_heap_in_place(state):
+    with state.lock:
+        state.record(2000, PortState.LEASED, 0, 10)
+        state.record(2001, PortState.LEASED, 0, 20)
+        # 续租把到期时间推后，释放直接删除条目，堆中不会留下过时条目
+        state.record(2000, PortState.LEASED, 0, 100)
+        state.remove(2001)
+        assert_heap_consistent(state)
+        assert state.pop_expired(50) == 0
+        assert state.pop_expired(100) == 1
+        assert len(state) == 0
+
+
+def test_random_operations_keep_heap_consistent(state):
+    rnd = random.Random(0)
+    expected = {}
+    now = 0.0
+    with state.lock:
+        for step in range(5000):
+            port = rnd.randrange(3000, 3200)
+            action = rnd.random()
+            if action < 0.6:
+                expires_at = now + rnd.uniform(1, 50)
+                state.record(port, PortState.LEASED, now, expires_at)
+                expected[port] = expires_at
+            elif action < 0.9:
+                state.remove(port)
+                expected.pop(port, None)
+            else:
+                now += 5
+                expired = [p for p, expires_at in expected.items() if expires_at <= now]
+                assert state.pop_expired(now) == len(expired)
+                for p in expired:
+                    del expected[p]
+            if step % 250 == 0:
+                assert_heap_consistent(state)
+        assert_heap_consistent(state)
+        assert {p: state._expires_at[p] for p in expected} == expected
+
+
+def test_state_persists_across_reopen(tmp_path):
+    path = str(tmp_path / "ports.state")
+    state = PortState(path)
+    with state.lock:
+        state.record(4000, PortState.LEASED, 1.0, 50.0)
+        state.record(4001, PortState.LEASED, 1.0, 60.0)
+    state.close()
+
+    state = PortState(path)
+    try:
+        with state.lock:
+            assert len(state) == 2
+            assert 4000 in state.bitmap
+            assert_heap_consistent(state)
+            assert state.pop_expired(55.0) == 1
+    finally:
+        state.close()
+
+
+def test_incompatible_file_is_reinitialized(tmp_path):
+    path = str(tmp_path / "ports.state")
+    state = PortState(path)
+    with state.lock:
+        state.record(5000, PortState.LEASED, 1.0, 50.0)
+    state.close()
+    # 旧版本的文件（版本号不同）在打开时重新初始化
+    with open(path, "r+b") as f:
+        f.seek(8)
+        f.write((PortState.VERSION - 1).to_bytes(4, "little"))
+
+    state = PortState(path)
+    try:
+        with state.lock:
+            assert len(state) == 0
+            assert 5000 not in state.bitmap
+    finally:
+        state.close()
@@ -0,0 +1,109 @@
+"""分片分发器：摘除分片时的任务迁移与计数"""
+import threading
+import time
+
+from libs.dispatcher import DispatchStatus, TaskDispatcher
+from libs.sharded_dispatcher import ShardedDispatcher, ShardSpec
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask
+
+
+def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+def test_evicted_shard_migrates_pending_tasks():
+    release = threading.Event()  # 放行 b 分片正在发送的任务
+    b_down = threading.Event()   # b 分片健康检查失败
+
+    def deliver(automation: str, task: RobotTask) -> bool:
+        if automation == "migrate-b":
+            release.wait(5)
+        return True
+
+    shards = [
+        ShardSpec("migrate-a", automation_factory=lambda: "migrate-a"),
+        ShardSpec("migrate-b", automation_factory=lambda: "migrate-b", health_check=lambda: not b_down.is_set()),
+    ]
+    dispatcher = ShardedDispatcher(shards, deliver, health_interval=0.05)
+    try:
+        tasks = [RobotTask(f"群{i}", f"消息{i}") for i in range(40)]
+        on_b = [i for i, task in enumerate(tasks) if dispatcher.route(task.to_user) == "migrate-b"]
+        assert len(on_b) >= 2
+        task_ids = dispatcher.submit(tasks).task_ids
+
+        shard_b = dispatcher._shards["migrate-b"].dispatcher
+        # b 的第一个任务正在发送（阻塞），其余任务排队
+        wait_until(lambda: shard_b.stats()["status_counts"]["sending"] == 1)
+        b_down.set()
+        wait_until(lambda: not dispatcher._shards["migrate-b"].healthy)
+        release.set()
+        wait_until(lambda: all(dispatcher.get(task_id).status == DispatchStatus.SENT for task_id in task_ids))
+
+        # 迁移走的任务单独计数，不计入 cancelled；正在发送的任务留在原分片完成
+        assert shard_b.metrics.migrated.value == len(on_b) - 1
+        assert shard_b.metrics.cancelled.value == 0
+        assert shard_b.metrics.sent.value == 1
+        shard_a = dispatcher._shards["migrate-a"].dispatcher
+        assert shard_a.metrics.sent.value == len(tasks) - 1
+        assert all(dispatcher.route(task.to_user) == "migrate-a" for task in tasks)
+    finally:
+        release.set()
+        dispatcher.close(timeout=5)
+
+
+def test_failed_migration_requeues_tasks_on_source_shard():
+    release = threading.Event()
+    b_down = threading.Event()
+
+    def deliver(automation: str, task: RobotTask) -> bool:
+        if automation == "requeue-b":
+            release.wait(5)
+        return True
+
+    shards = [
+        ShardSpec("requeue-a", automation_factory=lambda: "requeue-a"),
+        ShardSpec("requeue-b", automation_factory=lambda: "requeue-b", health_check=lambda: not b_down.is_set()),
+    ]
+    dispatcher = ShardedDispatcher(
+        shards,
+        deliver,
+        # a 分片的队列放不下 b 分片的待发送任务，迁移必然失败
+        dispatcher_factory=lambda spec, wrapped: TaskDispatcher(
+            deliver=wrapped,
+            automation_factory=spec.automation_factory,
+            name=spec.name,
+            max_queue_size=2 if spec.name == "requeue-a" else 10,
+        ),
+        health_interval=0.05,
+    )
+    try:
+        candidates = [RobotTask(f"群{i}", f"消息{i}") for i in range(40)]
+        on_a = [task for task in candidates if dispatcher.route(task.to_user) == "requeue-a"][:1]
+        on_b = [task for task in candidates if dispatcher.route(task.to_user) == "requeue-b"][:2]
+        on_b += [RobotTask(on_b[0].to_user, f"追加{i}") for i in range(2)]
+        task_ids = dispatcher.submit(on_a + on_b).task_ids
+
+        shard_a = dispatcher._shards["requeue-a"].dispatcher
+        shard_b = dispatcher._shards["requeue-b"].dispatcher
+        wait_until(lambda: shard_b.stats()["status_counts"]["sending"] == 1)
+        b_down.set()
+        wait_until(lambda: not dispatcher._shards["requeue-b"].healthy)
+        time.sleep(0.2)
+
+        # 迁移失败的任务放回 b 分片，不计入 migrated 或 cancelled
+        assert shard_b.metrics.migrated.value == 0
+        assert shard_b.metrics.cancelled.value == 0
+
+        # a 分片有空间后，之后的检查周期重试迁移，任务没有丢失
+        shard_a.max_queue_size = 10
+        wait_until(lambda: shard_b.metrics.migrated.value == len(on_b) - 1)
+        release.set()
+        wait_until(lambda: all(dispatcher.get(task_id).status == DispatchStatus.SENT for task_id in task_ids))
+        assert shard_b.metrics.sent.value == 1
+        assert shard_a.metrics.sent.value == len(task_ids) - 1
+    finally:
+        release.set()
+        dispatcher.close(timeout=5)
@@ -0,0 +1,111 @@
+"""任务日志：崩溃恢复与按幂等键去重"""
+import time
+
+import pytest
+
+from libs.dispatcher import DispatchStatus, TaskDispatcher
+from libs.task_journal import JournalEntry, TaskJournal, journal_key
+from models.wechat_robot_tasks.types.robot_task_type import RobotTask
+
+
+class FakeAutomation:
+    """记录发送内容的自动化实例"""
+
+    sent: list = []
+
+    def send_message(self, user: str, message: str) -> bool:
+        FakeAutomation.sent.append((user, message))
+        return True
+
+    def send_file(self, user: str, file_path: str) -> bool:
+        FakeAutomation.sent.append((user, file_path))
+        return True
+
+
+def deliver(automation: FakeAutomation, task: RobotTask) -> bool:
+    return automation.send_message(task.to_user, task.content)
+
+
+def wait_idle(dispatcher: TaskDispatcher, timeout: float = 5.0) -> None:
+    """等待所有任务结束"""
+    deadline = time.monotonic() + timeout
+    while dispatcher.stats()["queue_depth"] > 0 or dispatcher.stats()["status_counts"]["sending"] > 0:
+        assert time.monotonic() < deadline, "任务未在超时时间内发送完成"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    FakeAutomation.sent = []
+    return str(tmp_path / "journal.db")
+
+
+def new_dispatcher(path: str, **kwargs) -> TaskDispatcher:
+    return TaskDispatcher(deliver, FakeAutomation, journal=TaskJournal(path), **kwargs)
+
+
+def test_resume_pending_tasks(journal_path):
+    # 模拟崩溃前已入队（含正在发送）但未发送完成的任务
+    journal = TaskJournal(journal_path)
+    now = time.time()
+    for i, status in enumerate(("queued", "sending", "retrying", "sent")):
+        task = RobotTask("群A", f"消息{i}")
+        task_id = f"task-{i}"
+        journal.record(JournalEntry(
+            key=journal_key(task, task_id), task_id=task_id, task=task, status=status,
+            created_at=now + i, updated_at=now + i,
+        ))
+    journal.close()
+
+    dispatcher = new_dispatcher(journal_path)
+    dispatcher.start()
+    wait_idle(dispatcher)
+    dispatcher.close()
+
+    # 未结束的任务按入队顺序恢复，已发送的任务不会再次发送
+    assert FakeAutomation.sent == [("群A", "消息0"), ("群A", "消息1"), ("群A", "消息2")]
+    assert TaskJournal(journal_path).pending() == []
+
+
+def test_same_content_without_key_is_sent_again(journal_path):
+    dispatcher = new_dispatcher(journal_path)
+    result = dispatcher.submit([RobotTask("群A", "你好"), RobotTask("群A", "你好")])
+    wait_idle(dispatcher)
+    dispatcher.close()
+
+    assert len(set(result.task_ids)) == 2
+    assert result.deduplicated == []
+    assert FakeAutomation.sent == [("群A", "你好"), ("群A", "你好")]
+
+
+def test_deduplicate_by_idempotency_key_across_restart(journal_path):
+    dispatcher = new_dispatcher(journal_path)
+    first = dispatcher.submit([RobotTask("群A", "告警", idempotency_key="alert-1")])
+    wait_idle(dispatcher)
+    dispatcher.close()
+
+    # 重启后同一幂等键的任务（即使内容不同）返回原任务，不会再次发送
+    dispatcher = new_dispatcher(journal_path)
+    second = dispatcher.submit([
+        RobotTask("群A", "告警（重试）", idempotency_key="alert-1"),
+        RobotTask("群A", "告警", idempotency_key="alert-2"),
+    ])
+    wait_idle(dispatcher)
+    record = dispatcher.get(second.task_ids[0])
+    dispatcher.close()
+
+    assert second.task_ids[0] == first.task_ids[0]
+    assert second.deduplicated == [first.task_ids[0]]
+    assert record is not None and record.status == DispatchStatus.SENT
+    assert FakeAutomation.sent == [("群A", "告警"), ("群A", "告警")]
+
+
+def test_deduplicate_by_content_is_opt_in(journal_path):
+    dispatcher = new_dispatcher(journal_path, dedupe_by_content=True)
+    result = dispatcher.submit([RobotTask("群A", "你好"), RobotTask("群A", "你好"), RobotTask("群B", "你好")])
+    wait_idle(dispatcher)
+    dispatcher.close()
+
+    assert result.task_ids[0] == result.task_ids[1]
+    assert result.deduplicated == [result.task_ids[0]]
+    assert FakeAutomation.sent == [("群A", "你好"), ("群B", "你好")]